@@ -0,0 +1,181 @@
+"""
+Card counting: what a player can work out about the cards they can't see, kept up to date as the game is played
+
+A Beliefs subscribes to a game's events and keeps bitmasks (see masks.py) of the cards its player hasn't seen
+(which are somewhere in the other hands or the stock), the cards buried in the discard pile (which come back
+when it is recycled) and the cards the other players probably don't hold (they drew rather than play them).
+Every event only sets or clears a few bits, and every question is answered by counting the bits of a mask, so
+nothing is rescanned as the game goes on.
+
+Cards drawn by the other players aren't shown, so only cards drawn by the player themselves are seen (including
+the two picked up after a two). The other hands are treated as a random choice of the cards that could be in
+them: the cards they held when they drew rather than play come from the unseen cards, weighted against the ones
+they could have played (players may draw by choice), and the cards they have drawn since could be any unseen
+card. So the expected number of cards of a suit they hold is worked out from the shares of that suit.
+"""
+
+from cards import Suit, Rank
+from events import EventKind
+from masks import CHOOSABLE_SUITS, RANK_MASKS, SUIT_MASKS, mask_of
+from rules import Effect
+from strategies import Strategy
+
+# Effects that stop the next player from answering a card
+BLOCKING = (Effect.SKIP, Effect.PICKUP_2)
+
+# How likely a card is to be held, compared with other unseen cards, once a player drew rather than play it
+EXCLUDED_WEIGHT = 0.2
+
+# What one player knows about the cards they can't see in a game
+class Beliefs:
+    def __init__(self, game, player: int):
+        self.game = game
+        self.player = player
+        # Look at the table once, everything after comes from events
+        pack = mask_of(game.stock.cards) | mask_of(game.discard.cards)
+        for deck in game.decks:
+            pack |= mask_of(deck.cards)
+        # Cards the player hasn't seen (in another hand or the stock)
+        self.unseen = pack & ~mask_of(game.decks[player].cards) & ~mask_of(game.discard.cards)
+        # Cards in the discard pile under the top card, and the code of the top card
+        self.buried = mask_of(game.discard.cards) & ~(1 << game.discard.cards[-1].code)
+        self.top = game.discard.cards[-1].code
+        # Suit chosen by an eight on top of the discard pile (None if there isn't one)
+        self.suit = game.discard.suit
+        # Unseen cards the other players probably didn't have when they drew on their own turn, and how many cards
+        # they have drawn since they first did (which could be anything)
+        self.excluded = 0
+        self.drawn = 0
+        # Suit another player changed to with an eight, until they play a card of it or have to draw on it
+        self.claimed = None
+        self.unsubscribe = game.subscribe(
+            self.observe, EventKind.PLAYED, EventKind.DREW, EventKind.SUIT_CHANGED, EventKind.RECYCLED
+        )
+
+    # Update what is known from something that happened
+    def observe(self, event):
+        match event.kind:
+            case EventKind.PLAYED:
+                bit = 1 << event.card.code
+                self.buried |= 1 << self.top
+                self.top = event.card.code
+                self.suit = None
+                self.unseen &= ~bit
+                self.excluded &= ~bit
+                if event.player != self.player and self.claimed is event.card.suit:
+                    self.claimed = None
+            case EventKind.DREW:
+                if event.player == self.player:
+                    self.unseen &= ~(1 << event.card.code)
+                    return
+                if event.player == self.game.current_player:
+                    # They drew on their own turn (not after a two), so they probably had nothing they could play
+                    self.excluded |= self.unseen & self.game.rules.playable[self.top][self.top_suit().value]
+                    if self.claimed is self.top_suit():
+                        self.claimed = None
+                if self.excluded:
+                    self.drawn += 1
+                    if self.drawn >= self.hidden():
+                        # They may have drawn a whole new hand since, so nothing is known any more
+                        self.excluded = 0
+                        self.drawn = 0
+            case EventKind.SUIT_CHANGED:
+                self.suit = event.suit
+                if event.player != self.player:
+                    self.claimed = event.suit
+            case EventKind.RECYCLED:
+                # The buried cards go into the stock unseen
+                self.unseen |= self.buried
+                self.buried = 0
+
+    # Suit to match on the discard pile
+    def top_suit(self) -> Suit:
+        return self.suit or self.game.discard.cards[-1].suit
+
+    # Number of cards in the other players' hands
+    def hidden(self) -> int:
+        return sum(len(deck.cards) for deck in self.game.decks) - len(self.game.decks[self.player].cards)
+
+    # Expected number of the cards in a mask the other players hold between them
+    def expected(self, mask: int) -> float:
+        unseen = self.unseen
+        if not unseen:
+            return 0.0
+        hidden = self.hidden()
+        drawn = min(self.drawn, hidden)
+        # Cards drawn since they drew rather than play could be any unseen card
+        expected = drawn * (unseen & mask).bit_count() / unseen.bit_count()
+        # The rest are less likely to be cards they could have played
+        excluded = unseen & self.excluded
+        held = unseen & ~self.excluded
+        weight = held.bit_count() + EXCLUDED_WEIGHT * excluded.bit_count()
+        share = (held & mask).bit_count() + EXCLUDED_WEIGHT * (excluded & mask).bit_count()
+        return expected + (hidden - drawn) * share / weight
+
+    # Expected number of cards of each suit the other players hold (at least one of a suit they changed to)
+    def suit_likelihoods(self) -> dict:
+        likelihoods = {suit: self.expected(SUIT_MASKS[suit]) for suit in CHOOSABLE_SUITS}
+        if self.claimed in likelihoods:
+            likelihoods[self.claimed] = max(likelihoods[self.claimed], 1.0)
+        return likelihoods
+
+    # Stop following the game
+    def close(self):
+        self.unsubscribe()
+
+# Plays the card the other players are least likely to be able to answer, keeping eights and jokers for last,
+# and changes suit to one it holds and they probably don't
+class CountingPlayer(Strategy):
+    def __init__(self):
+        self.game = None
+        # Beliefs of each player this strategy plays for in the current game
+        self.beliefs = {}
+        # Wild cards under the rules of the current game
+        self.wild = 0
+
+    # Get the beliefs of the current player, following a new game when one is started
+    def current(self, game) -> Beliefs:
+        if game is not self.game:
+            self.close()
+            self.game = game
+            self.wild = 0
+            for name in game.rules.config["wild"]:
+                self.wild |= RANK_MASKS[Rank[name]]
+        player = game.current_player
+        if player not in self.beliefs:
+            self.beliefs[player] = Beliefs(game, player)
+        return self.beliefs[player]
+
+    # Get the index of the card to play (or None to pick up)
+    def choose_card(self, game) -> int:
+        beliefs = self.current(game)
+        rules = game.rules
+        hand = game.decks[game.current_player]
+        best, best_score = None, None
+        for card in hand.legal_moves(game.discard):
+            code = card.code
+            if (1 << code) & self.wild:
+                # Only when nothing else can be played
+                score = beliefs.hidden() + 1
+            elif rules.effects[code] in BLOCKING or rules.effects[code] is Effect.REVERSE and len(game.decks) == 2:
+                # They can't answer at all
+                score = -1
+            else:
+                score = beliefs.expected(rules.playable[code][card.suit.value])
+            if best_score is None or score < best_score:
+                best, best_score = card, score
+        return None if best is None else hand.cards.index(best)
+
+    # Get the suit to change to after playing an eight
+    def choose_suit(self, game) -> Suit:
+        beliefs = self.current(game)
+        count = game.decks[game.current_player].suit_counts()
+        likelihoods = beliefs.suit_likelihoods()
+        return max(CHOOSABLE_SUITS, key=lambda suit: count[suit] - likelihoods[suit])
+
+    # Stop following the current game
+    def close(self):
+        for beliefs in self.beliefs.values():
+            beliefs.close()
+        self.beliefs = {}
+        self.game = None
@@ -0,0 +1,246 @@
+"""
+Benchmarks of the hot paths of the engine, rules and rendering, checked against tracked baselines
+
+Run with `python -m benchmark` from the src folder. Rendering is only benchmarked when there is a display
+(use e.g. `xvfb-run python -m benchmark` on a headless machine).
+
+Timings swing a lot from run to run and machine to machine, so each sample of a benchmark is timed against a
+sample of a fixed reference workload taken right next to it, over several rounds, and the benchmark is scored by
+the median of these relative speeds. Baselines keep relative speeds, so they can be checked on any machine.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from itertools import cycle
+from cards import Card, Suit, Rank
+from deck import Deck, BitDeck
+from game import Game
+from simulate import play_out
+
+# Where the baselines are kept (next to the README)
+BASELINES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks.json")
+
+# A benchmark fails when its speed relative to the reference drops by more than this fraction of the baseline
+THRESHOLD = 0.25
+
+# Rounds each benchmark is run for
+ROUNDS = 5
+
+# Name of the reference workload every benchmark is compared with
+REFERENCE = "reference"
+
+# A fixed pure Python workload, timed alongside the benchmarks to measure how fast the machine is right now
+def reference_workload() -> int:
+    total = 0
+    for value in range(1000):
+        total += value * value % 7
+    return total
+
+# Number of calls of a function that take about a millisecond
+def batch_size(function) -> int:
+    started = time.perf_counter()
+    function()
+    return max(1, int(0.001 / max(time.perf_counter() - started, 1e-9)))
+
+# Time a function, returning the latency of each call (in seconds) over a number of samples
+# Each sample times a batch of calls, so very fast functions aren't swamped by the timer
+def measure(function, samples: int = 200, batch: int = None) -> list:
+    if batch is None:
+        batch = batch_size(function)
+    latencies = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        for _ in range(batch):
+            function()
+        latencies.append((time.perf_counter() - started) / batch)
+    return latencies
+
+# Time a function in samples alternating with samples of the reference workload, returning the latencies of the
+# function and of the reference, so every sample of the function sees the machine as the one before it did
+def measure_against_reference(function, samples: int) -> tuple:
+    batches = (batch_size(function), batch_size(reference_workload))
+    latencies = ([], [])
+    for _ in range(samples):
+        for found, timed, batch in zip(latencies, (function, reference_workload), batches):
+            found += measure(timed, 1, batch)
+    return latencies
+
+# Get a percentile of some latencies
+def percentile(latencies: list, fraction: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# Summarise the latencies of a benchmark (over every round)
+def summarise(latencies: list) -> dict:
+    return {
+        "per_second": len(latencies) / sum(latencies),
+        "p50": percentile(latencies, 0.5),
+        "p90": percentile(latencies, 0.9),
+        "p99": percentile(latencies, 0.99),
+    }
+
+# Benchmarks of the engine and rules (these don't need a display)
+def engine_benchmarks() -> dict:
+    discard = Deck([Card(Suit.SPADES, Rank.TEN)])
+    card = Card(Suit.HEARTS, Rank.NINE)
+    hand = Deck([Card(Suit.HEARTS, rank) for rank in list(Rank)[:7]] + [Card(Suit.CLUBS, Rank.TEN)])
+    bit_hand = BitDeck(list(hand.cards))
+    deck = Deck.full_deck(True)
+    # The same games are played every round
+    seeds = cycle(range(64))
+
+    # Play a whole seeded computer-vs-computer game
+    def playout():
+        game = Game(True, rng=random.Random(next(seeds)))
+        game.set_up()
+        play_out(game)
+
+    # Play a card and take it back, as a search would
+    game = Game(True, rng=random.Random(0))
+    game.set_up()
+
+    def look_ahead():
+        marker = game.snapshot()
+        game.play_card(0)
+        game.next_player()
+        game.restore(marker)
+
+    return {
+        "Deck.full_deck": lambda: Deck.full_deck(True),
+        "Deck.shuffle": deck.shuffle,
+        "Deck.can_add_to": lambda: discard.can_add_to(card),
+        "Deck.card_to_play": lambda: hand.card_to_play(discard),
+        "Deck.legal_moves": lambda: hand.legal_moves(discard),
+        "BitDeck.legal_moves": lambda: bit_hand.legal_moves(discard),
+        "Game playout": playout,
+        "Game snapshot/restore": look_ahead,
+        "Card.get_image_path": card.get_image_path,
+        "Card.get_image": card.get_image,
+    }
+
+# Benchmarks of rendering the UI (these need a display)
+def ui_benchmarks() -> dict:
+    from ui import UI
+    ui = UI(True)
+    ui.root.update()
+    hands = {
+        "small": Deck.full_deck(True).cards[:5],
+        "large": Deck.full_deck(True).cards[:40],
+    }
+    # Alternate between two hands of a size, so every render has something to do
+    # (whole hands are swapped in, so their bitsets match their cards and the right cards are dimmed)
+    def render(size: str):
+        cards = hands[size]
+        alternatives = [BitDeck(cards[1:]), BitDeck(cards[:-1])]
+        state = {"flip": False}
+
+        def run():
+            state["flip"] = not state["flip"]
+            ui.game.decks[0] = alternatives[state["flip"]]
+            ui.render_player()
+            ui.root.update_idletasks()
+        return run
+
+    return {
+        "UI.render_player (5 cards)": render("small"),
+        "UI.render_player (40 cards)": render("large"),
+        "UI.render_opponent": ui.render_opponent,
+        "UI.render_discard": ui.render_discard,
+    }
+
+# Run benchmarks (those whose name contains the filter) for some rounds, alternating their samples with samples
+# of the reference. Returns summaries with the calls per second of the fastest round, and the median of the speed
+# of each sample relative to the reference sample next to it
+def run(benchmarks: dict, samples: int, only: str = None, rounds: int = ROUNDS) -> dict:
+    chosen = {REFERENCE: reference_workload}
+    chosen.update((name, function) for name, function in benchmarks.items() if not only or only in name)
+    latencies = {name: [] for name in chosen}
+    speeds = {name: [] for name in chosen}
+    ratios = {name: [] for name in chosen}
+    for _ in range(rounds):
+        for name, function in chosen.items():
+            found, reference = measure_against_reference(function, samples)
+            latencies[name] += found
+            # Medians, so a few interrupted samples don't count
+            speeds[name].append(1 / percentile(found, 0.5))
+            ratios[name] += [against / latency for latency, against in zip(found, reference)]
+    results = {}
+    for name in chosen:
+        results[name] = summarise(latencies[name])
+        results[name]["per_second"] = max(speeds[name])
+        results[name]["relative"] = percentile(ratios[name], 0.5)
+    return results
+
+# Compare results with the baselines, returning the names of those that regressed
+# (benchmarks without a baseline aren't compared, see untracked)
+def regressions(results: dict, baselines: dict, threshold: float = THRESHOLD) -> list:
+    slower = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if name == REFERENCE or baseline is None:
+            continue
+        if result["relative"] < baseline["relative"] * (1 - threshold):
+            slower.append(name)
+    return slower
+
+# Get the names of benchmarks that have no baseline to be compared with
+def untracked(results: dict, baselines: dict) -> list:
+    return [name for name in results if name != REFERENCE and name not in baselines]
+
+# Format a latency for printing
+def show_time(seconds: float) -> str:
+    for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+# Command line entry point
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Benchmark the hot paths")
+    parser.add_argument("-n", "--samples", type=int, default=40, help="samples taken per benchmark each round")
+    parser.add_argument("-r", "--rounds", type=int, default=ROUNDS, help="rounds run (the median is kept)")
+    parser.add_argument("-k", "--only", default=None, help="only run benchmarks containing this text")
+    parser.add_argument("-t", "--threshold", type=float, default=THRESHOLD, help="allowed slowdown")
+    parser.add_argument("--save", action="store_true", help="record the results as the new baselines")
+    args = parser.parse_args(argv)
+
+    benchmarks = engine_benchmarks()
+    if os.environ.get("DISPLAY"):
+        benchmarks.update(ui_benchmarks())
+    else:
+        print("No display, skipping UI benchmarks")
+    results = run(benchmarks, args.samples, args.only, args.rounds)
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+    print(f"{'Benchmark':30} {'per second':>12} {'p50':>10} {'p90':>10} {'p99':>10} {'vs baseline':>12}")
+    for name, result in results.items():
+        change = ""
+        if name in baselines:
+            change = f"{result['relative'] / baselines[name]['relative'] - 1:+.1%}"
+        print(
+            f"{name:30} {result['per_second']:12.0f} {show_time(result['p50']):>10} "
+            f"{show_time(result['p90']):>10} {show_time(result['p99']):>10} {change:>12}"
+        )
+
+    if args.save:
+        baselines.update(results)
+        with open(BASELINES, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=4, sort_keys=True)
+        print(f"Saved baselines to {BASELINES}")
+        return 0
+    for name in untracked(results, baselines):
+        print(f"Skipped: {name} has no baseline to compare with (record one with --save)")
+    slower = regressions(results, baselines, args.threshold)
+    for name in slower:
+        print(f"Regression: {name} is more than {args.threshold:.0%} slower than its baseline")
+    return 1 if slower else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
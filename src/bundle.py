@@ -0,0 +1,133 @@
+"""
+Packs every card image into one indexed bundle file, which is memory-mapped when the game runs
+
+A bundle is a header, an index of (name, offset, length) and then the data of each file:
+
+    b"C8B\x01"  count: u32  then for each file:  name length: u16  name  offset: u32  length: u32
+
+Build it with `python -m bundle` from the src folder (run again whenever the assets change)
+"""
+
+import io
+import mmap
+import os
+import struct
+import sys
+from cards import ASSETS, CARDS
+
+# The first bytes of every bundle (the last is the format version)
+MAGIC = b"C8B\x01"
+
+# Where the bundle is built to and loaded from
+BUNDLE = os.path.join(ASSETS, "cards.bundle")
+
+# Pack the images in a folder into a bundle
+def build(folder: str = ASSETS, path: str = BUNDLE) -> int:
+    names = sorted(name for name in os.listdir(folder) if name.endswith((".png", ".svg")))
+    blobs = []
+    for name in names:
+        with open(os.path.join(folder, name), "rb") as f:
+            blobs.append(f.read())
+    # Work out where the data starts, then where each file goes
+    index_size = 4 + sum(2 + len(name.encode()) + 8 for name in names)
+    offset = len(MAGIC) + index_size
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(names)))
+        for name, blob in zip(names, blobs):
+            encoded = name.encode()
+            f.write(struct.pack("<H", len(encoded)) + encoded + struct.pack("<II", offset, len(blob)))
+            offset += len(blob)
+        for blob in blobs:
+            f.write(blob)
+    return len(names)
+
+# A read-only file over a memoryview, so decoders can read from the bundle without it being copied first
+class ViewFile(io.RawIOBase):
+    def __init__(self, view: memoryview):
+        self.view = view
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = min(len(buffer), len(self.view) - self.position)
+        buffer[:count] = self.view[self.position:self.position + count]
+        self.position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        match whence:
+            case io.SEEK_SET:
+                self.position = offset
+            case io.SEEK_CUR:
+                self.position += offset
+            case io.SEEK_END:
+                self.position = len(self.view) + offset
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+# A memory-mapped bundle
+class Bundle:
+    def __init__(self, path: str = BUNDLE):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self.map)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a card bundle")
+        # Read the index
+        self.index = {}
+        position = len(MAGIC)
+        (count,) = struct.unpack_from("<I", self.map, position)
+        position += 4
+        for _ in range(count):
+            (length,) = struct.unpack_from("<H", self.map, position)
+            name = bytes(self.data[position + 2:position + 2 + length]).decode()
+            position += 2 + length
+            self.index[name] = struct.unpack_from("<II", self.map, position)
+            position += 8
+        # Index the faces of the cards by code too
+        self.faces = [self.index.get(f"{card.stem}.png") for card in CARDS]
+
+    # Get the data of a file in the bundle, without copying it
+    def get(self, name: str) -> memoryview:
+        offset, length = self.index[name]
+        return self.data[offset:offset + length]
+
+    # Get the png of a card face by its code
+    def face(self, code: int) -> memoryview:
+        offset, length = self.faces[code]
+        return self.data[offset:offset + length]
+
+    # Open a file in the bundle for reading (e.g. by PIL)
+    def open(self, name: str) -> ViewFile:
+        return ViewFile(self.get(name))
+
+    # Check if a file is in the bundle
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    # Unmap the bundle (any views handed out must be released first)
+    def close(self):
+        self.data.release()
+        self.map.close()
+
+# The bundle shared by everything in this process (None if it hasn't been built)
+_shared = None
+
+# Get the shared bundle, mapping it the first time
+def load_bundle():
+    global _shared
+    if _shared is None and os.path.exists(BUNDLE):
+        _shared = Bundle(BUNDLE)
+    return _shared
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else BUNDLE
+    print(f"Packed {build(ASSETS, path)} images into {path}")
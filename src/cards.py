@@ -30,65 +30,64 @@ class Rank(Enum):
     KING = 13
     JOKER = 14
 
+# Single character codes used to name the card images
+SUIT_CODES = {
+    Suit.HEARTS: "H", Suit.DIAMONDS: "D", Suit.SPADES: "S", Suit.CLUBS: "C", Suit.JOKER: "J",
+}
+RANK_CODES = {
+    Rank.ACE: "A", Rank.TWO: "2", Rank.THREE: "3", Rank.FOUR: "4", Rank.FIVE: "5",
+    Rank.SIX: "6", Rank.SEVEN: "7", Rank.EIGHT: "8", Rank.NINE: "9", Rank.TEN: "T",
+    Rank.JACK: "J", Rank.QUEEN: "Q", Rank.KING: "K", Rank.JOKER: "1",
+}
+
+# Where the card images live (next to the src folder, wherever the game is run from)
+ASSETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+
+# Every card is given a small integer code: 0-51 for the standard cards, 52-53 for the jokers
+NUM_CARDS = 54
+
+# Work out the code of a card (jokers are the only cards of the joker suit, and there are two of them)
+def card_code(suit: Suit, rank: Rank, copy: int = 0) -> int:
+    if (suit is Suit.JOKER) != (rank is Rank.JOKER):
+        raise ValueError(f"there is no {rank.name.lower()} of {suit.name.lower()}")
+    if suit is Suit.JOKER:
+        if copy not in (0, 1):
+            raise ValueError(f"there are only two jokers, not joker {copy}")
+        return 52 + copy
+    return (suit.value - 1) * 13 + rank.value - 1
+
 # The card class
+# There is only ever one instance of each card (see CARDS), so cards can be compared by identity
 class Card:
-    # Cards are defined as having a suit and a rank
-    def __init__(self, suit: Suit, rank: Rank):
-        self.suit = suit
-        self.rank = rank
+    __slots__ = ("suit", "rank", "code", "stem")
+
+    # Cards are defined as having a suit and a rank (and jokers a copy, as there are two)
+    def __new__(cls, suit: Suit, rank: Rank, copy: int = 0):
+        return CARDS[card_code(suit, rank, copy)]
+
+    # Build the one and only instance of a card
+    def _intern(suit: Suit, rank: Rank, code: int, stem: str):
+        card = object.__new__(Card)
+        object.__setattr__(card, "suit", suit)
+        object.__setattr__(card, "rank", rank)
+        object.__setattr__(card, "code", code)
+        object.__setattr__(card, "stem", stem)
+        return card
+
+    # Cards are shared between every deck, so they mustn't be changed
+    def __setattr__(self, name, value):
+        raise AttributeError("cards are immutable")
 
     # Method to get the svg data representing this card
     def get_image_path(self) -> str:
-        # Calculate the suit component
-        match self.suit:
-            case Suit.HEARTS:
-                suit = "H"
-            case Suit.DIAMONDS:
-                suit = "D"
-            case Suit.SPADES:
-                suit = "S"
-            case Suit.CLUBS:
-                suit = "C"
-            case Suit.JOKER:
-                suit = "J"
-        # Calculate the rank component
-        match self.rank:
-            case Rank.ACE:
-                rank = "A"
-            case Rank.TWO:
-                rank = "2"
-            case Rank.THREE:
-                rank = "3"
-            case Rank.FOUR:
-                rank = "4"
-            case Rank.FIVE:
-                rank = "5"
-            case Rank.SIX:
-                rank = "6"
-            case Rank.SEVEN:
-                rank = "7"
-            case Rank.EIGHT:
-                rank = "8"
-            case Rank.NINE:
-                rank = "9"
-            case Rank.TEN:
-                rank = "T"
-            case Rank.JACK:
-                rank = "J"
-            case Rank.QUEEN:
-                rank = "Q"
-            case Rank.KING:
-                rank = "K"
-            case Rank.JOKER:
-                rank = "1"
-
-        # Build the path
-        path = f"assets/{rank}{suit}"
-        if "src" in os.getcwd():
-            path = "../" + path
-        return path
+        return f"{ASSETS}/{self.stem}"
 
     def get_image(self) -> str:
+        # Use the packed bundle of images if it has been built
+        from bundle import load_bundle
+        bundle = load_bundle()
+        if bundle is not None and f"{self.stem}.svg" in bundle:
+            return str(bundle.get(f"{self.stem}.svg"), "utf-8")
         path = self.get_image_path() + ".svg"
         # Read the data from the svg
         with open(path, "r", encoding="utf-8") as f:
@@ -101,6 +100,26 @@ class Card:
     def __str__(self):
         return f"{str(self.rank)[5:]} of {str(self.suit)[5:]}"
 
-    # Allow comparison of cards
-    def __eq__(self, other):
-        return self.rank == other.rank and self.suit == other.suit
+    # Cards are unique, so they can be hashed by their code
+    def __hash__(self):
+        return self.code
+
+    # Make sure cards stay unique when sent to other processes
+    def __reduce__(self):
+        return (from_code, (self.code,))
+
+# Get a card from its code
+def from_code(code: int) -> Card:
+    return CARDS[code]
+
+# Build every card once
+CARDS = [None] * NUM_CARDS
+for _suit in [Suit.HEARTS, Suit.DIAMONDS, Suit.SPADES, Suit.CLUBS]:
+    for _rank in Rank:
+        if _rank != Rank.JOKER:
+            _code = card_code(_suit, _rank)
+            CARDS[_code] = Card._intern(_suit, _rank, _code, RANK_CODES[_rank] + SUIT_CODES[_suit])
+# The jokers have their own images (1B is a blank card, not a joker)
+CARDS[52] = Card._intern(Suit.JOKER, Rank.JOKER, 52, "1J")
+CARDS[53] = Card._intern(Suit.JOKER, Rank.JOKER, 53, "2J")
+CARDS = tuple(CARDS)
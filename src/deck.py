@@ -3,40 +3,47 @@ This defines decks, a list of cards, used to represent player's hands and the st
 """
 
 from cards import Card, Suit, Rank
+from masks import CHOOSABLE_SUITS, SUIT_MASKS, PLAYABLE, mask_of, cards_in
 import random
+from collections import deque
+
+# The order cards appear in a freshly generated deck (jokers first, then each suit in turn)
+FULL_DECK = [Card(Suit.JOKER, Rank.JOKER, 0), Card(Suit.JOKER, Rank.JOKER, 1)] + [
+    Card(suit, rank)
+    for suit in [Suit.HEARTS, Suit.SPADES, Suit.DIAMONDS, Suit.CLUBS]
+    for rank in [
+        Rank.ACE, Rank.TWO, Rank.THREE, Rank.FOUR, Rank.FIVE, Rank.SIX, Rank.SEVEN,
+        Rank.EIGHT, Rank.NINE, Rank.TEN, Rank.JACK, Rank.QUEEN, Rank.KING
+    ]
+]
 
 # The deck class
 class Deck:
+    # Masks of the cards that can be played on each top card (see masks.PLAYABLE)
+    # A game with other rules gives its discard pile their masks instead (see rules.Rules)
+    playable_masks = PLAYABLE
+
     # By default, a deck is empty unless otherwise provided through arguments
     def __init__(self, cards=[]):
         self.cards = cards
+        # When this is the discard pile, an eight on top may have changed the suit to play
+        self.suit = None
 
     # Generate a full deck
     def full_deck(jokers: bool):
-        deck = Deck([])
-        # Add in jokers if applicable
+        # Cards are shared, so only the list needs building
         if jokers:
-            deck.push(Card(Suit.JOKER, Rank.JOKER))
-            deck.push(Card(Suit.JOKER, Rank.JOKER))
-        # Add other cards
-        suits = [Suit.HEARTS, Suit.SPADES, Suit.DIAMONDS, Suit.CLUBS]
-        ranks = [
-            Rank.ACE, Rank.TWO, Rank.THREE, Rank.FOUR, Rank.FIVE, Rank.SIX, Rank.SEVEN,
-            Rank.EIGHT, Rank.NINE, Rank.TEN, Rank.JACK, Rank.QUEEN, Rank.KING
-        ]
-        for suit in suits:
-            for rank in ranks:
-                deck.push(Card(suit, rank))
-        # Ready to go
-        return deck
-
-    # Shuffle a deck
-    def shuffle(self):
-        random.shuffle(self.cards)
+            return Deck(FULL_DECK[:])
+        return Deck(FULL_DECK[2:])
+
+    # Shuffle a deck (with the global random generator unless one is given)
+    def shuffle(self, rng=random):
+        rng.shuffle(self.cards)
 
     # Method to add a card
     def push(self, card_to_add: Card):
         self.cards.append(card_to_add)
+        self.suit = None
 
     # Method to remove a card from the deck
     def remove(self, idx: int) -> Card:
@@ -48,20 +55,30 @@ class Deck:
     def pop(self):
         return self.cards.pop()
 
+    # Method to put a card back at an index (undoing remove)
+    def insert(self, idx: int, card_to_add: Card):
+        self.cards.insert(idx, card_to_add)
+
     # Method to get the card at the top of the deck
     def peek(self) -> Card:
         return self.cards[len(self.cards) - 1]
 
+    # Get the suit that must be matched, taking into account any suit change from an eight
+    def top_suit(self) -> Suit:
+        return self.suit or self.cards[-1].suit
+
+    # Get the card at the top of the deck as it is displayed (an eight shows the suit it changed to)
+    def top(self) -> Card:
+        top_card = self.cards[-1]
+        if self.suit is None:
+            return top_card
+        return Card(self.suit, top_card.rank)
+
     # Assuming this is the discard pile, work out if a card can be added
+    # (by default eights and jokers can always be played, otherwise the rank or suit must match)
     def can_add_to(self, card_to_check: Card) -> bool:
-        top_card = self.peek()
-        # Check various conditions (not the most efficient - but the code is clean)
-        is_eight = card_to_check.rank == Rank.EIGHT
-        is_joker = card_to_check.rank == Rank.JOKER or top_card.rank == Rank.JOKER
-        common_rank = card_to_check.rank == top_card.rank
-        common_suit = card_to_check.suit == top_card.suit
-        # Work out if any condition is met
-        return is_eight or is_joker or common_rank or common_suit
+        top_card = self.cards[-1]
+        return self.playable_masks[top_card.code][(self.suit or top_card.suit).value] >> card_to_check.code & 1 == 1
 
     # Assuming this is a player's hand, get the index of a valid card to play
     def card_to_play(self, discard_pile) -> int:
@@ -71,6 +88,18 @@ class Deck:
         # No cards are valid, represent this state as None
         return None
 
+    # Assuming this is a player's hand, get every card that can be played (in the order they are held)
+    def legal_moves(self, discard_pile) -> list:
+        return [card for card in self.cards if discard_pile.can_add_to(card)]
+
+    # Count how many cards of each (choosable) suit are in the deck
+    def suit_counts(self) -> dict:
+        count = {suit: 0 for suit in CHOOSABLE_SUITS}
+        for card in self.cards:
+            if card.suit in count:
+                count[card.suit] += 1
+        return count
+
     # Nice printing of decks
     def __str__(self):
         result = ""
@@ -78,15 +107,87 @@ class Deck:
             result += f"[{card}] "
         return result
 
-    # Allow comparison of decks
+    # Allow comparison of decks (cards are unique, so this is mostly identity checks)
     def __eq__(self, other):
-        # Discrepancy based on length
-        if len(self.cards) != len(other.cards):
-            return False
-        # Discrepancy based on contents
-        for ours, theirs in zip(self.cards, other.cards):
-            if ours != theirs:
-                return False
-        # Passed all checks, these decks are identical
-        return True
+        return self.cards == other.cards
+
+# A pile of cards (the stock or discard pile) backed by a deque,
+# so cards can be added to and taken from either end in O(1)
+class Pile(Deck):
+    def __init__(self, cards=()):
+        super().__init__(deque(cards))
+
+    # Shuffle the pile (with the global random generator unless one is given)
+    def shuffle(self, rng=random):
+        cards = list(self.cards)
+        rng.shuffle(cards)
+        self.cards = deque(cards)
+
+    # Method to add a card to the bottom of the pile
+    def push_bottom(self, card_to_add: Card):
+        self.cards.appendleft(card_to_add)
+
+    # Method to remove a card from the bottom of the pile and return it
+    def pop_bottom(self) -> Card:
+        return self.cards.popleft()
+
+    # Allow comparison of piles with decks
+    def __eq__(self, other):
+        return list(self.cards) == list(other.cards)
+
+# A deck that also keeps a bitset of the cards it holds (one bit per card code), updated in O(1) as cards come and go
+# Legal plays are found with a single AND against the precomputed playable masks, which are the union of the
+# suit, rank and eights/jokers buckets of the top card, so the hand is only scanned to find where a card is
+class BitDeck(Deck):
+    def __init__(self, cards=[]):
+        super().__init__(cards)
+        self.mask = mask_of(cards)
+
+    # Method to add a card
+    def push(self, card_to_add: Card):
+        self.cards.append(card_to_add)
+        self.suit = None
+        self.mask |= 1 << card_to_add.code
+
+    # Method to remove a card from the deck
+    def remove(self, idx: int) -> Card:
+        card = self.cards.pop(idx)
+        self.mask &= ~(1 << card.code)
+        return card
+
+    # Method to remove a card from the deck and return it
+    def pop(self):
+        card = self.cards.pop()
+        self.mask &= ~(1 << card.code)
+        return card
+
+    # Method to put a card back at an index (undoing remove)
+    def insert(self, idx: int, card_to_add: Card):
+        self.cards.insert(idx, card_to_add)
+        self.mask |= 1 << card_to_add.code
+
+    # Assuming this is a player's hand, get the mask of every card that can be played
+    def playable(self, discard_pile) -> int:
+        return self.mask & discard_pile.playable_masks[discard_pile.cards[-1].code][discard_pile.top_suit().value]
+
+    # Assuming this is a player's hand, get every card that can be played (lowest code first)
+    def legal_moves(self, discard_pile) -> list:
+        return list(cards_in(self.playable(discard_pile)))
+
+    # Assuming this is a player's hand, count how many cards can be played
+    def legal_count(self, discard_pile) -> int:
+        return self.playable(discard_pile).bit_count()
+
+    # Assuming this is a player's hand, get the index of a valid card to play
+    # Picks the first playable card in the hand (as Deck does), only scanning when there is one
+    def card_to_play(self, discard_pile) -> int:
+        playable = self.playable(discard_pile)
+        if not playable:
+            return None
+        for index, card in enumerate(self.cards):
+            if playable >> card.code & 1:
+                return index
 
+    # Count how many cards of each (choosable) suit are in the deck
+    def suit_counts(self) -> dict:
+        return {suit: (self.mask & SUIT_MASKS[suit]).bit_count() for suit in CHOOSABLE_SUITS}
@@ -0,0 +1,356 @@
+"""
+An exact solver for the end of a game, used by the computer once few enough cards are hidden
+
+Positions are searched with alpha-beta over the players' moves and expectimax over the cards they draw,
+with a transposition table shared between searches. The opponent's hand is hidden, so each move is scored
+by averaging over every hand the opponent could be holding (each solved as if both hands were shown).
+Once the stock has been recycled without a reshuffle the order of the stock is known, and so is the
+opponent's hand, making the result exact.
+
+Values are the chance that the player being solved for wins, games still going at the horizon count as
+half a win (like a drawn simulation).
+"""
+
+import math
+import time
+from itertools import combinations
+from cards import Rank, CARDS
+from masks import CHOOSABLE_SUITS, PLAYABLE
+from mcts import DRAW, SUIT_OF, RANK_OF, InfoSet, codes_in
+from strategies import Strategy
+
+# How a stored value relates to the real value of a position
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Depth given to values that didn't depend on the horizon
+COMPLETE = 1 << 30
+
+# Raised when a search runs out of nodes or time
+class OutOfBudget(Exception):
+    pass
+
+# Order moves so the likely best are searched first: going out, then extra turns, twos, other cards, eights
+def move_order(hand: int, move) -> int:
+    code, _ = move
+    if code < 0:
+        return 5
+    if hand == 1 << code:
+        return 0
+    rank = RANK_OF[code]
+    if rank is Rank.ACE or rank is Rank.JOKER:
+        return 1
+    if rank is Rank.TWO:
+        return 2
+    if rank is Rank.EIGHT:
+        return 4
+    return 3
+
+# Searches positions of the form (hands, stock, discard, top, suit, player), where the stock is either a
+# mask of cards drawn in an unknown order or a tuple of codes drawn from the end, and 0 when empty
+class Solver:
+    def __init__(self, max_nodes: int = 100000, budget: float = 0.25, horizon: int = 20, reshuffle: bool = False,
+                 max_positions: int = 1 << 20):
+        self.max_nodes = max_nodes
+        self.budget = budget
+        self.horizon = horizon
+        # Whether the discard pile is shuffled when it is recycled (see Game.reshuffle)
+        self.reshuffle = reshuffle
+        # Position -> (depth, bound, value, best move), emptied once it holds max_positions
+        self.table = {}
+        self.max_positions = max_positions
+        # The player values are worked out for
+        self.player = 0
+        self.deadline = None
+        self.budget_nodes = 0
+        # Counters
+        self.nodes = 0
+        self.probes = 0
+        self.hits = 0
+        self.seconds = 0.0
+        self.horizons = 0
+        self.solves = 0
+        self.failed = 0
+
+    # Get the legal moves of the player to move (eights are one move per suit they can change to)
+    def moves(self, hand: int, top: int, suit: int) -> list:
+        playable = hand & PLAYABLE[top][suit]
+        if not playable:
+            return [DRAW]
+        moves = []
+        for code in codes_in(playable):
+            if RANK_OF[code] is Rank.EIGHT:
+                moves.extend((code, choice.value) for choice in CHOOSABLE_SUITS)
+            else:
+                moves.append((code, 0))
+        moves.sort(key=lambda move: move_order(hand, move))
+        return moves
+
+    # Every way a player could pick up some cards, as {(hands, stock, discard): probability}
+    def draws(self, hands: tuple, stock, discard: tuple, player: int, count: int) -> dict:
+        outcomes = {(hands, stock, discard): 1.0}
+        for _ in range(count):
+            following = {}
+            for (hands, stock, discard), chance in outcomes.items():
+                if stock == 0:
+                    if not discard:
+                        # Every card is in a player's hand
+                        following[(hands, stock, discard)] = following.get((hands, stock, discard), 0.0) + chance
+                        continue
+                    # Recycle the discard pile (the card at the bottom is drawn first, like Game.recycle)
+                    if self.reshuffle:
+                        stock = sum(1 << code for code in discard)
+                    else:
+                        stock = discard[::-1]
+                    discard = ()
+                if type(stock) is tuple:
+                    code = stock[-1]
+                    drawn = [(code, stock[:-1] or 0, 1.0)]
+                else:
+                    share = 1.0 / stock.bit_count()
+                    drawn = [(code, stock & ~(1 << code), share) for code in codes_in(stock)]
+                for code, rest, share in drawn:
+                    held = list(hands)
+                    held[player] |= 1 << code
+                    key = (tuple(held), rest, discard)
+                    following[key] = following.get(key, 0.0) + chance * share
+            outcomes = following
+        return outcomes
+
+    # Work out the positions a move can lead to, as a list of (probability, position)
+    def results(self, position: tuple, move) -> list:
+        hands, stock, discard, top, suit, player = position
+        code, chosen = move
+        if code < 0:
+            outcomes = self.draws(hands, stock, discard, player, 1)
+            return [
+                (chance, (hands, stock, discard, top, suit, player ^ 1))
+                for (hands, stock, discard), chance in outcomes.items()
+            ]
+        held = list(hands)
+        held[player] &= ~(1 << code)
+        hands = tuple(held)
+        discard = discard + (top,)
+        suit = chosen or SUIT_OF[code]
+        rank = RANK_OF[code]
+        # Aces and jokers skip the next player
+        following = player if rank is Rank.ACE or rank is Rank.JOKER else player ^ 1
+        if rank is Rank.TWO and hands[player]:
+            outcomes = self.draws(hands, stock, discard, player ^ 1, 2)
+            return [
+                (chance, (hands, stock, discard, code, suit, following))
+                for (hands, stock, discard), chance in outcomes.items()
+            ]
+        return [(1.0, (hands, stock, discard, code, suit, following))]
+
+    # Score a move, with Star1 cutoffs over the cards that could be drawn
+    def move_value(self, position: tuple, move, depth: int, alpha: float, beta: float) -> float:
+        outcomes = self.results(position, move)
+        if len(outcomes) == 1:
+            return self.value(outcomes[0][1], depth - 1, alpha, beta)
+        total = 0.0
+        remaining = 1.0
+        for chance, following in outcomes:
+            total += chance * self.value(following, depth - 1, 0.0, 1.0)
+            remaining -= chance
+            if total + remaining <= alpha:
+                return total + remaining
+            if total >= beta:
+                return total
+        return total
+
+    # Get the value of a position (searching within the window alpha, beta)
+    def value(self, position: tuple, depth: int, alpha: float, beta: float) -> float:
+        hands, _, _, top, suit, player = position
+        if hands[self.player] == 0:
+            return 1.0
+        if hands[self.player ^ 1] == 0:
+            return 0.0
+        if depth <= 0:
+            self.horizons += 1
+            return 0.5
+        self.nodes += 1
+        if self.nodes >= self.budget_nodes or (self.nodes & 1023 == 0 and time.perf_counter() > self.deadline):
+            raise OutOfBudget()
+
+        # Look the position up
+        self.probes += 1
+        entry = self.table.get(position)
+        best_move = None
+        if entry is not None:
+            stored_depth, bound, stored, best_move = entry
+            if stored_depth >= depth:
+                if bound == EXACT or (bound == LOWER and stored >= beta) or (bound == UPPER and stored <= alpha):
+                    self.hits += 1
+                    return stored
+
+        horizons = self.horizons
+        moves = self.moves(hands[player], top, suit)
+        if best_move in moves:
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+        maximising = player == self.player
+        low, high = alpha, beta
+        best = -1.0 if maximising else 2.0
+        for move in moves:
+            score = self.move_value(position, move, depth, low, high)
+            if maximising and score > best:
+                best, best_move = score, move
+                low = max(low, score)
+            elif not maximising and score < best:
+                best, best_move = score, move
+                high = min(high, score)
+            if low >= high:
+                break
+
+        # Values that never reached the horizon hold at any depth
+        stored_depth = depth if self.horizons > horizons else COMPLETE
+        bound = UPPER if best <= alpha else LOWER if best >= beta else EXACT
+        self.table[position] = (stored_depth, bound, best, best_move)
+        return best
+
+    # Score every move of the player to move, averaged over a list of (weight, position) they could be in
+    # Returns None if the budget runs out first
+    def solve(self, positions: list) -> dict:
+        started = time.perf_counter()
+        self.deadline = started + self.budget
+        self.budget_nodes = self.nodes + self.max_nodes
+        if len(self.table) >= self.max_positions:
+            self.table.clear()
+        self.solves += 1
+        scores = {}
+        try:
+            for weight, position in positions:
+                hands, _, _, top, suit, player = position
+                if player != self.player:
+                    # Stored values are for the other player
+                    self.table.clear()
+                    self.player = player
+                for move in self.moves(hands[player], top, suit):
+                    score = self.move_value(position, move, self.horizon, 0.0, 1.0)
+                    scores[move] = scores.get(move, 0.0) + weight * score
+        except OutOfBudget:
+            self.failed += 1
+            return None
+        finally:
+            self.seconds += time.perf_counter() - started
+        return scores
+
+    # Forget every stored position
+    def clear(self):
+        self.table.clear()
+
+    # Get the counters of the solver
+    def stats(self) -> dict:
+        return {
+            "nodes": self.nodes,
+            "seconds": self.seconds,
+            "nodes_per_second": self.nodes / self.seconds if self.seconds else 0.0,
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.probes if self.probes else 0.0,
+            "positions": len(self.table),
+            "solves": self.solves,
+            "failed": self.failed,
+        }
+
+# Get every position the current player of a game could be in, as a list of (weight, position)
+def positions(game) -> list:
+    info = InfoSet(game)
+    hand = info.hand
+    discard = tuple(info.discard)
+    # After a recycle without a reshuffle, the order of the stock is known to anyone watching
+    stock = tuple(card.code for card in game.stock.cards)
+    known = game.recycles > 0 and not game.reshuffle
+    if known or not stock:
+        deals = [tuple(code for code in info.unseen if code not in stock)]
+    else:
+        deals = combinations(info.unseen, info.opponent_cards)
+    found = []
+    for opponent in deals:
+        hands = [0, 0]
+        hands[info.player] = hand
+        hands[info.player ^ 1] = sum(1 << code for code in opponent)
+        if known:
+            rest = stock or 0
+        else:
+            rest = sum(1 << code for code in info.unseen) & ~hands[info.player ^ 1]
+        found.append((tuple(hands), rest, discard, info.top, info.suit, info.player))
+    return [(1.0 / len(found), position) for position in found]
+
+# Count the cards whose place the current player of a game doesn't know, and the hands the opponent could have
+def hidden(game) -> tuple:
+    opponent = len(game.decks[game.current_player ^ 1].cards)
+    if game.recycles > 0 and not game.reshuffle or not game.stock.cards:
+        # Everything not in the stock or discard pile is in the opponent's hand
+        return 0, 1
+    stock = len(game.stock.cards)
+    return opponent + stock, math.comb(opponent + stock, opponent)
+
+# A computer player that solves the end of the game and plays like the built in computer until then
+class EndgamePlayer(Strategy):
+    # Solve once at most max_unseen cards are hidden (in the opponent's hand and an unknown stock), there are at
+    # most max_deals hands the opponent could have and the hands hold at most max_cards between them,
+    # falling back to another strategy before then
+    def __init__(self, max_unseen: int = 6, max_deals: int = 60, max_cards: int = 12, max_nodes: int = 100000,
+                 budget: float = 0.25, fallback=None):
+        self.max_unseen = max_unseen
+        self.max_cards = max_cards
+        self.max_deals = max_deals
+        self.fallback = fallback
+        self.solver = Solver(max_nodes, budget)
+        # Suit picked by the last solve, used when the eight it chose is handled
+        self.pending_suit = None
+
+    # Check if a game is near enough to its end to solve (the search only knows the standard two player rules)
+    def can_solve(self, game) -> bool:
+        if not game.rules.standard_play:
+            return False
+        unseen, deals = hidden(game)
+        cards = len(game.decks[0].cards) + len(game.decks[1].cards)
+        return unseen <= self.max_unseen and deals <= self.max_deals and cards <= self.max_cards
+
+    # Solve for the best move of the current player, or None if the game can't be solved in budget
+    def best_move(self, game):
+        if not self.can_solve(game):
+            return None
+        if self.solver.reshuffle != game.reshuffle:
+            self.solver.clear()
+            self.solver.reshuffle = game.reshuffle
+        scores = self.solver.solve(positions(game))
+        if not scores:
+            return None
+        return max(scores, key=scores.get)
+
+    # Get the index of the card to play (or None to pick up)
+    def choose_card(self, game) -> int:
+        self.pending_suit = None
+        move = self.best_move(game)
+        hand = game.decks[game.current_player]
+        if move is None:
+            if self.fallback is not None:
+                return self.fallback.choose_card(game)
+            return hand.card_to_play(game.discard)
+        code, suit = move
+        if code < 0:
+            return None
+        self.pending_suit = suit or None
+        return hand.cards.index(CARDS[code])
+
+    # Get the suit to change to after playing an eight
+    def choose_suit(self, game):
+        suit = self.pending_suit
+        self.pending_suit = None
+        if suit is not None:
+            return next(choice for choice in CHOOSABLE_SUITS if choice.value == suit)
+        if self.fallback is not None:
+            return self.fallback.choose_suit(game)
+        return super().choose_suit(game)
+
+    # Free anything held by the fallback strategy
+    def close(self):
+        if self.fallback is not None:
+            self.fallback.close()
+
+    # Get the counters of the solver
+    def stats(self) -> dict:
+        return self.solver.stats()
@@ -0,0 +1,110 @@
+"""
+Typed events emitted as a game is played, and a scheduler that paces the computer's turns
+
+Subscribe to a game with `game.subscribe(callback, EventKind.PLAYED, EventKind.DREW)` (or no kinds for every
+event), and the callback is given an Event each time one happens. Nothing is emitted until something subscribes.
+
+The scheduler takes the computer's turns once the player before them is done: straight away (INSTANT, for
+headless play), after some thinking time (ANIMATED) or as fast as the event loop allows (FAST_FORWARD, for
+computer-vs-computer demos). Waiting for a person is just not scheduling anything, so nothing has to poll.
+"""
+
+import random
+from enum import Enum
+
+# Kinds of event, and what the player (and card or suit) of each one are
+class EventKind(Enum):
+    # The player played the card
+    PLAYED = 1
+    # The player drew the card from the stock
+    DREW = 2
+    # The player changed the suit to match to the suit
+    SUIT_CHANGED = 3
+    # The player's go was skipped
+    SKIPPED = 4
+    # The player reversed the direction of play
+    REVERSED = 5
+    # The discard pile was recycled into the stock (on the player's turn)
+    RECYCLED = 6
+    # It is now the player's turn
+    NEXT_PLAYER = 7
+    # The player has won
+    GAME_OVER = 8
+
+# Something that happened in a game
+class Event:
+    __slots__ = ("kind", "player", "card", "suit")
+
+    def __init__(self, kind: EventKind, player: int, card=None, suit=None):
+        self.kind = kind
+        self.player = player
+        self.card = card
+        self.suit = suit
+
+    # Nice printing of events
+    def __repr__(self):
+        details = "".join(f", {value}" for value in (self.card, self.suit) if value is not None)
+        return f"Event({self.kind.name}, {self.player}{details})"
+
+# How quickly the computer takes its turns
+class Pace(Enum):
+    INSTANT = 1
+    ANIMATED = 2
+    FAST_FORWARD = 3
+
+# Names of the paces, for command lines
+PACES = {pace.name.lower().replace("_", "-"): pace for pace in Pace}
+
+# Takes the computer's turns of a game at a pace
+class Scheduler:
+    # is_computer tells if a player's turns are taken by the computer
+    # after(milliseconds, callback) runs a callback later on an event loop (e.g. Tk's root.after), and is only
+    # needed when turns aren't instant. Animated turns take between delay[0] and delay[1] milliseconds
+    def __init__(self, game, is_computer, pace: Pace = Pace.INSTANT, after=None, delay=(2000, 3000), rng=None):
+        if pace is not Pace.INSTANT and after is None:
+            raise ValueError(f"{pace.name} turns need an event loop to be scheduled on")
+        self.game = game
+        self.is_computer = is_computer
+        self.pace = pace
+        self.after = after
+        self.delay = delay
+        self.rng = rng or random
+        # Stopped schedulers ignore turns that were already scheduled (e.g. when a new game is started)
+        self.stopped = False
+
+    # Hand the turn on once the current player is done with it
+    def end_turn(self):
+        if self.stopped or self.game.finished():
+            return
+        self.game.next_player()
+        self.resume()
+
+    # Start taking the computer's turns, if it is the computer's go
+    def resume(self):
+        game = self.game
+        if self.pace is Pace.INSTANT:
+            while not self.stopped and not game.finished() and self.is_computer(game.current_player):
+                self.take_turn()
+                game.next_player()
+            return
+        if not self.stopped and not game.finished() and self.is_computer(game.current_player):
+            # Fast forwarding still waits a millisecond, so the event loop gets to redraw between turns
+            wait = self.rng.randint(*self.delay) if self.pace is Pace.ANIMATED else 1
+            self.after(wait, self.scheduled_turn)
+
+    # Take a turn that was scheduled on the event loop (unless the scheduler has since been stopped)
+    def scheduled_turn(self):
+        if self.stopped:
+            return
+        self.take_turn()
+        self.end_turn()
+
+    # Take the computer's turn
+    def take_turn(self):
+        game = self.game
+        if game.computer_turn():
+            game.handle_special_card_computer(game.discard.peek())
+
+    # Stop taking turns
+    def stop(self):
+        self.stopped = True
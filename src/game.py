@@ -2,33 +2,88 @@
 Defines the structure and behaviour of the game
 """
 
-from cards import Card, Suit, Rank
-from deck import Deck
+from cards import Card, Suit, Rank, CARDS
+from deck import Deck, BitDeck, Pile
+import random
+from collections import deque
+from enum import Enum
+from masks import CHOOSABLE_SUITS, PLAYABLE
+from rules import Effect, Rules, STANDARD_RULES
+from events import Event, EventKind
+from zobrist import HAND_KEYS, STOCK_KEYS, DISCARD_KEYS, TOP_KEYS, SUIT_KEYS, PLAYER_KEYS, REVERSED_KEY
+
+# Kinds of change recorded in the undo journal
+class Change(Enum):
+    PLAYED = 1
+    SUIT_CHANGED = 2
+    DREW = 3
+    RECYCLED = 4
+    NEXT_PLAYER = 5
+    REVERSED = 6
 
 # The game class
 class Game:
-    def __init__(self, jokers: bool):
-        # Games will default to having two players (for now)
+    def __init__(self, jokers: bool, bitset: bool = False, reshuffle: bool = False, rng=None, log=None,
+                 rules: Rules = None):
+        # Rules default to the standard ones (two players, five cards each), see rules.py for variants
+        self.rules = rules or STANDARD_RULES
         self.current_player = 0
+        # Play moves up through the players (or down once reversed)
+        self.direction = 1
         # The deck at index 0 is the human's deck
-        self.decks = [
-            Deck([]),
-            Deck([]),
-        ]
+        # Hands can optionally be backed by bitsets for faster legal move lookup
+        hand = BitDeck if bitset else Deck
+        self.decks = [hand([]) for _ in range(self.rules.players)]
         # Set up the discard and stock piles
-        self.stock = Deck.full_deck(jokers)
-        self.discard = Deck([])
+        self.stock = Pile(Deck.full_deck(jokers).cards)
+        self.discard = Pile()
+        if self.rules.playable is not PLAYABLE:
+            self.discard.playable_masks = self.rules.playable
+        # When the stock runs out the discard pile is put underneath it, optionally shuffled first
+        self.reshuffle = reshuffle
+        self.recycles = 0
+        # Number of cards with an effect (eights, twos, aces, jokers by default) played so far
+        self.specials = 0
+        # Computer players can be given a strategy (see strategies.Strategy)
+        # None uses the built in one: the first valid card, then the suit held the most of
+        self.strategies = [None] * self.rules.players
+        # Randomness comes from this generator (e.g. a seeded random.Random), the global one by default
+        self.rng = rng or random
+        # Everything that happens can be recorded to a gamelog.GameLog
+        self.log = log
+        # Callbacks subscribed to each kind of event (None until something subscribes, see events.py)
+        self.listeners = None
+        # Zobrist hash of the position (see zobrist.py), None until rehash is first called
+        # From then on every move of the game keeps it up to date (call rehash again after changing the piles directly)
+        self.hash = None
+        # Once a snapshot is taken every change is journalled, so it can be undone (None when not recording)
+        self.journal = None
 
     # Set up the game
     def set_up(self):
         # Shuffle the deck
-        self.stock.shuffle()
-        # Deal each player 5 cards
+        self.stock.shuffle(self.rng)
+        self.deal()
+
+    # Deal out the stock pile
+    def deal(self):
+        if self.log is not None:
+            self.log.deal(self.stock.cards)
+        # Deal each player their cards (5 by default)
         for deck in self.decks:
-            for _ in range(5):
+            for _ in range(self.rules.hand_size):
                 deck.push(self.stock.pop())
         # Create the discard pile
         self.discard.push(self.stock.pop())
+        if self.hash is not None:
+            self.rehash()
+
+    # Get the player who has won (None if the game isn't over)
+    def winner(self):
+        for player, deck in enumerate(self.decks):
+            if len(deck.cards) == 0:
+                return player
+        return None
 
     # Check for finishing conditions
     def finished(self) -> bool:
@@ -40,70 +95,331 @@ class Game:
     def computer_turn(self) -> bool:
         player_deck = self.decks[self.current_player]
         # Get valid selection
-        play_this = player_deck.card_to_play(self.discard)
+        strategy = self.strategies[self.current_player]
+        if strategy is None:
+            play_this = player_deck.card_to_play(self.discard)
+        else:
+            play_this = strategy.choose_card(self)
         if play_this is None:
             # No valid cards left to play, pick up
-            new_card = self.stock.pop()
-            player_deck.push(new_card)
+            self.draw(player_deck)
         else:
             # Valid card at play_this, play it
-            choice = self.decks[self.current_player].remove(play_this)
-            self.discard.push(choice)
+            self.play_card(play_this)
         return play_this is not None
 
+    # Play the card at an index of the current player's deck onto the discard pile
+    def play_card(self, index: int) -> Card:
+        card = self.decks[self.current_player].remove(index)
+        code = card.code
+        if self.rules.effects[code] is not Effect.NONE:
+            self.specials += 1
+        discard = self.discard
+        if self.journal is not None:
+            self.journal.append((Change.PLAYED, self.current_player, index, discard.suit))
+        if self.hash is not None:
+            # The card moves to the top of the discard pile, and any suit chosen by an eight is forgotten
+            self.hash ^= (
+                HAND_KEYS[self.current_player][code] ^ DISCARD_KEYS[code] ^ TOP_KEYS[code]
+                ^ TOP_KEYS[discard.cards[-1].code] ^ SUIT_KEYS[discard.suit]
+            )
+        discard.push(card)
+        if self.log is not None:
+            self.log.play(card)
+        if self.listeners is not None:
+            self.emit(EventKind.PLAYED, self.current_player, card)
+            if len(self.decks[self.current_player].cards) == 0:
+                self.emit(EventKind.GAME_OVER, self.current_player)
+        return card
+
+    # Change the suit that must be played (after an eight)
+    def change_suit(self, suit: Suit):
+        if self.journal is not None:
+            self.journal.append((Change.SUIT_CHANGED, self.discard.suit))
+        if self.hash is not None:
+            self.hash ^= SUIT_KEYS[self.discard.suit] ^ SUIT_KEYS[suit]
+        self.discard.suit = suit
+        if self.log is not None:
+            self.log.suit(suit)
+        if self.listeners is not None:
+            self.emit(EventKind.SUIT_CHANGED, self.current_player, suit=suit)
+
+    # Carry out the effect of a card that has just been played (the same for the player and the computer)
+    # The effect is looked up in the compiled rules, choose_suit is called if a suit must be chosen
+    def handle_special_card(self, card: Card, choose_suit):
+        effect = self.rules.effects[card.code]
+        if effect is Effect.CHANGE_SUIT:
+            choose_suit()
+        elif effect is not Effect.NONE:
+            self.handlers[effect](self)
+
     # Handle special cards (for the computer player)
     def handle_special_card_computer(self, card: Card):
-        match card.rank:
-            case Rank.EIGHT:
-                # Handle 8 card
-                self.change_suit_computer()
-            case Rank.TWO:
-                # Handle 2 card
-                self.pickup_2()
-            case Rank.ACE:
-                # Handle ace card
-                self.skip_go()
-            case Rank.JOKER:
-                # Handle joker card
-                self.skip_go()
+        self.handle_special_card(card, self.change_suit_computer)
 
     # Allow the player to change the suit
     def change_suit_computer(self):
-        # Strategy: select the suit which the computer has the most of
-        count = { "hearts": 0, "diamonds": 0, "clubs": 0, "spades": 0 }
-        for card in self.decks[self.current_player].cards:
-            match card.suit:
-                case Suit.HEARTS:
-                    count["hearts"] += 1
-                case Suit.DIAMONDS:
-                    count["diamonds"] += 1
-                case Suit.CLUBS:
-                    count["clubs"] += 1
-                case Suit.SPADES:
-                    count["spades"] += 1
-        choice = sorted(count.items(), key=lambda x: x[1], reverse=True)[0][0]
-        match choice:
-            case "hearts":
-                self.discard.cards[len(self.discard.cards) - 1].suit = Suit.HEARTS
-            case "diamonds":
-                self.discard.cards[len(self.discard.cards) - 1].suit = Suit.DIAMONDS
-            case "clubs":
-                self.discard.cards[len(self.discard.cards) - 1].suit = Suit.CLUBS
-            case "spades":
-                self.discard.cards[len(self.discard.cards) - 1].suit = Suit.SPADES
+        strategy = self.strategies[self.current_player]
+        if strategy is not None:
+            self.change_suit(strategy.choose_suit(self))
+            return
+        # Strategy: select the suit which the computer has the most of (ties go to the earliest suit)
+        count = self.decks[self.current_player].suit_counts()
+        self.change_suit(max(CHOOSABLE_SUITS, key=lambda suit: count[suit]))
 
     # Skip the next go of the player
     def skip_go(self):
+        if self.log is not None:
+            self.log.skip()
+        if self.listeners is not None:
+            self.emit(EventKind.SKIPPED, (self.current_player + self.direction) % len(self.decks))
         self.next_player()
 
+    # Reverse the direction of play (with two players this skips the other player's go instead)
+    def reverse(self):
+        self.direction = -self.direction
+        if self.hash is not None:
+            self.hash ^= REVERSED_KEY
+        if self.journal is not None:
+            self.journal.append((Change.REVERSED,))
+        if self.log is not None:
+            self.log.reverse()
+        if self.listeners is not None:
+            self.emit(EventKind.REVERSED, self.current_player)
+        if len(self.decks) == 2:
+            self.skip_go()
+
     # Make the next player pick up 2 cards
     def pickup_2(self):
-        next_player_id = (self.current_player + 1) % len(self.decks)
+        next_player_id = (self.current_player + self.direction) % len(self.decks)
         player_deck = self.decks[next_player_id]
+        if self.log is not None:
+            self.log.pickup_2()
         for i in range(2):
-            new_card = self.stock.pop()
-            player_deck.push(new_card)
+            self.draw(player_deck)
+
+    # Make a player pick up a card from the stock pile
+    # Returns the card, or None if every card is in a player's hand
+    def draw(self, player_deck: Deck) -> Card:
+        if len(self.stock.cards) == 0:
+            # Only recycle once the stock has actually run out
+            self.recycle()
+            if len(self.stock.cards) == 0:
+                return None
+        new_card = self.stock.pop()
+        player_deck.push(new_card)
+        if self.hash is not None:
+            self.hash ^= STOCK_KEYS[new_card.code] ^ HAND_KEYS[self.player_of(player_deck)][new_card.code]
+        if self.journal is not None:
+            self.journal.append((Change.DREW, player_deck))
+        if self.log is not None:
+            self.log.draw(new_card)
+        if self.listeners is not None:
+            self.emit(EventKind.DREW, self.player_of(player_deck), new_card)
+        return new_card
+
+    # Move the discard pile (apart from the top card) underneath the stock pile
+    def recycle(self):
+        if len(self.discard.cards) < 2:
+            return
+        # Work on the cards directly, so a suit chosen by an eight on top is kept
+        top = self.discard.cards.pop()
+        cards = self.discard.cards
+        if self.journal is not None:
+            # Keep the pile as it was (and the generator, if it is about to shuffle) to put them back
+            self.journal.append((Change.RECYCLED, cards, self.rng.getstate() if self.reshuffle else None))
+        if self.hash is not None:
+            self.hash ^= self.moved_to_stock(cards)
+        if self.reshuffle:
+            cards = list(cards)
+            self.rng.shuffle(cards)
+        # Each card goes underneath the one before it
+        self.stock.cards.extendleft(cards)
+        self.discard.cards = deque([top])
+        self.recycles += 1
+        if self.log is not None:
+            self.log.recycle()
+        if self.listeners is not None:
+            self.emit(EventKind.RECYCLED, self.current_player)
 
     # Move to the next player
     def next_player(self):
-        self.current_player = (self.current_player + 1) % len(self.decks)
+        player = self.current_player
+        self.current_player = (player + self.direction) % len(self.decks)
+        if self.hash is not None:
+            self.hash ^= PLAYER_KEYS[player] ^ PLAYER_KEYS[self.current_player]
+        if self.journal is not None:
+            self.journal.append((Change.NEXT_PLAYER,))
+        if self.log is not None:
+            self.log.next_player()
+        if self.listeners is not None:
+            self.emit(EventKind.NEXT_PLAYER, self.current_player)
+
+    # Call back whenever an event of one of the kinds happens (any kind if none are given)
+    # Returns a function that cancels the subscription
+    def subscribe(self, callback, *kinds: EventKind):
+        if self.listeners is None:
+            self.listeners = {kind: [] for kind in EventKind}
+        kinds = kinds or tuple(EventKind)
+        for kind in kinds:
+            self.listeners[kind].append(callback)
+
+        def unsubscribe():
+            for kind in kinds:
+                if callback in self.listeners[kind]:
+                    self.listeners[kind].remove(callback)
+        return unsubscribe
+
+    # Tell everything subscribed to a kind of event that it has happened
+    def emit(self, kind: EventKind, player: int, card: Card = None, suit: Suit = None):
+        callbacks = self.listeners[kind]
+        if callbacks:
+            event = Event(kind, player, card, suit)
+            # Callbacks may unsubscribe themselves
+            for callback in list(callbacks):
+                callback(event)
+
+    # Take a snapshot of the game to restore later, in O(1)
+    # Changes are journalled from the first snapshot, so restoring only undoes what has changed since
+    def snapshot(self) -> int:
+        if self.journal is None:
+            self.journal = []
+        return len(self.journal)
+
+    # Undo every change made since a snapshot (snapshots taken after it can't be restored afterwards)
+    # Logs, tracers and subscribers aren't rewound
+    def restore(self, snapshot: int):
+        journal = self.journal
+        while len(journal) > snapshot:
+            change = journal.pop()
+            match change[0]:
+                case Change.PLAYED:
+                    _, player, index, suit = change
+                    card = self.discard.pop()
+                    self.decks[player].insert(index, card)
+                    self.discard.suit = suit
+                    code = card.code
+                    if self.rules.effects[code] is not Effect.NONE:
+                        self.specials -= 1
+                    if self.hash is not None:
+                        self.hash ^= (
+                            HAND_KEYS[player][code] ^ DISCARD_KEYS[code] ^ TOP_KEYS[code]
+                            ^ TOP_KEYS[self.discard.cards[-1].code] ^ SUIT_KEYS[suit]
+                        )
+                case Change.SUIT_CHANGED:
+                    if self.hash is not None:
+                        self.hash ^= SUIT_KEYS[self.discard.suit] ^ SUIT_KEYS[change[1]]
+                    self.discard.suit = change[1]
+                case Change.DREW:
+                    card = change[1].pop()
+                    self.stock.push(card)
+                    if self.hash is not None:
+                        self.hash ^= STOCK_KEYS[card.code] ^ HAND_KEYS[self.player_of(change[1])][card.code]
+                case Change.RECYCLED:
+                    _, cards, state = change
+                    for _ in range(len(cards)):
+                        self.stock.cards.popleft()
+                    if self.hash is not None:
+                        self.hash ^= self.moved_to_stock(cards)
+                    cards.append(self.discard.cards[0])
+                    self.discard.cards = cards
+                    self.recycles -= 1
+                    if state is not None:
+                        self.rng.setstate(state)
+                case Change.NEXT_PLAYER:
+                    player = self.current_player
+                    self.current_player = (player - self.direction) % len(self.decks)
+                    if self.hash is not None:
+                        self.hash ^= PLAYER_KEYS[player] ^ PLAYER_KEYS[self.current_player]
+                case Change.REVERSED:
+                    self.direction = -self.direction
+                    if self.hash is not None:
+                        self.hash ^= REVERSED_KEY
+
+    # Stop journalling changes (every snapshot is forgotten)
+    def release(self):
+        self.journal = None
+
+    # Get the player holding a hand
+    def player_of(self, deck: Deck) -> int:
+        for player, hand in enumerate(self.decks):
+            if hand is deck:
+                return player
+        raise ValueError("that hand isn't in the game")
+
+    # Get the change to the hash from cards moving between the discard pile and the stock
+    def moved_to_stock(self, cards) -> int:
+        change = 0
+        for card in cards:
+            change ^= DISCARD_KEYS[card.code] ^ STOCK_KEYS[card.code]
+        return change
+
+    # Work the hash of the position out from scratch (and keep it up to date from then on)
+    def rehash(self):
+        key = PLAYER_KEYS[self.current_player] ^ SUIT_KEYS[self.discard.suit]
+        if self.direction < 0:
+            key ^= REVERSED_KEY
+        for player, deck in enumerate(self.decks):
+            keys = HAND_KEYS[player]
+            for card in deck.cards:
+                key ^= keys[card.code]
+        for card in self.stock.cards:
+            key ^= STOCK_KEYS[card.code]
+        for card in self.discard.cards:
+            key ^= DISCARD_KEYS[card.code]
+        if self.discard.cards:
+            key ^= TOP_KEYS[self.discard.cards[-1].code]
+        self.hash = key
+
+    # Pack the position into a fixed-width buffer (8 bytes, then one per player, then one per card):
+    #     u8 players, u8 current player (top bit set when play is reversed), u8 value of the suit chosen by an eight
+    #     (0 for none), u8 cards in the stock, u16 recycles, u16 special cards played, u8 cards in each hand,
+    #     then the code of every card: each hand in turn, the stock and the discard pile (bottom first),
+    #     with 0xFF for the jokers when they aren't in the pack
+    def to_bytes(self) -> bytes:
+        data = bytearray([
+            len(self.decks), self.current_player | (0x80 if self.direction < 0 else 0),
+            self.discard.suit.value if self.discard.suit else 0, len(self.stock.cards),
+        ])
+        data += self.recycles.to_bytes(2, "little") + self.specials.to_bytes(2, "little")
+        data += bytes(len(deck.cards) for deck in self.decks)
+        for pile in self.decks + [self.stock, self.discard]:
+            data += bytes(card.code for card in pile.cards)
+        return bytes(data) + b"\xff" * (8 + len(self.decks) + len(CARDS) - len(data))
+
+    # Unpack a position packed by to_bytes (the other arguments are as for Game)
+    def from_bytes(data: bytes, bitset: bool = False, reshuffle: bool = False, rng=None, log=None,
+                   rules: Rules = None):
+        players = data[0]
+        if len(data) != 8 + players + len(CARDS):
+            raise ValueError(f"a position of {players} players is {8 + players + len(CARDS)} bytes, not {len(data)}")
+        codes = [code for code in data[8 + players:] if code != 0xFF]
+        # Every card of the pack must be somewhere, once
+        if sorted(codes) != list(range(len(codes))) or len(codes) not in (len(CARDS) - 2, len(CARDS)):
+            raise ValueError("the position doesn't hold every card of the pack exactly once")
+        game = Game(len(codes) == len(CARDS), bitset, reshuffle, rng, log, rules)
+        if len(game.decks) != players:
+            raise ValueError(f"the position has {players} players, but the rules have {len(game.decks)}")
+        game.current_player = data[1] & 0x7F
+        game.direction = -1 if data[1] & 0x80 else 1
+        game.recycles = int.from_bytes(data[4:6], "little")
+        game.specials = int.from_bytes(data[6:8], "little")
+        cards = [CARDS[code] for code in codes]
+        position = 0
+        for deck, size in zip(game.decks, data[8:8 + players]):
+            for card in cards[position:position + size]:
+                deck.push(card)
+            position += size
+        game.stock = Pile(cards[position:position + data[3]])
+        game.discard = Pile(cards[position + data[3]:])
+        if game.rules.playable is not PLAYABLE:
+            game.discard.playable_masks = game.rules.playable
+        game.discard.suit = Suit(data[2]) if data[2] else None
+        return game
+
+    # What each effect of a card does (besides changing the suit, which the player or computer must choose)
+    handlers = {
+        Effect.PICKUP_2: pickup_2,
+        Effect.SKIP: skip_go,
+        Effect.REVERSE: reverse,
+    }
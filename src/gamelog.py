@@ -0,0 +1,234 @@
+"""
+Compact binary logs of games, and fast deterministic replay of them
+
+A log file is a short header followed by one byte per event. The top two bits of each byte give the kind
+of event and the low six bits its card code, other events share the last kind:
+
+    00cccccc    card c is played by the current player
+    01cccccc    card c is drawn from the stock (by the current player, or the next one after a pickup 2)
+    10cccccc    card c is put into the stock before dealing (bottom first)
+    11kkkaaa    event k with argument a: new game, suit change to suit a, skip, pickup 2, next player, recycle,
+                reverse
+
+Run with `python -m gamelog --help` from the src folder
+"""
+
+import argparse
+import random
+import time
+from cards import Suit, CARDS
+from deck import Pile
+from game import Game
+from simulate import play_out
+
+# The first bytes of every log file (the last is the format version)
+MAGIC = b"C8L\x01"
+
+# Kinds of event
+PLAY = 0x00
+DRAW = 0x40
+DEAL = 0x80
+OTHER = 0xC0
+
+# Other events
+NEW_GAME = OTHER | 0 << 3
+SUIT = OTHER | 1 << 3
+SKIP = OTHER | 2 << 3
+PICKUP_2 = OTHER | 3 << 3
+NEXT_PLAYER = OTHER | 4 << 3
+RECYCLE = OTHER | 5 << 3
+REVERSE = OTHER | 6 << 3
+
+SUITS = {suit.value: suit for suit in Suit}
+
+# Card of each six bit code (codes past the last card are invalid)
+CODES = CARDS + (None,) * (64 - len(CARDS))
+
+# Raised when a log doesn't make sense for the game it is replayed against
+class ReplayError(ValueError):
+    pass
+
+# An append-only record of the events of one or more games
+class GameLog:
+    def __init__(self):
+        self.data = bytearray()
+
+    # Record the order of the stock before dealing (this also starts a new game)
+    def deal(self, cards):
+        self.data.append(NEW_GAME)
+        self.data.extend(DEAL | card.code for card in cards)
+
+    # Record the current player playing a card
+    def play(self, card):
+        self.data.append(PLAY | card.code)
+
+    # Record a card being drawn from the stock
+    def draw(self, card):
+        self.data.append(DRAW | card.code)
+
+    # Record the suit being changed by an eight
+    def suit(self, suit: Suit):
+        self.data.append(SUIT | suit.value)
+
+    # Record a player's go being skipped
+    def skip(self):
+        self.data.append(SKIP)
+
+    # Record the next player being made to pick up two cards
+    def pickup_2(self):
+        self.data.append(PICKUP_2)
+
+    # Record the direction of play being reversed
+    def reverse(self):
+        self.data.append(REVERSE)
+
+    # Record the turn passing to the next player
+    def next_player(self):
+        self.data.append(NEXT_PLAYER)
+
+    # Record the discard pile being recycled into the stock
+    def recycle(self):
+        self.data.append(RECYCLE)
+
+    # Append the events recorded so far to a file, and start afresh
+    def flush(self, path: str):
+        with open(path, "ab") as f:
+            if f.tell() == 0:
+                f.write(MAGIC)
+            f.write(self.data)
+        self.data = bytearray()
+
+# Read the events from a log file
+def load(path: str) -> bytes:
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ReplayError(f"{path} is not a game log")
+    return data[len(MAGIC):]
+
+# Deal out a replayed game once every card has been put into its stock
+def deal(game: Game, cards: list, offset: int):
+    # The pack is dealt with or without its two jokers
+    if len(cards) not in (len(CARDS) - 2, len(CARDS)) or len(set(cards)) < len(cards):
+        raise ReplayError(f"the deal ending at offset {offset} isn't a whole pack")
+    game.stock = Pile(cards)
+    game.deal()
+
+# Replay logged events against fresh games, yielding each game once its events run out
+# With check set, every play is validated against the rules and every draw against the stock
+# Logs don't record the rules, so games played with a variant must be replayed with the same one
+# Errors give the offset of the event that couldn't be replayed (from the start of the events)
+def replay(events: bytes, check: bool = True, rules=None):
+    game = None
+    dealing = None
+    # Number of draws still owed to the next player after a pickup 2
+    owed = 0
+    for offset, event in enumerate(events):
+        kind = event & OTHER
+        if game is None and event != NEW_GAME:
+            raise ReplayError(f"event {event:#04x} at offset {offset} comes before any game has started")
+        if kind == DEAL:
+            if dealing is None:
+                raise ReplayError(f"card dealt at offset {offset} after the game was dealt")
+            if CODES[event & 0x3F] is None:
+                raise ReplayError(f"unknown card {event & 0x3F} at offset {offset}")
+            dealing.append(CODES[event & 0x3F])
+            continue
+        if dealing is not None and event != NEW_GAME:
+            # Every card has been put into the stock, so deal it out
+            deal(game, dealing, offset)
+            dealing = None
+        if kind == PLAY:
+            card = CODES[event & 0x3F]
+            deck = game.decks[game.current_player]
+            # Cards not in the hand can't be played even unchecked
+            if card not in deck.cards or check and not game.discard.can_add_to(card):
+                raise ReplayError(f"{card} can't be played at offset {offset}")
+            game.play_card(deck.cards.index(card))
+        elif kind == DRAW:
+            card = CODES[event & 0x3F]
+            player = game.current_player
+            if owed:
+                player = (player + game.direction) % len(game.decks)
+                owed -= 1
+            stock = game.stock.cards
+            if not stock:
+                game.recycle()
+            if stock and stock[-1] is card:
+                stock.pop()
+            elif card in stock:
+                # The stock was reshuffled when it was recycled
+                stock.remove(card)
+            else:
+                raise ReplayError(f"{card} isn't in the stock at offset {offset}")
+            game.decks[player].push(card)
+        elif event == NEXT_PLAYER:
+            game.next_player()
+            owed = 0
+        elif event & 0xF8 == SUIT:
+            if event & 0x07 not in SUITS:
+                raise ReplayError(f"unknown suit {event & 0x07} at offset {offset}")
+            game.change_suit(SUITS[event & 0x07])
+        elif event == PICKUP_2:
+            owed = 2
+        elif event == REVERSE:
+            game.direction = -game.direction
+        elif event == NEW_GAME:
+            if dealing is not None:
+                raise ReplayError(f"the game started before offset {offset} was never dealt")
+            if game is not None:
+                yield game
+            game = Game(False, rules=rules)
+            dealing = []
+            owed = 0
+        elif event not in (SKIP, RECYCLE):
+            raise ReplayError(f"unknown event {event:#04x} at offset {offset}")
+    if dealing is not None:
+        deal(game, dealing, len(events))
+    if game is not None:
+        yield game
+
+# Record seeded computer-vs-computer games to a log file
+def record(path: str, games: int, seed: int = 0, jokers: bool = False, reshuffle: bool = False):
+    log = GameLog()
+    for i in range(games):
+        game = Game(jokers, reshuffle=reshuffle, rng=random.Random(seed + i), log=log)
+        game.set_up()
+        play_out(game)
+        if len(log.data) > 1 << 20:
+            log.flush(path)
+    log.flush(path)
+
+# Command line entry point
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m gamelog", description="Record and replay game logs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    recording = commands.add_parser("record", help="append seeded computer-vs-computer games to a log")
+    recording.add_argument("path")
+    recording.add_argument("-n", "--games", type=int, default=1000, help="number of games to play")
+    recording.add_argument("-s", "--seed", type=int, default=0, help="seed of the first game")
+    recording.add_argument("-j", "--jokers", action="store_true", help="add jokers to the pack")
+    recording.add_argument("-r", "--reshuffle", action="store_true", help="reshuffle the recycled stock")
+    replaying = commands.add_parser("replay", help="replay every game in a log, checking it is valid")
+    replaying.add_argument("path")
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        record(args.path, args.games, args.seed, args.jokers, args.reshuffle)
+        return
+    events = load(args.path)
+    started = time.perf_counter()
+    wins = [0, 0]
+    games = 0
+    for game in replay(events):
+        games += 1
+        if game.winner() is not None:
+            wins[game.winner()] += 1
+    seconds = time.perf_counter() - started
+    print(f"Games replayed:    {games}")
+    print(f"Events replayed:   {len(events)}")
+    print(f"Events per second: {len(events) / seconds:.0f}")
+    print(f"Player 0 wins:     {wins[0]}")
+    print(f"Player 1 wins:     {wins[1]}")
+
+if __name__ == "__main__":
+    main()
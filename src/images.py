@@ -0,0 +1,125 @@
+"""
+A bounded cache of decoded card images, shared between every label that shows them
+
+PIL is only imported once an image is first decoded, so importing this module is cheap.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from cards import ASSETS
+from bundle import load_bundle
+
+# The size cards are shown at
+CARD_SIZE = (120, 168)
+
+# Added to the stem of an image to show it dimmed (e.g. for cards that can't be played)
+DIM = "-dim"
+
+# Least recently used cache of images, keyed by (image stem, size)
+class ImageCache:
+    # Wrap turns a decoded PIL image into whatever is shown (a Tk PhotoImage by default)
+    def __init__(self, capacity: int = 128, wrap=None, bundle=None):
+        self.capacity = capacity
+        # Images come from the packed bundle if it has been built, otherwise the assets folder
+        self.bundle = bundle or load_bundle()
+        self.wrap = wrap
+        self.entries = OrderedDict()
+        # Images decoded ahead of time by a background thread, waiting to be wrapped
+        self.decoded = {}
+        # Guards decoded and entries between the preloader and the main thread
+        self.lock = threading.Lock()
+        self.preloader = None
+        self.preload_seconds = None
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.preloaded = 0
+        self.bytes = 0
+
+    # Decode and resize an image from the bundle or assets folder
+    def decode(self, stem: str, size: tuple):
+        from PIL import Image
+        if stem.endswith(DIM):
+            # Dimmed images are the image at half brightness, keeping its transparency
+            *colours, alpha = self.decode(stem[:-len(DIM)], size).convert("RGBA").split()
+            return Image.merge("RGBA", [band.point(lambda value: value // 2) for band in colours] + [alpha])
+        name = f"{stem}.png"
+        if self.bundle is not None and name in self.bundle:
+            source = self.bundle.open(name)
+        else:
+            source = f"{ASSETS}/{name}"
+        with Image.open(source) as image:
+            return image.resize(size)
+
+    # Get an image, only decoding it the first time it is asked for
+    def get(self, stem: str, size: tuple = CARD_SIZE):
+        key = (stem, size)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+        self.misses += 1
+        with self.lock:
+            image = self.decoded.pop(key, None)
+        if image is None:
+            image = self.decode(stem, size)
+        else:
+            self.preloaded += 1
+        if self.wrap is None:
+            from PIL import ImageTk
+            self.wrap = ImageTk.PhotoImage
+        # Estimate memory from the decoded pixels
+        nbytes = image.width * image.height * len(image.getbands())
+        entry = (self.wrap(image), nbytes)
+        with self.lock:
+            # The preloader may have finished the same image while it was being decoded here
+            self.decoded.pop(key, None)
+            self.entries[key] = entry
+        self.bytes += nbytes
+        # Evict the least recently used images when over capacity
+        # (labels keep their own reference, so images on screen stay alive)
+        while len(self.entries) > self.capacity:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+        return entry[0]
+
+    # Decode images on a background thread, so they are ready by the time they are shown
+    # (Tk images can only be made on the main thread, so they are wrapped when first asked for)
+    def preload(self, keys: list):
+        started = time.perf_counter()
+
+        def run():
+            for key in keys:
+                if key in self.entries:
+                    continue
+                image = self.decode(*key)
+                with self.lock:
+                    # Images shown while this one was decoding are already cached
+                    if key not in self.entries:
+                        self.decoded[key] = image
+            self.preload_seconds = time.perf_counter() - started
+
+        self.preloader = threading.Thread(target=run, name="preload images", daemon=True)
+        self.preloader.start()
+
+    # Forget every image
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.decoded.clear()
+            self.bytes = 0
+
+    # Counters for debugging
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "preloaded": self.preloaded,
+            "bytes": self.bytes,
+        }
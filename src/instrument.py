@@ -0,0 +1,122 @@
+"""
+Lightweight timing of the engine and UI, exported as Chrome trace events (chrome://tracing, Perfetto)
+
+Nothing is timed unless a Tracer is attached: attaching wraps the chosen methods of an object in place,
+so code that isn't being traced runs exactly as before.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Keep at most this many events for export (the oldest are dropped first)
+MAX_EVENTS = 200000
+
+# Records timed spans, keeping recent durations of each for percentile summaries
+class Tracer:
+    def __init__(self, window: int = 500, path: str = None):
+        # Where the trace is written when exported (if not given one)
+        self.path = path
+        self.window = window
+        # (name, start, duration, thread) with times in seconds since the tracer was made
+        self.events = deque(maxlen=MAX_EVENTS)
+        # Name of span -> most recent durations
+        self.recent = {}
+        self.counts = {}
+        self.origin = time.perf_counter()
+
+    # Record a finished span
+    def record(self, name: str, started: float, duration: float):
+        self.events.append((name, started - self.origin, duration, threading.get_ident()))
+        recent = self.recent.get(name)
+        if recent is None:
+            recent = self.recent[name] = deque(maxlen=self.window)
+            self.counts[name] = 0
+        recent.append(duration)
+        self.counts[name] += 1
+
+    # Time the code inside a with block
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started, time.perf_counter() - started)
+
+    # Wrap a function so every call to it is recorded as a span
+    def wrap(self, name: str, function):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, started, time.perf_counter() - started)
+        timed.traced = True
+        return timed
+
+    # Time methods of an object (given as method name -> span name), only on this instance
+    def attach(self, obj, methods: dict):
+        for method, name in methods.items():
+            function = getattr(obj, method)
+            if not getattr(function, "traced", False):
+                setattr(obj, method, self.wrap(name, function))
+
+    # Percentiles of the recent durations of each span (in seconds)
+    def summary(self) -> dict:
+        summary = {}
+        for name, recent in self.recent.items():
+            ordered = sorted(recent)
+            pick = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+            summary[name] = {
+                "count": self.counts[name],
+                "p50": pick(0.5),
+                "p90": pick(0.9),
+                "p99": pick(0.99),
+                "max": ordered[-1],
+            }
+        return summary
+
+    # Summary as lines of text (for the debug overlay)
+    def summary_text(self) -> str:
+        lines = [f"{'span':22} {'count':>6} {'p50':>8} {'p99':>8} {'max':>8}"]
+        for name, stats in sorted(self.summary().items()):
+            lines.append(
+                f"{name[:22]:22} {stats['count']:6} {stats['p50'] * 1000:7.2f}ms "
+                f"{stats['p99'] * 1000:7.2f}ms {stats['max'] * 1000:7.2f}ms"
+            )
+        return "\n".join(lines)
+
+    # Build the recorded spans as Chrome trace events
+    def chrome_trace(self) -> dict:
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "cat": name.split(".")[0],
+                    "ph": "X",
+                    "ts": started * 1e6,
+                    "dur": duration * 1e6,
+                    "pid": pid,
+                    "tid": thread,
+                }
+                for name, started, duration, thread in self.events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    # Write the recorded spans to a Chrome trace file
+    def export(self, path: str = None):
+        with open(path or self.path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+
+# Time the parts of a game that can hitch
+def attach_game(tracer: Tracer, game):
+    tracer.attach(game, {
+        "computer_turn": "game.computer_turn",
+        "recycle": "game.recycle",
+    })
@@ -0,0 +1,164 @@
+"""
+Long simulation jobs split into shards of seeds, which survive being killed and pick up where they left off
+
+A job is a folder holding its settings (job.json) and the statistics of every shard it has finished
+(shards/<index>.npz, see stats.StatsSink). Shard i plays the seeds from seed + i * shard_size, so the games of a
+shard are the same however often the job is restarted. Each shard is saved in one step once it is finished, so
+a restarted job only plays the shards that are missing, and merging the shards gives exactly the report an
+uninterrupted run would.
+
+Run with `python -m jobs --help` from the src folder
+"""
+
+import argparse
+import json
+import os
+import time
+from multiprocessing import Pool, cpu_count
+from stats import StatsSink, record_chunk
+from rules import VARIANTS, variant
+
+# Settings of a job, and their defaults
+SETTINGS = {
+    "games": 1000000,
+    "seed": 0,
+    "jokers": False,
+    "bitset": False,
+    "rules": "standard",
+    "shard_size": 10000,
+}
+
+# Games handed to record_chunk at a time while playing a shard (bounding the memory used by its records)
+BATCH = 1000
+
+# Where the statistics of a shard are saved
+def shard_path(directory: str, index: int) -> str:
+    return os.path.join(directory, "shards", f"{index:06}.npz")
+
+# Play one shard of a job and save its statistics (run inside a worker process)
+def run_shard(args) -> int:
+    directory, index, start, count, jokers, bitset, rules = args
+    sink = StatsSink(variant(rules).players)
+    for first in range(start, start + count, BATCH):
+        sink.add(record_chunk((first, min(BATCH, start + count - first), jokers, bitset, rules)))
+    sink.save(shard_path(directory, index))
+    return index
+
+# A simulation job, created in a folder or reopened from it
+class Job:
+    # Settings are only needed to create a job, when reopening one any given must match those it was created with
+    def __init__(self, directory: str, settings: dict = None):
+        self.directory = directory
+        path = os.path.join(directory, "job.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.settings = json.load(f)
+            if settings is not None and any(self.settings.get(name) != value for name, value in settings.items()):
+                raise ValueError(f"{directory} holds a job with other settings: {self.settings}")
+        else:
+            if settings is None:
+                raise ValueError(f"{directory} doesn't hold a job")
+            unknown = set(settings) - set(SETTINGS)
+            if unknown:
+                raise ValueError(f"unknown settings: {', '.join(sorted(unknown))}")
+            self.settings = dict(SETTINGS, **settings)
+            variant(self.settings["rules"])
+            os.makedirs(os.path.join(directory, "shards"), exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.settings, f, indent=4)
+            os.replace(path + ".tmp", path)
+
+    # Get the (index, first seed, games) of every shard
+    def shards(self) -> list:
+        games, seed, size = self.settings["games"], self.settings["seed"], self.settings["shard_size"]
+        return [
+            (index, seed + offset, min(size, games - offset))
+            for index, offset in enumerate(range(0, games, size))
+        ]
+
+    # Get the shards that haven't been finished yet
+    def missing(self) -> list:
+        return [shard for shard in self.shards() if not os.path.exists(shard_path(self.directory, shard[0]))]
+
+    # Play the missing shards (at most limit of them), calling progress(index) as each is saved
+    def run(self, workers: int = None, limit: int = None, progress=None):
+        workers = workers or cpu_count()
+        settings = self.settings
+        jobs = [
+            (self.directory, index, start, count, settings["jokers"], settings["bitset"], settings["rules"])
+            for index, start, count in self.missing()[:limit]
+        ]
+        if workers == 1:
+            for index in map(run_shard, jobs):
+                if progress is not None:
+                    progress(index)
+        else:
+            with Pool(workers) as pool:
+                for index in pool.imap_unordered(run_shard, jobs):
+                    if progress is not None:
+                        progress(index)
+
+    # Merge the statistics of every shard, in order (every shard must be finished)
+    def merge(self) -> StatsSink:
+        missing = self.missing()
+        if missing:
+            raise ValueError(f"{len(missing)} of {len(self.shards())} shards haven't been played yet")
+        merged = StatsSink(variant(self.settings["rules"]).players)
+        for index, _, _ in self.shards():
+            merged.merge(StatsSink.load(shard_path(self.directory, index)))
+        return merged
+
+# Command line entry point
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m jobs", description="Run long simulations that can be resumed")
+    commands = parser.add_subparsers(dest="command", required=True)
+    running = commands.add_parser("run", help="start a job, or resume it from its missing shards")
+    running.add_argument("directory")
+    running.add_argument("-n", "--games", type=int, default=None, help="number of games to play")
+    running.add_argument("-s", "--seed", type=int, default=None, help="seed of the first game")
+    running.add_argument("-j", "--jokers", action="store_true", default=None, help="add jokers to the pack")
+    running.add_argument("-b", "--bitset", action="store_true", default=None, help="use bitset-backed hands")
+    running.add_argument("-r", "--rules", choices=VARIANTS, default=None, help="variant of the rules to play")
+    running.add_argument("--shard-size", type=int, default=None, help="games in each shard")
+    running.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    status = commands.add_parser("status", help="show how much of a job is done")
+    status.add_argument("directory")
+    merging = commands.add_parser("merge", help="print the report of a finished job")
+    merging.add_argument("directory")
+    args = parser.parse_args(argv)
+
+    if args.command != "run":
+        job = Job(args.directory)
+        if args.command == "status":
+            print(f"{len(job.shards()) - len(job.missing())} of {len(job.shards())} shards finished")
+            return
+        print(job.merge())
+        return
+    # Settings not given are taken from the job being resumed (or the defaults for a new one)
+    given = {
+        name: getattr(args, name) for name in SETTINGS if getattr(args, name) is not None
+    }
+    try:
+        job = Job(args.directory, given)
+    except ValueError as error:
+        parser.error(str(error))
+    total = len(job.shards())
+    done = total - len(job.missing())
+    if done:
+        print(f"Resuming: {done} of {total} shards already finished")
+    started = time.perf_counter()
+
+    def progress(_):
+        nonlocal done
+        done += 1
+        print(f"\r{done} of {total} shards finished ({time.perf_counter() - started:.0f}s)", end="", flush=True)
+
+    job.run(args.workers, progress=progress)
+    print()
+    report = str(job.merge())
+    with open(os.path.join(args.directory, "report.txt"), "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    print(report)
+
+if __name__ == "__main__":
+    main()
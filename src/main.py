@@ -4,13 +4,84 @@ Crazy Eight Card Game
 Author: Luke Williams
 """
 
-from cards import Card, Suit, Rank
-from deck import Deck
+import time
+started = time.perf_counter()
+
+import argparse
+import random
 from game import Game
+from images import ImageCache, CARD_SIZE, DIM
+from instrument import Tracer
+from events import PACES
+from strategies import NAMES, make_strategy
 from ui import UI, ask_user_if_jokers
 
+# Points during startup and how long after launch they were reached
+marks = [("imports", time.perf_counter() - started)]
+
+# Note how long it took to reach a point during startup
+def mark(name: str):
+    marks.append((name, time.perf_counter() - started))
+
+parser = argparse.ArgumentParser(description="Play crazy eights against the computer")
+parser.add_argument(
+    "--trace", metavar="PATH", default=None,
+    help="time the game (press F3 to see the timings) and write a Chrome trace to PATH on exit"
+)
+parser.add_argument("--startup-profile", action="store_true", help="report how long startup takes")
+parser.add_argument(
+    "--computer", choices=NAMES, default="endgame",
+    help="how the computer plays (\"table\" only looks its moves up, for slow machines)"
+)
+parser.add_argument(
+    "--pace", choices=[name for name in PACES if name != "instant"], default="animated",
+    help="how quickly the computer takes its turns"
+)
+parser.add_argument("--demo", action="store_true", help="watch the computer play both sides")
+args = parser.parse_args()
+tracer = Tracer(path=args.trace) if args.trace else None
+
+# Deal the first game both with and without jokers, so its cards can be loaded while the question is shown
+# Hands are bitset-backed, so the cards the player can play are looked up rather than searched for
+seed = random.randrange(1 << 32)
+games = {}
+for jokers in [True, False]:
+    games[jokers] = Game(jokers, bitset=True, rng=random.Random(seed))
+    games[jokers].set_up()
+images = ImageCache()
+first_images = [("back", CARD_SIZE)] + [(suit, (30, 30)) for suit in ["heart", "diamond", "spade", "club"]]
+for game in games.values():
+    first_images += [(card.stem, CARD_SIZE) for card in game.decks[0].cards + [game.discard.peek()]]
+    # Cards that can't be played on the first turn are shown dimmed
+    first_images += [(card.stem + DIM, CARD_SIZE) for card in game.decks[0].cards]
+images.preload(list(dict.fromkeys(first_images)))
+
+# Report how long startup took
+def report(ui: UI):
+    mark("first frame")
+    print("Startup profile:")
+    previous = 0.0
+    for name, at in marks:
+        print(f"  {name:24} {at * 1000:8.1f}ms  (+{(at - previous) * 1000:.1f}ms)")
+        previous = at
+    stats = ui.images.stats()
+    ready = ui.images.preload_seconds
+    ready = "still running" if ready is None else f"ready after {ready * 1000:.1f}ms"
+    print(f"  images preloaded: {stats['preloaded']} ({ready}), decoded on demand: {stats['misses'] - stats['preloaded']}")
+
+# Build and run the game
+def play(jokers: bool):
+    mark("jokers chosen")
+    ui = UI(jokers, tracer, images, games[jokers], make_strategy(args.computer), PACES[args.pace], args.demo)
+    if args.startup_profile:
+        mark("UI built")
+        ui.root.update()
+        report(ui)
+    ui.run()
+
 # Work out whether or not to use jokers and run the correct version of the game
 use_jokers = ask_user_if_jokers(
-    lambda: UI(True).run(), # User doesn't want jokers
-    lambda: UI(False).run(), # User does want jokers
+    lambda: play(True), # User does want jokers
+    lambda: play(False), # User doesn't want jokers
+    lambda: mark("jokers dialog shown"),
 )
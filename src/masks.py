@@ -0,0 +1,49 @@
+"""
+Precomputed bitmasks over the 54 card codes, used by bitset-backed hands to find legal plays quickly
+"""
+
+from cards import Card, Suit, Rank, CARDS
+
+# The suits a player can change to with an eight (in order of preference when tied)
+CHOOSABLE_SUITS = [Suit.HEARTS, Suit.DIAMONDS, Suit.CLUBS, Suit.SPADES]
+
+# Mask with every card in the universe set
+ALL_CARDS = (1 << len(CARDS)) - 1
+
+# Get the bit representing a card
+def card_bit(card: Card) -> int:
+    return 1 << card.code
+
+# Build a mask from a list of cards
+def mask_of(cards) -> int:
+    mask = 0
+    for card in cards:
+        mask |= 1 << card.code
+    return mask
+
+# Iterate over the cards set in a mask (lowest code first)
+def cards_in(mask: int):
+    while mask:
+        lowest = mask & -mask
+        yield CARDS[lowest.bit_length() - 1]
+        mask ^= lowest
+
+# Masks of every card of a given suit / rank
+SUIT_MASKS = {suit: mask_of(card for card in CARDS if card.suit is suit) for suit in Suit}
+RANK_MASKS = {rank: mask_of(card for card in CARDS if card.rank is rank) for rank in Rank}
+
+# Work out which cards can be played onto a top card, when the suit to match is the one given
+def playable_mask(top_card: Card, suit: Suit) -> int:
+    if top_card.rank is Rank.JOKER:
+        # Anything goes on a joker
+        return ALL_CARDS
+    return (
+        RANK_MASKS[Rank.EIGHT] | RANK_MASKS[Rank.JOKER]
+        | RANK_MASKS[top_card.rank] | SUIT_MASKS[suit]
+    )
+
+# Lookup table of playable cards, indexed by the code of the top card then the value of the suit to match
+PLAYABLE = [
+    [0] + [playable_mask(card, suit) for suit in Suit]
+    for card in CARDS
+]
@@ -0,0 +1,303 @@
+"""
+A computer player using Information-Set Monte Carlo Tree Search
+
+The opponent's hand and the order of the stock are hidden, so each search iteration samples them from the
+cards the computer hasn't seen and plays the game out on a fast bitset copy of the state. Searches run for a
+strict wall-clock budget per move, optionally spread across a pool of worker processes.
+"""
+
+import math
+import multiprocessing
+import random
+import time
+from cards import Rank, CARDS
+from masks import CHOOSABLE_SUITS, SUIT_MASKS, PLAYABLE, ALL_CARDS, mask_of
+from strategies import Strategy
+
+# Moves are (card code, suit changed to), drawing a card is represented by this move
+DRAW = (-1, 0)
+
+# Lookup tables indexed by card code
+SUIT_OF = [card.suit.value for card in CARDS]
+RANK_OF = [card.rank for card in CARDS]
+CHOOSABLE_MASKS = [(suit.value, SUIT_MASKS[suit]) for suit in CHOOSABLE_SUITS]
+
+# Games longer than this in a playout are scored as draws
+MAX_PLAYOUT = 200
+
+# Codes of the cards set in a mask
+def codes_in(mask: int) -> list:
+    codes = []
+    while mask:
+        lowest = mask & -mask
+        codes.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return codes
+
+# A fast, fully known copy of a game's state (hands are bitsets of card codes)
+class State:
+    __slots__ = ("hands", "stock", "discard", "top", "suit", "player", "rng")
+
+    def __init__(self, hands: list, stock: list, discard: list, top: int, suit: int, player: int, rng):
+        self.hands = hands
+        self.stock = stock
+        self.discard = discard
+        self.top = top
+        self.suit = suit
+        self.player = player
+        self.rng = rng
+
+    # Get the winner of the game, if there is one
+    def winner(self):
+        if self.hands[0] == 0:
+            return 0
+        if self.hands[1] == 0:
+            return 1
+        return None
+
+    # Get the legal moves of the current player (eights are one move per suit they can change to)
+    def moves(self) -> list:
+        playable = self.hands[self.player] & PLAYABLE[self.top][self.suit]
+        if not playable:
+            return [DRAW]
+        moves = []
+        for code in codes_in(playable):
+            if RANK_OF[code] is Rank.EIGHT:
+                moves.extend((code, suit) for suit, _ in CHOOSABLE_MASKS)
+            else:
+                moves.append((code, 0))
+        return moves
+
+    # Pick a move for a playout: a random legal card, eights change to the suit held the most of
+    def playout_move(self):
+        hand = self.hands[self.player]
+        playable = hand & PLAYABLE[self.top][self.suit]
+        if not playable:
+            return DRAW
+        code = self.rng.choice(codes_in(playable))
+        if RANK_OF[code] is Rank.EIGHT:
+            hand &= ~(1 << code)
+            suit = max(CHOOSABLE_MASKS, key=lambda choice: (hand & choice[1]).bit_count())[0]
+            return (code, suit)
+        return (code, 0)
+
+    # Make a player pick up a card, recycling the discard pile if needed
+    def draw(self, player: int):
+        if not self.stock:
+            if not self.discard:
+                # Every card is in a player's hand
+                return
+            self.stock = self.discard
+            self.discard = []
+            self.rng.shuffle(self.stock)
+        self.hands[player] |= 1 << self.stock.pop()
+
+    # Make a move for the current player
+    def play(self, move):
+        code, suit = move
+        player = self.player
+        if code < 0:
+            self.draw(player)
+            self.player ^= 1
+            return
+        self.hands[player] &= ~(1 << code)
+        self.discard.append(self.top)
+        self.top = code
+        self.suit = suit or SUIT_OF[code]
+        rank = RANK_OF[code]
+        if rank is Rank.TWO:
+            self.draw(player ^ 1)
+            self.draw(player ^ 1)
+        if rank is not Rank.ACE and rank is not Rank.JOKER:
+            # Aces and jokers skip the next player, so only move on for other cards
+            self.player ^= 1
+
+    # Play randomly until the game ends, returning the winner (None for a draw)
+    def playout(self):
+        for _ in range(MAX_PLAYOUT):
+            winner = self.winner()
+            if winner is not None:
+                return winner
+            self.play(self.playout_move())
+        return self.winner()
+
+# What one player knows about a game (everything here can be sent to other processes)
+class InfoSet:
+    def __init__(self, game):
+        player = game.current_player
+        self.player = player
+        self.hand = mask_of(game.decks[player].cards)
+        self.opponent_cards = len(game.decks[player ^ 1].cards)
+        self.stock_cards = len(game.stock.cards)
+        discard = [card.code for card in game.discard.cards]
+        self.top = discard.pop()
+        self.discard = discard
+        self.suit = game.discard.top_suit().value
+        # Every card in the game that this player hasn't seen
+        in_play = len(game.decks[0].cards) + len(game.decks[1].cards)
+        in_play += len(game.stock.cards) + len(game.discard.cards)
+        universe = mask_of(CARDS[:52]) | (ALL_CARDS if in_play > 52 else 0)
+        self.unseen = codes_in(universe & ~self.hand & ~mask_of(game.discard.cards))
+
+    # Sample a complete state consistent with what this player knows
+    def determinize(self, rng) -> State:
+        unseen = self.unseen[:]
+        rng.shuffle(unseen)
+        opponent = unseen[:self.opponent_cards]
+        stock = unseen[self.opponent_cards:self.opponent_cards + self.stock_cards]
+        hands = [0, 0]
+        hands[self.player] = self.hand
+        hands[self.player ^ 1] = mask_of(CARDS[code] for code in opponent)
+        return State(hands, stock, self.discard[:], self.top, self.suit, self.player, rng)
+
+# A node of the search tree, reached by a player making a move
+class Node:
+    __slots__ = ("move", "player", "parent", "children", "visits", "wins", "available")
+
+    def __init__(self, move, player: int, parent):
+        self.move = move
+        self.player = player
+        self.parent = parent
+        self.children = {}
+        self.visits = 0
+        self.wins = 0.0
+        self.available = 1
+
+    # Pick the child to explore, among those whose move is legal in this determinization
+    def select(self, moves: list, exploration: float):
+        best = None
+        best_score = -1.0
+        for move in moves:
+            child = self.children[move]
+            child.available += 1
+            score = child.wins / child.visits + exploration * math.sqrt(math.log(child.available) / child.visits)
+            if score > best_score:
+                best = child
+                best_score = score
+        return best
+
+# Run a search from an information set, returning the number of visits of each root move
+# Searches in worker processes may start late, so they can also be given a wall-clock time (time.time()) to stop
+# by, returning nothing if it has already passed
+def search(info: InfoSet, budget: float, seed=None, exploration: float = 0.7, iterations: int = None,
+           stop_by: float = None) -> dict:
+    rng = random.Random(seed)
+    if stop_by is not None:
+        budget = min(budget, stop_by - time.time())
+    deadline = time.perf_counter() + budget
+    root = Node(None, info.player ^ 1, None)
+    done = 0
+    while time.perf_counter() < deadline and (iterations is None or done < iterations):
+        done += 1
+        state = info.determinize(rng)
+        node = root
+        # Selection: descend while every legal move has been tried
+        while state.winner() is None:
+            moves = state.moves()
+            untried = [move for move in moves if move not in node.children]
+            if untried:
+                # Expansion: add one untried move
+                move = rng.choice(untried)
+                player = state.player
+                state.play(move)
+                node.children[move] = Node(move, player, node)
+                node = node.children[move]
+                break
+            node = node.select(moves, exploration)
+            state.play(node.move)
+        # Simulation
+        winner = state.playout()
+        # Backpropagation (from the point of view of the player who made each move)
+        while node is not None:
+            node.visits += 1
+            if winner is None:
+                node.wins += 0.5
+            elif winner == node.player:
+                node.wins += 1
+            node = node.parent
+    return {move: child.visits for move, child in root.children.items()}
+
+# Run a search inside a worker process
+def search_worker(args) -> dict:
+    return search(*args)
+
+# A computer player that searches for its moves
+class MCTSPlayer(Strategy):
+    # budget is the wall-clock time allowed per move in seconds, workers > 1 spreads searches over a pool
+    def __init__(self, budget: float = 0.05, workers: int = 1, exploration: float = 0.7, seed=None,
+                 iterations: int = None):
+        self.budget = budget
+        self.workers = workers
+        self.exploration = exploration
+        self.iterations = iterations
+        self.rng = random.Random(seed)
+        self.pool = None
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers)
+        # Suit picked by the last search, used when the eight it chose is handled
+        self.pending_suit = None
+
+    # Search for the best move for the current player of a game (None if nothing was found in time)
+    def best_move(self, game):
+        started = time.perf_counter()
+        info = InfoSet(game)
+        # Nothing to think about if there is only one thing to do
+        moves = info.determinize(self.rng).moves()
+        if len(moves) == 1:
+            return moves[0]
+        if self.pool is None:
+            # The last iteration may run a little over, so stop just short of the budget
+            budget = self.budget * 0.95 - (time.perf_counter() - started)
+            visits = search(info, budget, self.rng.random(), self.exploration, self.iterations)
+        else:
+            # Leave time to hand the results back, so the budget is never exceeded. Searches stop by the deadline
+            # even if they start late, so ones abandoned after a timeout don't hold up the searches of later moves
+            budget = self.budget * 0.8 - (time.perf_counter() - started)
+            stop_by = time.time() + budget
+            jobs = [
+                (info, budget, self.rng.random(), self.exploration, self.iterations, stop_by)
+                for _ in range(self.workers)
+            ]
+            pending = self.pool.map_async(search_worker, jobs)
+            visits = {}
+            try:
+                remaining = max(self.budget - (time.perf_counter() - started), 0)
+                for partial in pending.get(timeout=remaining):
+                    for move, count in partial.items():
+                        visits[move] = visits.get(move, 0) + count
+            except multiprocessing.TimeoutError:
+                # Workers were too slow, their results are thrown away when they arrive
+                visits = {}
+        if not visits:
+            return None
+        return max(visits, key=visits.get)
+
+    # Get the index of the card to play (or None to pick up)
+    def choose_card(self, game) -> int:
+        if not game.rules.standard_play:
+            # The search only knows the standard two player rules
+            return game.decks[game.current_player].card_to_play(game.discard)
+        move = self.best_move(game)
+        if move is None:
+            # Nothing was searched in time, play like the built in computer
+            return game.decks[game.current_player].card_to_play(game.discard)
+        code, suit = move
+        if code < 0:
+            return None
+        self.pending_suit = suit or None
+        return game.decks[game.current_player].cards.index(CARDS[code])
+
+    # Get the suit to change to after playing an eight
+    def choose_suit(self, game):
+        suit = self.pending_suit
+        self.pending_suit = None
+        if suit is None:
+            # The eight wasn't chosen by a search, pick the suit held the most of
+            return super().choose_suit(game)
+        return next(choice for choice in CHOOSABLE_SUITS if choice.value == suit)
+
+    # Shut down the worker processes
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
@@ -0,0 +1,271 @@
+"""
+A computer player that looks its moves up in a table, trained offline by self-play
+
+Positions are abstracted to the top card (its kind and the suit to match), how many cards of each suit are
+held, the size of the opponent's hand and the size of the stock. The table holds the kinds of card to play in each of them,
+best first, so choosing a move costs one lookup. It is shipped as assets/policy.bin:
+
+    b"C8P\x01"  then the table compressed with zlib: a u16 per abstract state, indexing ORDERS (0 for no entry)
+
+Run with `python -m policy --help` from the src folder (train a new table, or compare it with the built in computer)
+"""
+
+import argparse
+import os
+import random
+import time
+import sys
+import zlib
+from array import array
+from itertools import permutations
+from multiprocessing import Pool, cpu_count
+from cards import Rank, ASSETS
+from game import Game
+from masks import CHOOSABLE_SUITS
+from simulate import MAX_TURNS, play_out
+from strategies import Strategy
+
+# The first bytes of every table (the last is the format version)
+MAGIC = b"C8P\x01"
+
+# Where the table is shipped
+TABLE = os.path.join(ASSETS, "policy.bin")
+
+# Kinds of card that can be played (0 is kept for no choice, falling back on the first valid card)
+MATCH_SUIT, CHANGE_SUIT, TWO, ACE, EIGHT, JOKER = range(1, 7)
+ACTIONS = 7
+
+# Every order the kinds of card can be preferred in (entries of the table are 1 + an index into this)
+ORDERS = list(permutations(range(1, ACTIONS)))
+
+# Kinds not tried often enough in a state are preferred in this order, keeping eights and jokers for last
+FALLBACK = [MATCH_SUIT, CHANGE_SUIT, TWO, ACE, JOKER, EIGHT]
+
+# Sizes of the opponent's hand and the stock, grouped into buckets
+OPPONENT_BUCKETS = [0, 0, 1, 2, 3, 4, 4]
+STOCK_BUCKETS = [0] * 5 + [1] * 10
+
+# Kinds of top card (other ranks play alike, as hands are only known by how many of each suit they hold)
+TOP_KINDS = {Rank.TWO: 1, Rank.ACE: 2, Rank.EIGHT: 3, Rank.JOKER: 4}
+
+# Suits are interchangeable, so hands are known by how many cards (up to 3) they hold of the suit to match
+# and of the other suits from most to least
+OTHER_COUNTS = {
+    counts: index
+    for index, counts in enumerate(sorted({
+        tuple(sorted((a, b, c), reverse=True)) for a in range(4) for b in range(4) for c in range(4)
+    }))
+}
+
+# Number of abstract states: top card * suit to match held * other suits held * opponent * stock
+STATES = 5 * 4 * len(OTHER_COUNTS) * 6 * 3
+
+# Work out the abstract state of the current player of a game
+def state_of(game) -> int:
+    discard = game.discard
+    top = discard.cards[-1]
+    suit = discard.top_suit()
+    count = game.decks[game.current_player].suit_counts()
+    matching = min(count.get(suit, 0), 3)
+    others = tuple(sorted((min(count[other], 3) for other in CHOOSABLE_SUITS if other is not suit), reverse=True))
+    if top.rank is Rank.JOKER:
+        # Anything goes on a joker, so there is no suit to match
+        matching = 0
+        others = tuple(sorted((min(count[other], 3) for other in CHOOSABLE_SUITS), reverse=True)[:3])
+    index = (TOP_KINDS.get(top.rank, 0) * 4 + matching) * len(OTHER_COUNTS) + OTHER_COUNTS[others]
+    opponent = len(game.decks[game.current_player ^ 1].cards)
+    stock = len(game.stock.cards)
+    index = index * 6 + (OPPONENT_BUCKETS[opponent] if opponent < 7 else 5)
+    return index * 3 + (STOCK_BUCKETS[stock] if stock < 15 else 2)
+
+# Get the kind of a card that can be played
+def kind_of(card, suit) -> int:
+    match card.rank:
+        case Rank.TWO:
+            return TWO
+        case Rank.ACE:
+            return ACE
+        case Rank.EIGHT:
+            return EIGHT
+        case Rank.JOKER:
+            return JOKER
+    return MATCH_SUIT if card.suit is suit else CHANGE_SUIT
+
+# Get the index of a card of each kind that can be played (a suit is changed to the one held the most of)
+def choices(game) -> dict:
+    hand = game.decks[game.current_player]
+    discard = game.discard
+    suit = discard.top_suit()
+    count = None
+    found = {}
+    for index, card in enumerate(hand.cards):
+        if not discard.can_add_to(card):
+            continue
+        kind = kind_of(card, suit)
+        if kind not in found:
+            found[kind] = index
+        elif kind == CHANGE_SUIT:
+            count = count or hand.suit_counts()
+            if count[card.suit] > count[hand.cards[found[kind]].suit]:
+                found[kind] = index
+    return found
+
+# Load a table (an array of u16 indexed by abstract state)
+def load_table(path: str = TABLE) -> array:
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a policy table")
+    table = array("H", zlib.decompress(data[len(MAGIC):]))
+    if sys.byteorder == "big":
+        table.byteswap()
+    if len(table) != STATES:
+        raise ValueError(f"{path} is for a different abstraction ({len(table)} states, not {STATES})")
+    return table
+
+# Make an empty table (which plays like the built in computer)
+def empty_table() -> array:
+    return array("H", bytes(2 * STATES))
+
+# Write a table out (little endian)
+def save_table(table: array, path: str = TABLE):
+    if sys.byteorder == "big":
+        table = array("H", table)
+        table.byteswap()
+    with open(path, "wb") as f:
+        f.write(MAGIC + zlib.compress(table.tobytes(), 9))
+
+# Plays the kind of card the table prefers most out of those held (or the first valid card with no entry)
+class TablePlayer(Strategy):
+    def __init__(self, table: array = None):
+        self.table = load_table() if table is None else table
+
+    def choose_card(self, game) -> int:
+        found = choices(game)
+        if len(found) < 2:
+            return next(iter(found.values()), None)
+        entry = self.table[state_of(game)]
+        if entry:
+            return next(found[kind] for kind in ORDERS[entry - 1] if kind in found)
+        # No entry: play like the built in computer
+        return game.decks[game.current_player].card_to_play(game.discard)
+
+# Play self-play games with a table, returning {state * ACTIONS + kind: [total advantage, times tried]}
+# At a sample of the turns with a choice, every kind of card held is tried by playing the rest of the game out
+# from a snapshot, and scored by how much better it did than the average of the kinds tried
+def self_play(args) -> dict:
+    table, start, count, sample, jokers = args
+    player = TablePlayer(table)
+    rng = random.Random(start)
+    returns = {}
+    for seed in range(start, start + count):
+        game = Game(jokers, rng=random.Random(seed))
+        game.set_up()
+        game.strategies = [player, player]
+        turns = 0
+        while not game.finished() and turns < MAX_TURNS:
+            found = choices(game) if rng.random() < sample else {}
+            if len(found) > 1:
+                mover = game.current_player
+                results = {}
+                for kind, index in found.items():
+                    marker = game.snapshot()
+                    game.play_card(index)
+                    game.handle_special_card_computer(game.discard.peek())
+                    game.next_player()
+                    play_out(game)
+                    winner = game.winner()
+                    results[kind] = 0.5 if winner is None else float(winner == mover)
+                    game.restore(marker)
+                game.release()
+                mean = sum(results.values()) / len(results)
+                state = state_of(game)
+                for kind, result in results.items():
+                    entry = returns.setdefault(state * ACTIONS + kind, [0.0, 0])
+                    entry[0] += result - mean
+                    entry[1] += 1
+            if game.computer_turn():
+                game.handle_special_card_computer(game.discard.peek())
+            game.next_player()
+            turns += 1
+    return returns
+
+# Train a table by self-play: each generation plays games with the current table, then every state seen often
+# enough ranks the kinds of card by how much better than average they have done so far
+def train(
+    generations: int = 10, games: int = 100000, sample: float = 0.2, min_visits: int = 30, workers: int = None,
+    chunk: int = 5000, seed: int = 0, progress=None
+) -> array:
+    # Only import NumPy when training
+    import numpy as np
+    workers = workers or cpu_count()
+    totals = np.zeros(STATES * ACTIONS)
+    visits = np.zeros(STATES * ACTIONS, dtype=np.int64)
+    table = empty_table()
+    positions = {order: index + 1 for index, order in enumerate(ORDERS)}
+    fallback = np.array([FALLBACK.index(kind) for kind in range(1, ACTIONS)])
+    with Pool(workers) as pool:
+        for generation in range(generations):
+            first = seed + generation * games
+            # Half of the games are played with jokers
+            jobs = [
+                (table, start, min(chunk, first + games - start), sample, number % 2 == 1)
+                for number, start in enumerate(range(first, first + games, chunk))
+            ]
+            for returns in pool.imap_unordered(self_play, jobs):
+                keys = np.fromiter(returns.keys(), dtype=np.int64, count=len(returns))
+                entries = np.array(list(returns.values())).reshape(-1, 2)
+                totals[keys] += entries[:, 0]
+                visits[keys] += entries[:, 1].astype(np.int64)
+            # Rank the kinds of card in each state (those not seen often enough go last)
+            means = np.where(visits >= min_visits, totals / np.maximum(visits, 1), -2.0).reshape(STATES, ACTIONS)
+            means = means[:, 1:]
+            ranked = np.lexsort((np.broadcast_to(fallback, means.shape), -means), axis=1) + 1
+            filled = means.max(axis=1) > -2
+            entries = np.zeros(STATES, dtype=np.uint16)
+            for state in np.flatnonzero(filled):
+                entries[state] = positions[tuple(ranked[state].tolist())]
+            table = array("H", entries.tolist())
+            if progress is not None:
+                progress(generation, int(np.count_nonzero(filled)))
+    return table
+
+# Command line entry point
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m policy", description="Train or check the lookup table player")
+    commands = parser.add_subparsers(dest="command", required=True)
+    training = commands.add_parser("train", help="train a table by self-play")
+    training.add_argument("-g", "--generations", type=int, default=10, help="rounds of self-play")
+    training.add_argument("-n", "--games", type=int, default=100000, help="games played in each round")
+    training.add_argument("-p", "--sample", type=float, default=0.2, help="share of turns where every move is tried")
+    training.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    training.add_argument("-s", "--seed", type=int, default=0, help="seed of the first game")
+    training.add_argument("-o", "--output", default=TABLE, help="where to write the table")
+    comparing = commands.add_parser("compare", help="play the table against the built in computer")
+    comparing.add_argument("-n", "--games", type=int, default=20000, help="games to play")
+    comparing.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    comparing.add_argument("-s", "--seed", type=int, default=1 << 32, help="seed of the first deal")
+    comparing.add_argument("--sprt", action="store_true", help="stop as soon as the result is significant")
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        started = time.perf_counter()
+        table = train(
+            args.generations, args.games, args.sample, workers=args.workers, seed=args.seed,
+            progress=lambda generation, filled: print(f"Generation {generation + 1}: {filled} states filled in"),
+        )
+        save_table(table, args.output)
+        print(f"Wrote {args.output} ({os.path.getsize(args.output)} bytes) in {time.perf_counter() - started:.1f}s")
+        return
+    # Deals the table was trained on are skipped by default
+    from tournament import tournament
+    (pairing,) = tournament(["table", "first"], args.games, workers=args.workers, seed=args.seed, sprt=args.sprt)
+    print(f"Games played:               {pairing.games()}")
+    print(f"Table player win rate:      {pairing.wins / max(pairing.games(), 1):.2%}")
+    print(f"Built in computer win rate: {pairing.losses / max(pairing.games(), 1):.2%}")
+    low, high = pairing.interval()
+    print(f"Elo difference:             {pairing.elo():+.1f} (95% interval {low:+.1f} to {high:+.1f})")
+    print(f"Stronger:                   {pairing.decision}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Retained-mode rendering of the table onto a single canvas
+
+Each card on screen is one canvas image item. When the game changes, rows of cards are diffed against what
+is already shown, so only the items that moved, changed or came and went are touched.
+"""
+
+from tkinter import Canvas
+from images import ImageCache
+
+# Work out where each card in a row goes (relative to the width of the table)
+def spread(count: int) -> list:
+    if count == 0:
+        # Prevent 0 division
+        return []
+    increment = 0.7 / count
+    return [0.2 + increment * i for i in range(count)]
+
+# Work out what needs to change to get from one row of cards to another
+# Rows map a key for each card to its (x, image stem), in the order they are drawn
+def diff_rows(old: dict, new: dict):
+    removed = [key for key in old if key not in new]
+    added = [key for key in new if key not in old]
+    changed = [key for key in new if key in old and old[key] != new[key]]
+    return removed, added, changed
+
+# Draws rows of cards onto a canvas, keeping the items between renders
+class Renderer:
+    def __init__(self, root, images: ImageCache, bg: str, size: tuple = (900, 700)):
+        self.images = images
+        self.size = size
+        self.canvas = Canvas(root, bg=bg, highlightthickness=0)
+        self.canvas.place(relx=0, rely=0, relwidth=1, relheight=1)
+        self.canvas.bind("<Configure>", self.relayout)
+        # Name of row -> (y, {key: (x, stem)}, {key: (item, photo)})
+        self.rows = {}
+
+    # Convert a relative position on the table to canvas coordinates
+    def to_canvas(self, x: float, y: float):
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        # Before the window is shown, fall back to the size that was asked for
+        if width <= 1 or height <= 1:
+            width, height = self.size
+        return x * width, y * height
+
+    # Show a row of cards, only touching the items that differ from the last render
+    # on_click is called with the event and the key of the card clicked
+    def render_row(self, name: str, y: float, row: dict, on_click=None):
+        _, old, items = self.rows.get(name, (y, {}, {}))
+        removed, added, changed = diff_rows(old, row)
+        for key in removed:
+            self.canvas.delete(items.pop(key)[0])
+        for key in changed:
+            item, photo = items[key]
+            x, stem = row[key]
+            self.canvas.coords(item, *self.to_canvas(x, y))
+            if stem != old[key][1]:
+                photo = self.images.get(stem)
+                self.canvas.itemconfigure(item, image=photo)
+                items[key] = (item, photo)
+        for key in added:
+            x, stem = row[key]
+            # Keep the image alive for as long as the item, even if the cache evicts it
+            photo = self.images.get(stem)
+            item = self.canvas.create_image(*self.to_canvas(x, y), image=photo, anchor="center")
+            if on_click is not None:
+                self.canvas.tag_bind(item, "<Button-1>", lambda event, key=key: on_click(event, key))
+            items[key] = (item, photo)
+        # New cards are drawn on top, so restack only if one was added before an existing card
+        keys = list(row)
+        if added and keys[-len(added):] != added:
+            for key in keys:
+                self.canvas.tag_raise(items[key][0])
+        self.rows[name] = (y, dict(row), items)
+
+    # Move every item when the table is resized
+    def relayout(self, _=None):
+        for y, row, items in self.rows.values():
+            for key, (x, _) in row.items():
+                self.canvas.coords(items[key][0], *self.to_canvas(x, y))
+
+    # Remove every card from the table
+    def clear(self):
+        for _, _, items in self.rows.values():
+            for item, _ in items.values():
+                self.canvas.delete(item)
+        self.rows = {}
@@ -0,0 +1,90 @@
+"""
+Declarative rule variants, compiled once per set of rules into lookup tables the game uses every turn
+
+Rules are given as a dict overriding STANDARD, for example {"players": 4} or {"effects": {"JACK": "REVERSE"}}.
+Compiling them builds the effect of every card (by code) and the masks of the cards that can be played on
+every top card, so a variant costs nothing extra per turn.
+"""
+
+from enum import Enum
+from cards import Rank, CARDS
+from masks import ALL_CARDS, RANK_MASKS, SUIT_MASKS, PLAYABLE
+
+# What a card does when it is played
+class Effect(Enum):
+    NONE = 0
+    CHANGE_SUIT = 1
+    PICKUP_2 = 2
+    SKIP = 3
+    REVERSE = 4
+
+# The rules of the game as described in the README
+STANDARD = {
+    # Number of players (the UI only supports two)
+    "players": 2,
+    # Cards dealt to each player
+    "hand_size": 5,
+    # Ranks that can be played onto anything (anything can also be played onto a joker)
+    "wild": ["EIGHT", "JOKER"],
+    # What each rank does when played (other ranks do nothing)
+    "effects": {"EIGHT": "CHANGE_SUIT", "TWO": "PICKUP_2", "ACE": "SKIP", "JOKER": "SKIP"},
+}
+
+# Variants that can be picked by name
+VARIANTS = {
+    "standard": {},
+    "reversing-jacks": {"effects": {"JACK": "REVERSE"}},
+    "four-players": {"players": 4},
+    "seven-cards": {"hand_size": 7},
+}
+
+# Rules compiled into lookup tables
+class Rules:
+    def __init__(self, config: dict = None):
+        config = config or {}
+        unknown = set(config) - set(STANDARD)
+        if unknown:
+            raise ValueError(f"unknown rules: {', '.join(sorted(unknown))}")
+        effects = dict(STANDARD["effects"], **config.get("effects", {}))
+        self.config = {**STANDARD, **config, "effects": effects}
+        self.players = self.config["players"]
+        self.hand_size = self.config["hand_size"]
+        if self.players < 2 or self.hand_size < 1:
+            raise ValueError("there must be at least two players and one card each")
+        # There must be a card left for the discard pile and one to draw, even without jokers
+        if self.players * self.hand_size + 2 > 52:
+            raise ValueError(f"{self.players} hands of {self.hand_size} cards don't fit in the pack")
+        try:
+            wild = [Rank[name] for name in self.config["wild"]]
+            by_rank = {Rank[name]: Effect[effect] for name, effect in effects.items()}
+        except KeyError as error:
+            raise ValueError(f"unknown rank or effect {error}") from None
+        # Effect of each card, by code
+        self.effects = [by_rank.get(card.rank, Effect.NONE) for card in CARDS]
+        # Cards that can be played, by code of the top card then value of the suit to match
+        wild_mask = 0
+        for rank in wild:
+            wild_mask |= RANK_MASKS[rank]
+        self.playable = [
+            [0] + [
+                ALL_CARDS if card.rank is Rank.JOKER else wild_mask | RANK_MASKS[card.rank] | SUIT_MASKS[suit]
+                for suit in SUIT_MASKS
+            ]
+            for card in CARDS
+        ]
+        if self.playable == PLAYABLE:
+            # Share the standard masks
+            self.playable = PLAYABLE
+        # Whether cards play as in the standard two player game (which the searching players assume)
+        self.standard_play = (
+            self.players == 2 and set(wild) == {Rank.EIGHT, Rank.JOKER} and effects == STANDARD["effects"]
+        )
+
+# Make a set of rules from the name of a variant
+def variant(name: str) -> Rules:
+    if name not in VARIANTS:
+        raise ValueError(f"unknown variant {name} (choose from {', '.join(VARIANTS)})")
+    return Rules(VARIANTS[name])
+
+# The standard rules, shared by every game that doesn't ask for a variant
+STANDARD_RULES = Rules()
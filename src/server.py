@@ -0,0 +1,378 @@
+"""
+An asyncio server hosting many tables of the game at once, and a swarm of bots to load test it
+
+Clients talk to the server with one JSON object per line. Cards are named by their image stem (e.g. "AH"
+for the ace of hearts, "1J" for a joker) and suits by name (e.g. "HEARTS"). Requests are:
+
+    {"op": "join", "jokers": false, "vs": "computer"}   join a table against the computer (or "player")
+    {"op": "play", "card": "AH"}                         play a card
+    {"op": "draw"}                                       pick up a card
+    {"op": "suit", "suit": "HEARTS"}                     choose the suit after playing an eight
+
+Every request gets exactly one reply: the state of the table, a message saying the game is over or an error.
+The other player at a table is sent the new state whenever it changes. If a player disconnects, the computer
+takes over their seat where they left off (choosing the suit for an eight they played, if need be).
+
+Run with `python -m server --help` from the src folder
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from cards import Suit, CARDS
+from deck import Deck
+from game import Game
+from events import Scheduler
+from masks import CHOOSABLE_SUITS
+
+# Look up cards and suits by the names used on the wire
+STEMS = {card.stem: card for card in CARDS}
+SUITS = {suit.name: suit for suit in CHOOSABLE_SUITS}
+
+# A game being played at the server, seats hold the session of each player (None for the computer)
+class Table:
+    def __init__(self, jokers: bool, rng=None):
+        self.game = Game(jokers, rng=rng)
+        self.game.set_up()
+        self.seats = [None, None]
+        # Player who has played an eight and must choose a suit
+        self.choosing = None
+        # The computer takes the turns of empty seats straight away
+        self.scheduler = Scheduler(self.game, lambda player: self.seats[player] is None)
+
+    # Get what a player can see of the table
+    def view(self, player: int) -> dict:
+        game = self.game
+        if game.finished():
+            winner = game.winner()
+            return {"op": "over", "won": winner == player}
+        return {
+            "op": "state",
+            "hand": [card.stem for card in game.decks[player].cards],
+            "top": game.discard.peek().stem,
+            "suit": game.discard.top_suit().name,
+            "opponent_cards": len(game.decks[player ^ 1].cards),
+            "stock_cards": len(game.stock.cards),
+            "turn": game.current_player == player and self.choosing is None,
+            "choose_suit": self.choosing == player,
+        }
+
+    # Check it is a player's turn, returning an error message if not
+    def check_turn(self, player: int) -> str:
+        if self.game.finished():
+            return "the game is over"
+        if self.choosing is not None:
+            return "waiting for a suit to be chosen"
+        if self.game.current_player != player:
+            return "it isn't your turn"
+        return None
+
+    # Play a card for a player, returning an error message if it can't be played
+    def play(self, player: int, stem: str) -> str:
+        error = self.check_turn(player)
+        if error:
+            return error
+        card = STEMS.get(stem)
+        hand = self.game.decks[player]
+        if card is None or card not in hand.cards:
+            return f"{stem} isn't in your hand"
+        if not self.game.discard.can_add_to(card):
+            return "card doesn't match, please choose another or pick up"
+        self.game.play_card(hand.cards.index(card))
+        # Handle special cards (like UI.handle_special_card)
+        self.game.handle_special_card(card, lambda: self.wait_for_suit(player))
+        if self.choosing is None:
+            self.end_turn()
+        return None
+
+    # Wait for a player to choose a suit after playing an eight (unless it won them the game)
+    def wait_for_suit(self, player: int):
+        if not self.game.finished():
+            self.choosing = player
+        return None
+
+    # Pick up a card for a player, returning an error message if they can't
+    def draw(self, player: int) -> str:
+        error = self.check_turn(player)
+        if error:
+            return error
+        self.game.draw(self.game.decks[player])
+        self.end_turn()
+        return None
+
+    # Choose the suit after an eight, returning an error message if it can't be chosen
+    def choose_suit(self, player: int, name: str) -> str:
+        if self.choosing != player:
+            return "you don't need to choose a suit"
+        suit = SUITS.get(name)
+        if suit is None:
+            return f"{name} isn't a suit"
+        self.game.change_suit(suit)
+        self.choosing = None
+        self.end_turn()
+        return None
+
+    # Move on to the next player, taking the computer's turns straight away
+    def end_turn(self):
+        self.scheduler.end_turn()
+
+    # Hand a player's seat to the computer, which carries on from wherever they left off
+    def vacate(self, player: int):
+        self.seats[player] = None
+        if self.game.finished():
+            return
+        if self.choosing == player:
+            # They left before choosing the suit for their eight
+            self.choosing = None
+            self.game.change_suit_computer()
+            self.end_turn()
+        elif self.choosing is None:
+            self.scheduler.resume()
+
+# The connection of one player to the server
+class Session:
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.table = None
+        self.player = None
+
+    # Send a message to the player
+    def send(self, message: dict):
+        self.writer.write(json.dumps(message).encode() + b"\n")
+
+    # Handle requests until the player disconnects
+    async def run(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    self.handle(request)
+                except (ValueError, TypeError, AttributeError) as error:
+                    self.send({"op": "error", "message": f"bad request: {error}"})
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.server.leave(self)
+            self.writer.close()
+
+    # Handle one request
+    def handle(self, request: dict):
+        op = request.get("op")
+        if op == "join":
+            self.server.join(self, bool(request.get("jokers", False)), request.get("vs", "computer"))
+            return
+        if self.table is None:
+            self.send({"op": "error", "message": "join a table first"})
+            return
+        match op:
+            case "play":
+                error = self.table.play(self.player, request.get("card"))
+            case "draw":
+                error = self.table.draw(self.player)
+            case "suit":
+                error = self.table.choose_suit(self.player, request.get("suit"))
+            case _:
+                error = f"unknown op {op}"
+        if error:
+            self.send({"op": "error", "message": error})
+            return
+        # Only moves that were made are counted
+        self.server.moves += 1
+        self.server.update(self)
+
+# Hosts every table in one event loop
+class Server:
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.tables = set()
+        # A player waiting for someone to play against
+        self.waiting = {}
+        self.moves = 0
+        self.games = 0
+
+    # Start listening for players (port 0 picks a free port), returning the asyncio server
+    async def start(self, host: str = "127.0.0.1", port: int = 8888):
+        return await asyncio.start_server(self.connect, host, port)
+
+    # Handle a new connection
+    async def connect(self, reader, writer):
+        await Session(self, reader, writer).run()
+
+    # Seat a player at a table
+    def join(self, session: Session, jokers: bool, vs: str):
+        self.leave(session)
+        if vs == "player":
+            opponent = self.waiting.pop(jokers, None)
+            if opponent is None:
+                self.waiting[jokers] = session
+                session.send({"op": "waiting"})
+                return
+            table = Table(jokers, random.Random(self.rng.random()))
+            self.seat(opponent, table, 0)
+            self.seat(session, table, 1)
+            self.tables.add(table)
+            opponent.send(table.view(0))
+            session.send(table.view(1))
+            return
+        table = Table(jokers, random.Random(self.rng.random()))
+        self.seat(session, table, 0)
+        self.tables.add(table)
+        session.send(table.view(0))
+
+    # Give a player a seat
+    def seat(self, session: Session, table: Table, player: int):
+        table.seats[player] = session
+        session.table = table
+        session.player = player
+
+    # Reply to a move, and let the other player know what happened
+    def update(self, session: Session):
+        table = session.table
+        session.send(table.view(session.player))
+        other = table.seats[session.player ^ 1]
+        if other is not None:
+            other.send(table.view(other.player))
+        if table.game.finished():
+            self.finish(table)
+
+    # Close a table once its game is over
+    def finish(self, table: Table):
+        self.games += 1
+        self.tables.discard(table)
+        for seated in table.seats:
+            if seated is not None:
+                seated.table = None
+
+    # Remove a player from their table (the computer takes over their seat, and the other player is told)
+    def leave(self, session: Session):
+        for jokers, waiting in list(self.waiting.items()):
+            if waiting is session:
+                del self.waiting[jokers]
+        table = session.table
+        if table is None:
+            return
+        session.table = None
+        other = table.seats[session.player ^ 1]
+        if other is None:
+            # Nobody is left to play
+            table.seats[session.player] = None
+            self.tables.discard(table)
+            return
+        table.vacate(session.player)
+        other.send(table.view(other.player))
+        if table.game.finished():
+            self.finish(table)
+
+# A bot that connects to the server and plays like the built in computer, timing every move
+class Bot:
+    def __init__(self, host: str, port: int, games: int, jokers: bool = False):
+        self.host = host
+        self.port = port
+        self.games = games
+        self.jokers = jokers
+        self.latencies = []
+        self.won = 0
+
+    # Pick the reply to a state of the table
+    def respond(self, state: dict) -> dict:
+        hand = Deck([STEMS[stem] for stem in state["hand"]])
+        if state["choose_suit"]:
+            count = hand.suit_counts()
+            return {"op": "suit", "suit": max(CHOOSABLE_SUITS, key=lambda suit: count[suit]).name}
+        discard = Deck([STEMS[state["top"]]])
+        discard.suit = Suit[state["suit"]]
+        index = hand.card_to_play(discard)
+        if index is None:
+            return {"op": "draw"}
+        return {"op": "play", "card": hand.cards[index].stem}
+
+    # Send a request and wait for its reply
+    async def request(self, reader, writer, message: dict) -> dict:
+        started = time.perf_counter()
+        writer.write(json.dumps(message).encode() + b"\n")
+        reply = json.loads(await reader.readline())
+        self.latencies.append(time.perf_counter() - started)
+        return reply
+
+    # Play every game
+    async def run(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        for _ in range(self.games):
+            reply = await self.request(reader, writer, {"op": "join", "jokers": self.jokers})
+            while reply["op"] == "state":
+                reply = await self.request(reader, writer, self.respond(reply))
+            if reply["op"] == "error":
+                raise RuntimeError(reply["message"])
+            self.won += reply["won"]
+        writer.close()
+        await writer.wait_closed()
+
+# Run a swarm of bots against a server (starting one in this process if no port is given)
+async def swarm(bots: int, games: int, host: str = "127.0.0.1", port: int = None, jokers: bool = False) -> dict:
+    listening = None
+    if port is None:
+        listening = await Server().start(host, 0)
+        port = listening.sockets[0].getsockname()[1]
+    players = [Bot(host, port, games, jokers) for _ in range(bots)]
+    started = time.perf_counter()
+    await asyncio.gather(*(bot.run() for bot in players))
+    seconds = time.perf_counter() - started
+    if listening is not None:
+        listening.close()
+        await listening.wait_closed()
+    latencies = sorted(latency for bot in players for latency in bot.latencies)
+    return {
+        "games": bots * games,
+        "won": sum(bot.won for bot in players),
+        "moves": len(latencies),
+        "seconds": seconds,
+        "moves_per_second": len(latencies) / seconds,
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+# Serve forever
+async def serve(host: str, port: int):
+    listening = await Server().start(host, port)
+    print(f"Serving on {host}:{port}")
+    async with listening:
+        await listening.serve_forever()
+
+# Command line entry point
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m server", description="Host games of crazy eights")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serving = commands.add_parser("serve", help="host tables until interrupted")
+    serving.add_argument("--host", default="127.0.0.1")
+    serving.add_argument("--port", type=int, default=8888)
+    swarming = commands.add_parser("swarm", help="load test a server with bots playing the computer")
+    swarming.add_argument("-b", "--bots", type=int, default=100, help="number of bots connected at once")
+    swarming.add_argument("-n", "--games", type=int, default=10, help="games played by each bot")
+    swarming.add_argument("-j", "--jokers", action="store_true", help="add jokers to the pack")
+    swarming.add_argument("--host", default="127.0.0.1")
+    swarming.add_argument("--port", type=int, default=None, help="server to test (default: start one)")
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return
+    results = asyncio.run(swarm(args.bots, args.games, args.host, args.port, args.jokers))
+    print(f"Games played:      {results['games']}")
+    print(f"Bot win rate:      {results['won'] / results['games']:.2%}")
+    print(f"Moves:             {results['moves']}")
+    print(f"Moves per second:  {results['moves_per_second']:.0f}")
+    print(f"p50 move latency:  {results['p50'] * 1000:.2f}ms")
+    print(f"p99 move latency:  {results['p99'] * 1000:.2f}ms")
+
+if __name__ == "__main__":
+    main()
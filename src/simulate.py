@@ -0,0 +1,162 @@
+"""
+Headless computer-vs-computer simulation of the game, for evaluating rules and strategies at scale
+
+Run with `python -m simulate --help` from the src folder
+"""
+
+import argparse
+import random
+import time
+from multiprocessing import Pool, cpu_count
+from game import Game
+from rules import Rules, VARIANTS, variant
+
+# Games that go on for longer than this are counted as draws
+# (e.g. every card is in a hand and neither player can play)
+MAX_TURNS = 1000
+
+# Aggregated results from a batch of games
+class Results:
+    def __init__(self, players: int = 2):
+        self.games = 0
+        self.wins = [0] * players
+        self.draws = 0
+        self.turns = 0
+        self.recycles = 0
+        self.seconds = 0.0
+
+    # Record the outcome of a single game
+    def add(self, winner, turns: int, recycles: int):
+        self.games += 1
+        if winner is None:
+            self.draws += 1
+        else:
+            self.wins[winner] += 1
+        self.turns += turns
+        self.recycles += recycles
+
+    # Combine the results of another batch into this one
+    def merge(self, other):
+        self.games += other.games
+        self.wins = [ours + theirs for ours, theirs in zip(self.wins, other.wins)]
+        self.draws += other.draws
+        self.turns += other.turns
+        self.recycles += other.recycles
+
+    # Nice printing of results
+    def __str__(self):
+        games = max(self.games, 1)
+        rate = self.games / self.seconds if self.seconds > 0 else 0.0
+        return "\n".join([
+            f"Games played:      {self.games}",
+            f"Games per second:  {rate:.0f}",
+            *(f"Player {player} win rate: {wins / games:.2%}" for player, wins in enumerate(self.wins)),
+            f"Draw rate:         {self.draws / games:.2%}",
+            f"Average turns:     {self.turns / games:.2f}",
+            f"Average recycles:  {self.recycles / games:.3f}",
+        ])
+
+# Play a single seeded game, returning the winner (or None for a draw), turns taken and recycles
+def play_game(seed: int, jokers: bool, bitset: bool = False, rules: Rules = None):
+    game = Game(jokers, bitset, rng=random.Random(seed), rules=rules)
+    game.set_up()
+    turns = play_out(game)
+    return game.winner(), turns, game.recycles
+
+# Let the computer play both sides of a game until it ends, returning the number of turns taken
+def play_out(game: Game) -> int:
+    turns = 0
+    while not game.finished() and turns < MAX_TURNS:
+        if game.computer_turn():
+            game.handle_special_card_computer(game.discard.peek())
+        game.next_player()
+        turns += 1
+    return turns
+
+# Play a contiguous range of seeds (run inside a worker process)
+def run_chunk(args) -> Results:
+    start, count, jokers, bitset, rules = args
+    # Rules are passed to workers by the name of their variant, and compiled once per chunk
+    rules = variant(rules)
+    results = Results(rules.players)
+    for seed in range(start, start + count):
+        results.add(*play_game(seed, jokers, bitset, rules))
+    return results
+
+# Play many games across a pool of worker processes
+def simulate(
+    games: int, seed: int = 0, jokers: bool = False, workers: int = None, chunk: int = 1000,
+    bitset: bool = False, vectorized: bool = False, rules: str = "standard", sink=None
+):
+    workers = workers or cpu_count()
+    worker = run_chunk
+    if sink is not None:
+        # Workers send back a record of every game for the sink (see stats.py), instead of adding them up
+        if vectorized:
+            raise ValueError("the vectorized engine doesn't keep records of its games")
+        from stats import record_chunk
+        worker = record_chunk
+    if vectorized:
+        if rules != "standard":
+            raise ValueError("the vectorized engine only plays the standard rules")
+        # Only import NumPy when it is needed
+        import vectorized as engine
+        worker = engine.run_chunk
+    chunks = [
+        (start, min(chunk, seed + games - start), jokers, bitset, rules)
+        for start in range(seed, seed + games, chunk)
+    ]
+    results = Results(variant(rules).players)
+    # Partial results are added to the results, or records to the sink
+    add = results.merge if sink is None else sink.add
+    started = time.perf_counter()
+    if workers == 1:
+        for args in chunks:
+            add(worker(args))
+    else:
+        with Pool(workers) as pool:
+            for partial in pool.imap_unordered(worker, chunks):
+                add(partial)
+    if sink is not None:
+        sink.close()
+        results = sink.results()
+    results.seconds = time.perf_counter() - started
+    return results
+
+# Command line entry point
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m simulate", description="Simulate games of crazy eights")
+    parser.add_argument("-n", "--games", type=int, default=10000, help="number of games to play")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("-c", "--chunk", type=int, default=1000, help="games handed to a worker at a time")
+    parser.add_argument("-j", "--jokers", action="store_true", help="add jokers to the pack")
+    parser.add_argument("-b", "--bitset", action="store_true", help="use bitset-backed hands")
+    parser.add_argument(
+        "-v", "--vectorized", action="store_true",
+        help="play each chunk of games in lockstep with NumPy (use a large chunk, e.g. 10000)"
+    )
+    parser.add_argument("-r", "--rules", choices=VARIANTS, default="standard", help="variant of the rules to play")
+    parser.add_argument(
+        "--records", metavar="PATH", default=None,
+        help="append a record of every game to PATH (summarise it later with `python -m stats PATH`)"
+    )
+    args = parser.parse_args(argv)
+    if args.vectorized and args.rules != "standard":
+        parser.error("the vectorized engine only plays the standard rules")
+    if args.vectorized and args.records:
+        parser.error("the vectorized engine doesn't keep records of its games")
+    sink = None
+    if args.records:
+        # Only import NumPy when it is needed
+        from stats import StatsSink
+        sink = StatsSink(variant(args.rules).players, args.records)
+    results = simulate(
+        args.games, args.seed, args.jokers, args.workers, args.chunk, args.bitset, args.vectorized, args.rules, sink
+    )
+    print(results)
+    if sink is not None:
+        print(sink)
+
+if __name__ == "__main__":
+    main()
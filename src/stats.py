@@ -0,0 +1,295 @@
+"""
+Streaming statistics over the games of large simulations, in constant memory
+
+Workers play games into compact columnar batches of records (one row per game), which a StatsSink folds into
+histograms as they arrive. Every statistic recorded is a whole number bounded by the length of a game, so the
+histograms give exact means, variances and quantiles, and sinks can be merged exactly.
+
+The raw records can also be appended to a file in chunks, to be mapped straight into NumPy later:
+
+    b"C8S\\x01", u16 players, u16 0                          header
+    u32 rows, u32 0, then each column in turn (see columns)   a chunk, padded to a multiple of 8 bytes
+
+with every number little endian. A chunk cut short (e.g. by the run being killed) is ignored when read.
+
+Run with `python -m stats --help` from the src folder
+"""
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import numpy as np
+from game import Game
+from rules import variant
+from simulate import MAX_TURNS, Results, play_out
+
+# The first bytes of every records file (the last is the format version)
+MAGIC = b"C8S\x01"
+
+# Chunks of records are held in memory until they have this many rows, then written out
+CHUNK_ROWS = 1 << 16
+
+# Statistics kept as histograms, and how many values each can take (larger values go in the last bucket)
+HISTOGRAMS = {
+    "turns": MAX_TURNS + 1,
+    "specials": MAX_TURNS + 1,
+    "recycles": MAX_TURNS + 1,
+    # Cards left in the hands of everyone but the winner
+    "cards_left": 55,
+}
+
+# Names and types of the columns of records for some number of players (largest types first, to keep alignment)
+def columns(players: int) -> list:
+    return [
+        ("seed", np.dtype("<i8")),
+        ("turns", np.dtype("<i2")),
+        ("specials", np.dtype("<i2")),
+        ("recycles", np.dtype("<i2")),
+        # -1 for a draw
+        ("winner", np.dtype("<i1")),
+    ] + [(f"hand_{player}", np.dtype("<i1")) for player in range(players)]
+
+# Make a batch of records with room for some games
+def empty_batch(rows: int, players: int) -> dict:
+    return {name: np.zeros(rows, dtype) for name, dtype in columns(players)}
+
+# Number of players in a batch of records
+def players_of(batch: dict) -> int:
+    return sum(name.startswith("hand_") for name in batch)
+
+# Play a contiguous range of seeds into a batch of records (run inside a worker process)
+# Rules are given by the name of their variant, as in simulate.run_chunk
+def record_chunk(args) -> dict:
+    start, count, jokers, bitset, rules = args
+    rules = variant(rules)
+    batch = empty_batch(count, rules.players)
+    hands = [batch[f"hand_{player}"] for player in range(rules.players)]
+    for row, seed in enumerate(range(start, start + count)):
+        game = Game(jokers, bitset, rng=random.Random(seed), rules=rules)
+        game.set_up()
+        turns = play_out(game)
+        winner = game.winner()
+        batch["seed"][row] = seed
+        batch["turns"][row] = turns
+        batch["specials"][row] = game.specials
+        batch["recycles"][row] = game.recycles
+        batch["winner"][row] = -1 if winner is None else winner
+        for hand, deck in zip(hands, game.decks):
+            hand[row] = len(deck.cards)
+    return batch
+
+# Appends chunks of records to a file
+class RecordWriter:
+    def __init__(self, path: str, players: int, chunk_rows: int = CHUNK_ROWS):
+        self.path = path
+        self.players = players
+        self.chunk_rows = chunk_rows
+        # Batches waiting to be written, and how many rows they hold
+        self.pending = []
+        self.rows = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "r+b") as f:
+                found = read_header(f.read(8), path)
+                if found != players:
+                    raise ValueError(f"{path} holds games of {found} players, not {players}")
+                # Drop a chunk that was cut short, so new chunks follow on from the last whole one
+                end = 8
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for offset, rows in chunk_offsets(data, players):
+                        end = offset + chunk_size(rows, players)
+                f.truncate(end)
+        else:
+            with open(path, "wb") as f:
+                f.write(MAGIC + struct.pack("<HH", players, 0))
+
+    # Add a batch of records, writing a chunk out once enough are waiting
+    def add(self, batch: dict):
+        self.pending.append(batch)
+        self.rows += len(batch["seed"])
+        if self.rows >= self.chunk_rows:
+            self.flush()
+
+    # Write every waiting record out as one chunk
+    def flush(self):
+        if not self.rows:
+            return
+        data = bytearray(struct.pack("<II", self.rows, 0))
+        for name, dtype in columns(self.players):
+            data += np.concatenate([batch[name] for batch in self.pending]).astype(dtype, copy=False).tobytes()
+        data += bytes(-len(data) % 8)
+        with open(self.path, "ab") as f:
+            f.write(data)
+        self.pending = []
+        self.rows = 0
+
+# Check the header of a records file, returning the number of players
+def read_header(header: bytes, path: str) -> int:
+    if header[:len(MAGIC)] != MAGIC or len(header) < 8:
+        raise ValueError(f"{path} is not a records file")
+    return struct.unpack("<H", header[4:6])[0]
+
+# Size of a chunk of records in a file, including its padding
+def chunk_size(rows: int, players: int) -> int:
+    size = 8 + rows * sum(dtype.itemsize for _, dtype in columns(players))
+    return size + (-size % 8)
+
+# Find the (offset, rows) of every whole chunk in the data of a records file
+def chunk_offsets(data, players: int):
+    offset = 8
+    while offset + 8 <= len(data):
+        rows = struct.unpack_from("<I", data, offset)[0]
+        size = chunk_size(rows, players)
+        if offset + size > len(data):
+            # The last chunk was cut short
+            return
+        yield offset, rows
+        offset += size
+
+# Map a records file, yielding each chunk as a batch of arrays viewing the file (nothing is parsed or copied)
+def read_chunks(path: str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < 8:
+            raise ValueError(f"{path} is not a records file")
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    players = read_header(data[:8], path)
+    for offset, rows in chunk_offsets(data, players):
+        batch = {}
+        position = offset + 8
+        for name, dtype in columns(players):
+            batch[name] = np.frombuffer(data, dtype, rows, position)
+            position += rows * dtype.itemsize
+        yield batch
+
+# Read every record in a file, one array per column
+def read_records(path: str) -> dict:
+    chunks = list(read_chunks(path))
+    if not chunks:
+        with open(path, "rb") as f:
+            return empty_batch(0, read_header(f.read(8), path))
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+# Aggregates batches of records into histograms (and optionally writes them out), in constant memory
+class StatsSink:
+    def __init__(self, players: int = 2, path: str = None, chunk_rows: int = CHUNK_ROWS):
+        self.players = players
+        self.games = 0
+        self.wins = [0] * players
+        self.draws = 0
+        self.histograms = {name: np.zeros(size, np.int64) for name, size in HISTOGRAMS.items()}
+        self.writer = None if path is None else RecordWriter(path, players, chunk_rows)
+
+    # Fold a batch of records in
+    def add(self, batch: dict):
+        winners = batch["winner"].astype(np.int64)
+        self.games += len(winners)
+        wins = np.bincount(winners[winners >= 0], minlength=self.players)
+        self.wins = [ours + int(theirs) for ours, theirs in zip(self.wins, wins)]
+        self.draws += int((winners < 0).sum())
+        hands = np.stack([batch[f"hand_{player}"] for player in range(self.players)]).astype(np.int64)
+        values = {
+            "turns": batch["turns"],
+            "specials": batch["specials"],
+            "recycles": batch["recycles"],
+            "cards_left": hands.sum(axis=0),
+        }
+        for name, histogram in self.histograms.items():
+            found = np.minimum(values[name].astype(np.int64), len(histogram) - 1)
+            histogram += np.bincount(found, minlength=len(histogram))
+        if self.writer is not None:
+            self.writer.add(batch)
+
+    # Combine the statistics of another sink into this one (exactly, in any order)
+    def merge(self, other):
+        self.games += other.games
+        self.wins = [ours + theirs for ours, theirs in zip(self.wins, other.wins)]
+        self.draws += other.draws
+        for name, histogram in self.histograms.items():
+            histogram += other.histograms[name]
+
+    # Sum of a statistic over every game
+    def total(self, name: str) -> int:
+        histogram = self.histograms[name]
+        return int(np.dot(np.arange(len(histogram)), histogram))
+
+    # Average of a statistic
+    def mean(self, name: str) -> float:
+        return self.total(name) / self.games if self.games else 0.0
+
+    # Sample variance of a statistic (worked out from whole numbers, so it doesn't lose precision)
+    def variance(self, name: str) -> float:
+        if self.games < 2:
+            return 0.0
+        histogram = self.histograms[name]
+        values = np.arange(len(histogram))
+        total = self.total(name)
+        squares = int(np.dot(values * values, histogram))
+        return (squares * self.games - total * total) / (self.games * (self.games - 1))
+
+    # Smallest value of a statistic that at least a fraction of games are at or below
+    def quantile(self, name: str, fraction: float) -> int:
+        if not self.games:
+            return 0
+        counts = np.cumsum(self.histograms[name])
+        return int(np.searchsorted(counts, max(fraction * self.games, 1)))
+
+    # Summarise in the same form as the simulator
+    def results(self) -> Results:
+        results = Results(self.players)
+        results.games = self.games
+        results.wins = list(self.wins)
+        results.draws = self.draws
+        results.turns = self.total("turns")
+        results.recycles = self.total("recycles")
+        return results
+
+    # Save the statistics (not the records) to a file, replacing it in one step so it is never half written
+    def save(self, path: str):
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, counts=np.array([self.games, self.draws] + self.wins, np.int64), **self.histograms)
+        os.replace(path + ".tmp", path)
+
+    # Load statistics saved by save
+    def load(path: str):
+        with np.load(path) as saved:
+            counts = [int(count) for count in saved["counts"]]
+            sink = StatsSink(len(counts) - 2)
+            sink.games, sink.draws = counts[:2]
+            sink.wins = counts[2:]
+            for name in sink.histograms:
+                sink.histograms[name] = saved[name].copy()
+        return sink
+
+    # Write out any records still waiting
+    def close(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    # Nice printing of the statistics
+    def __str__(self):
+        games = max(self.games, 1)
+        lines = [f"Games played:      {self.games}"]
+        lines += [f"Player {player} win rate: {wins / games:.2%}" for player, wins in enumerate(self.wins)]
+        lines.append(f"Draw rate:         {self.draws / games:.2%}")
+        for name in self.histograms:
+            quantiles = " ".join(f"p{round(q * 100)}={self.quantile(name, q)}" for q in (0.5, 0.9, 0.99))
+            lines.append(
+                f"{name.replace('_', ' ').capitalize() + ':':18} mean {self.mean(name):7.2f}  "
+                f"sd {self.variance(name) ** 0.5:6.2f}  {quantiles}"
+            )
+        return "\n".join(lines)
+
+# Command line entry point
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m stats", description="Summarise a file of game records")
+    parser.add_argument("path", help="records written by `python -m simulate --records`")
+    args = parser.parse_args(argv)
+    sink = None
+    for chunk in read_chunks(args.path):
+        sink = sink or StatsSink(players_of(chunk))
+        sink.add(chunk)
+    print(sink or "No games recorded")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Strategies the computer can play with, choosing the card to play and the suit to change to
+
+Give one to a game with `game.strategies[player] = make_strategy("random")`. Any object with the methods of
+Strategy will do, strategies are made by name so they can be created inside other processes.
+"""
+
+import random
+from cards import Suit, Rank
+from masks import CHOOSABLE_SUITS
+
+# What the computer is asked to decide
+class Strategy:
+    # Get the index of the card to play from the current player's hand (or None to pick up)
+    def choose_card(self, game) -> int:
+        raise NotImplementedError
+
+    # Get the suit to change to after playing an eight (by default the suit held the most of)
+    def choose_suit(self, game) -> Suit:
+        count = game.decks[game.current_player].suit_counts()
+        return max(CHOOSABLE_SUITS, key=lambda suit: count[suit])
+
+    # Free anything held by the strategy (e.g. worker processes)
+    def close(self):
+        pass
+
+# The built in computer: the first valid card in the hand
+class FirstValid(Strategy):
+    def choose_card(self, game) -> int:
+        return game.decks[game.current_player].card_to_play(game.discard)
+
+# Any valid card, picked at random
+class RandomValid(Strategy):
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def choose_card(self, game) -> int:
+        discard = game.discard
+        valid = [
+            index for index, card in enumerate(game.decks[game.current_player].cards)
+            if discard.can_add_to(card)
+        ]
+        return self.rng.choice(valid) if valid else None
+
+    def choose_suit(self, game) -> Suit:
+        return self.rng.choice(CHOOSABLE_SUITS)
+
+# Hold on to eights and jokers (which can always be played) until nothing else can be
+class SaveWildcards(Strategy):
+    def choose_card(self, game) -> int:
+        discard = game.discard
+        wild = None
+        for index, card in enumerate(game.decks[game.current_player].cards):
+            if not discard.can_add_to(card):
+                continue
+            if card.rank is not Rank.EIGHT and card.rank is not Rank.JOKER:
+                return index
+            if wild is None:
+                wild = index
+        return wild
+
+# Names of the strategies that can be made
+NAMES = ["first", "random", "save-wildcards", "counting", "table", "endgame", "mcts"]
+
+# Make a strategy by name (the seed makes random choices repeatable)
+def make_strategy(name: str, seed=None) -> Strategy:
+    match name:
+        case "first":
+            return FirstValid()
+        case "random":
+            return RandomValid(seed)
+        case "save-wildcards":
+            return SaveWildcards()
+        case "counting":
+            from beliefs import CountingPlayer
+            return CountingPlayer()
+        case "table":
+            from policy import TablePlayer
+            return TablePlayer()
+        case "endgame":
+            from endgame import EndgamePlayer
+            from beliefs import CountingPlayer
+            return EndgamePlayer(fallback=CountingPlayer())
+        case "mcts":
+            from mcts import MCTSPlayer
+            return MCTSPlayer(budget=0.01, seed=seed)
+    raise ValueError(f"unknown strategy {name} (choose from {', '.join(NAMES)})")
@@ -3,9 +3,35 @@ Automated tests for the card game to squash out any bugs and provide peace of mi
 """
 
 from cards import Card, Suit, Rank
-from deck import Deck
+from deck import Deck, BitDeck, Pile
 from game import Game
+from rules import Effect, Rules, STANDARD_RULES, variant
+from events import EventKind, Pace, Scheduler
+from stats import StatsSink, read_chunks, read_records, record_chunk
+from jobs import Job, shard_path
+from masks import PLAYABLE, SUIT_MASKS, mask_of
+from simulate import play_game, play_out, simulate
+from vectorized import VectorGames
+from images import ImageCache, DIM
+from renderer import diff_rows, spread
+from mcts import InfoSet, MCTSPlayer, search
+from endgame import EndgamePlayer, Solver, positions
+from strategies import make_strategy
+from beliefs import Beliefs, CountingPlayer
+from policy import STATES, TablePlayer, empty_table, load_table, save_table, state_of, train
+from tournament import Pairing, elo_from_score, expected_score, play_pairs, ratings, tournament
+from gamelog import GameLog, ReplayError, replay
+from instrument import Tracer, attach_game
+from server import Server, Session, Table, swarm
+from bundle import Bundle, build
+from benchmark import REFERENCE, engine_benchmarks, measure, run, summarise, regressions, untracked
+import asyncio
+import json
 import os
+import random
+import threading
+import time
+import numpy as np
 
 # Test cards
 def test_cards():
@@ -28,6 +54,22 @@ def test_cards():
     data = f.read()
     f.close()
     assert card.get_image() == data
+    # Test cards are interned and immutable
+    assert Card(Suit.CLUBS, Rank.FIVE) is Card(Suit.CLUBS, Rank.FIVE)
+    assert Card(Suit.JOKER, Rank.JOKER, 1) is not Card(Suit.JOKER, Rank.JOKER)
+    assert len({card.code for card in Deck.full_deck(True).cards}) == 54
+    # Suits and ranks that don't make a card are rejected
+    for suit, rank, copy in [(Suit.HEARTS, Rank.JOKER, 0), (Suit.JOKER, Rank.ACE, 0), (Suit.JOKER, Rank.JOKER, 2)]:
+        try:
+            Card(suit, rank, copy)
+            assert False
+        except ValueError:
+            pass
+    try:
+        card.suit = Suit.HEARTS
+        assert False
+    except AttributeError:
+        pass
 
 # Test decks
 def test_decks():
@@ -58,6 +100,14 @@ def test_decks():
     assert hand.card_to_play(deck) == 1
     hand = Deck([Card(Suit.HEARTS, Rank.KING), Card(Suit.CLUBS, Rank.FOUR)])
     assert hand.card_to_play(deck) == None
+    # Test changing the suit with an eight
+    deck.push(Card(Suit.CLUBS, Rank.EIGHT))
+    deck.suit = Suit.HEARTS
+    assert deck.can_add_to(Card(Suit.HEARTS, Rank.FIVE))
+    assert not deck.can_add_to(Card(Suit.CLUBS, Rank.FIVE))
+    assert deck.top() is Card(Suit.HEARTS, Rank.EIGHT)
+    deck.push(Card(Suit.HEARTS, Rank.FIVE))
+    assert deck.suit is None
     # Test shuffling
     deck = Deck.full_deck(True)
     deck.shuffle()
@@ -66,6 +116,41 @@ def test_decks():
     deck = Deck.full_deck(True)
     assert deck.pop() == Card(Suit.CLUBS, Rank.KING)
 
+def test_bitdeck():
+    discard = Deck([Card(Suit.SPADES, Rank.TEN)])
+    hand = BitDeck([Card(Suit.HEARTS, Rank.KING), Card(Suit.CLUBS, Rank.TEN), Card(Suit.SPADES, Rank.TWO)])
+    # Legal plays agree with the card by card check
+    assert hand.legal_count(discard) == 2
+    assert hand.card_to_play(discard) == 1
+    assert discard.can_add_to(hand.cards[hand.card_to_play(discard)])
+    # Every legal move is found from the index, lowest code first, agreeing with a scan of the hand
+    assert hand.legal_moves(discard) == [Card(Suit.SPADES, Rank.TWO), Card(Suit.CLUBS, Rank.TEN)]
+    assert Deck(hand.cards[:]).legal_moves(discard) == [Card(Suit.CLUBS, Rank.TEN), Card(Suit.SPADES, Rank.TWO)]
+    # The mask follows the cards in and out of the hand
+    hand.remove(2)
+    hand.remove(1)
+    assert hand.card_to_play(discard) is None
+    hand.push(Card(Suit.DIAMONDS, Rank.EIGHT))
+    assert hand.card_to_play(discard) == 1
+    # Suit changes from eights are respected
+    discard.push(Card(Suit.CLUBS, Rank.EIGHT))
+    discard.suit = Suit.HEARTS
+    assert hand.legal_count(discard) == 2
+    assert hand.suit_counts() == Deck(hand.cards[:]).suit_counts()
+    # Every table entry agrees with can_add_to
+    for top in Deck.full_deck(True).cards:
+        for card in Deck.full_deck(True).cards:
+            pile = Deck([top])
+            assert BitDeck([card]).legal_count(pile) == pile.can_add_to(card)
+    # The computer makes exactly the same moves whichever way its hands are stored
+    for seed in range(20):
+        logs = [GameLog(), GameLog()]
+        for bitset, log in zip((False, True), logs):
+            game = Game(True, bitset, rng=random.Random(seed), log=log)
+            game.set_up()
+            play_out(game)
+        assert logs[0].data == logs[1].data
+
 def test_game():
     game = Game(False)
     # Test finishing condition
@@ -78,3 +163,677 @@ def test_game():
     assert len(game.stock.cards) == 41
     # Test finishing condition
     assert not game.finished()
+    # Test the computer picks the suit it has the most of
+    game.decks[1] = BitDeck([Card(Suit.CLUBS, Rank.TWO), Card(Suit.CLUBS, Rank.SIX), Card(Suit.HEARTS, Rank.SIX)])
+    game.current_player = 1
+    game.discard.push(Card(Suit.SPADES, Rank.EIGHT))
+    game.change_suit_computer()
+    assert game.discard.top_suit() == Suit.CLUBS
+    # Test the stock is only recycled once it runs out, keeping the eight's suit on top
+    game.stock = Pile([Card(Suit.HEARTS, Rank.NINE)])
+    game.discard = Pile([Card(Suit.SPADES, Rank.FOUR), Card(Suit.SPADES, Rank.FIVE), Card(Suit.SPADES, Rank.EIGHT)])
+    game.discard.suit = Suit.CLUBS
+    assert game.draw(game.decks[0]) == Card(Suit.HEARTS, Rank.NINE)
+    assert game.recycles == 0
+    assert game.draw(game.decks[0]) == Card(Suit.SPADES, Rank.FOUR)
+    assert game.recycles == 1
+    assert game.stock == Deck([Card(Suit.SPADES, Rank.FIVE)])
+    assert game.discard == Deck([Card(Suit.SPADES, Rank.EIGHT)])
+    assert game.discard.top_suit() == Suit.CLUBS
+    # Test nothing is drawn when every card is in a hand
+    game.draw(game.decks[0])
+    assert game.draw(game.decks[0]) is None
+
+def test_rules():
+    # The standard rules compile to the standard masks
+    assert STANDARD_RULES.playable is PLAYABLE
+    assert STANDARD_RULES.effects[Card(Suit.SPADES, Rank.EIGHT).code] is Effect.CHANGE_SUIT
+    assert STANDARD_RULES.effects[Card(Suit.SPADES, Rank.JACK).code] is Effect.NONE
+    # Bad configs are rejected
+    for config in [{"colour": 1}, {"players": 1}, {"players": 8, "hand_size": 7}, {"effects": {"JACK": "FLY"}}]:
+        try:
+            Rules(config)
+            assert False, config
+        except ValueError:
+            pass
+    # More players and bigger hands are dealt out
+    game = Game(False, rules=Rules({"players": 4, "hand_size": 7}))
+    game.set_up()
+    assert [len(deck.cards) for deck in game.decks] == [7] * 4
+    assert len(game.stock.cards) == 52 - 28 - 1
+    # Jacks reverse the direction of play, which comes back round the other way (and can be undone)
+    game = Game(False, rules=Rules({"players": 4, "effects": {"JACK": "REVERSE"}}))
+    game.set_up()
+    marker = game.snapshot()
+    game.discard.push(Card(Suit.SPADES, Rank.JACK))
+    game.handle_special_card(game.discard.peek(), None)
+    assert game.direction == -1
+    game.next_player()
+    assert game.current_player == 3
+    game.restore(marker)
+    assert game.direction == 1 and game.current_player == 0
+    # With two players a reverse skips the other player instead
+    game = Game(False, rules=variant("reversing-jacks"))
+    game.set_up()
+    game.discard.push(Card(Suit.SPADES, Rank.JACK))
+    game.handle_special_card(game.discard.peek(), None)
+    game.next_player()
+    assert game.current_player == 0
+    # Variants play out to the end, with every player able to win
+    results = simulate(200, seed=0, workers=1, chunk=64, rules="four-players")
+    assert len(results.wins) == 4 and sum(results.wins) + results.draws == 200
+
+def test_events():
+    game = Game(True, rng=random.Random(3))
+    game.set_up()
+    seen = []
+    unsubscribe = game.subscribe(seen.append)
+    drawn = []
+    game.subscribe(lambda event: drawn.append(event.card), EventKind.DREW)
+    turns = play_out(game)
+    kinds = [event.kind for event in seen]
+    # Every turn and card is announced, ending with the winner
+    assert kinds.count(EventKind.NEXT_PLAYER) == turns + kinds.count(EventKind.SKIPPED)
+    assert kinds.count(EventKind.PLAYED) + kinds.count(EventKind.DREW) >= turns
+    over = [event.player for event in seen if event.kind is EventKind.GAME_OVER]
+    assert over == [game.winner()]
+    assert drawn == [event.card for event in seen if event.kind is EventKind.DREW]
+    unsubscribe()
+    game.next_player()
+    assert seen[-1].kind is EventKind.NEXT_PLAYER and len(seen) == len(kinds)
+    # Instant turns run until it is a person's go
+    game = Game(False, rng=random.Random(4))
+    game.set_up()
+    scheduler = Scheduler(game, lambda player: player == 1)
+    scheduler.end_turn()
+    assert game.current_player == 0 or game.finished()
+    # Other paces schedule one turn at a time on an event loop
+    waiting = []
+    game = Game(False, rng=random.Random(4))
+    game.set_up()
+    scheduler = Scheduler(game, lambda player: True, Pace.ANIMATED, lambda wait, turn: waiting.append((wait, turn)))
+    scheduler.resume()
+    wait, turn = waiting.pop()
+    assert 2000 <= wait <= 3000 and not waiting
+    turn()
+    assert game.current_player == 1 and len(waiting) == 1
+    # Turns scheduled before stopping are dropped
+    scheduler.stop()
+    waiting.pop()[1]()
+    assert game.current_player == 1 and not waiting
+    try:
+        Scheduler(game, lambda player: True, Pace.FAST_FORWARD)
+        assert False
+    except ValueError:
+        pass
+
+def test_snapshots():
+    # Everything about a game that a move can change
+    def position(game):
+        return (
+            [list(deck.cards) for deck in game.decks], list(game.stock.cards), list(game.discard.cards),
+            game.discard.suit, game.current_player, game.recycles, game.specials, [getattr(deck, "mask", 0) for deck in game.decks],
+        )
+
+    for bitset, reshuffle, seed in [(False, False, 89), (True, True, 89)]:
+        game = Game(True, bitset, reshuffle, rng=random.Random(seed))
+        game.set_up()
+        start = game.snapshot()
+        before = position(game)
+        # Play the game, looking ahead at every move and undoing it each time
+        while not game.finished():
+            for index in range(len(game.decks[game.current_player].cards)):
+                marker = game.snapshot()
+                seen = position(game)
+                game.play_card(index)
+                game.handle_special_card_computer(game.discard.peek())
+                game.next_player()
+                game.restore(marker)
+                assert position(game) == seen
+            if game.computer_turn():
+                game.handle_special_card_computer(game.discard.peek())
+            game.next_player()
+        assert game.recycles > 0
+        # The whole game can be undone, and replays the same way
+        after = position(game)
+        game.restore(start)
+        assert position(game) == before and len(game.journal) == 0
+        game.release()
+        play_out(game)
+        assert position(game) == after
+
+def test_position_codec():
+    for bitset, seed, rules in [(False, 89, None), (True, 301, Rules({"players": 3, "effects": {"JACK": "REVERSE"}}))]:
+        game = Game(True, bitset, rng=random.Random(seed), rules=rules)
+        game.set_up()
+        assert game.hash is None
+        game.rehash()
+        seen = {}
+        while not game.finished():
+            # The hash kept up to date move by move matches one worked out from scratch
+            key = game.hash
+            game.rehash()
+            assert game.hash == key
+            # Positions pack into a fixed width, and unpack to the same position
+            data = game.to_bytes()
+            assert len(data) == 8 + len(game.decks) + 54
+            copy = Game.from_bytes(data, bitset, rules=rules)
+            copy.rehash()
+            assert copy.to_bytes() == data and copy.hash == game.hash
+            assert copy.discard.top_suit() == game.discard.top_suit()
+            seen.setdefault(game.hash, set()).add(data)
+            # Looking ahead and undoing it puts the hash back
+            marker = game.snapshot()
+            game.play_card(0)
+            game.handle_special_card_computer(game.discard.peek())
+            game.next_player()
+            game.restore(marker)
+            assert game.hash == key
+            if game.computer_turn():
+                game.handle_special_card_computer(game.discard.peek())
+            game.next_player()
+        game.release()
+        assert game.recycles > 0 or rules is not None
+        assert len(seen) > 20
+    # Positions without jokers, or with a card missing, are told apart
+    game = Game(False, rng=random.Random(1))
+    game.set_up()
+    assert Game.from_bytes(game.to_bytes()).stock == game.stock
+    try:
+        Game.from_bytes(game.to_bytes()[:-1] + b"\x00")
+        assert False
+    except ValueError:
+        pass
+
+def test_simulate():
+    # Games are reproducible from their seed
+    assert play_game(7, True) == play_game(7, True)
+    # Batches account for every game whether run in or out of process
+    results = simulate(200, seed=0, jokers=True, workers=1, chunk=64)
+    assert results.games == 200
+    assert sum(results.wins) + results.draws == 200
+    pooled = simulate(200, seed=0, jokers=True, workers=2, chunk=64)
+    assert pooled.wins == results.wins
+    assert pooled.turns == results.turns
+
+def test_stats(tmp_path):
+    path = str(tmp_path / "records.bin")
+    # Records are streamed into the sink and written out in chunks as they fill up
+    sink = StatsSink(2, path, chunk_rows=100)
+    results = simulate(250, seed=0, jokers=True, workers=1, chunk=60, sink=sink)
+    plain = simulate(250, seed=0, jokers=True, workers=1, chunk=60)
+    assert (results.wins, results.turns, results.recycles) == (plain.wins, plain.turns, plain.recycles)
+    assert len(list(read_chunks(path))) == 3
+    records = read_records(path)
+    assert list(records["seed"]) == list(range(250))
+    turns = records["turns"].astype(float)
+    # Statistics from the histograms are exact
+    assert sink.mean("turns") == turns.mean()
+    assert abs(sink.variance("turns") - turns.var(ddof=1)) < 1e-9
+    assert sink.quantile("turns", 0.5) == int(np.sort(turns)[124])
+    assert sink.mean("specials") > 0
+    # The same games played in two halves and merged give the same statistics
+    halves = [StatsSink(2), StatsSink(2)]
+    halves[0].add(record_chunk((0, 100, True, False, "standard")))
+    halves[1].add(record_chunk((100, 150, True, False, "standard")))
+    halves[1].merge(halves[0])
+    assert str(halves[1]) == str(sink)
+    # A chunk cut short is ignored, and dropped before more are written
+    with open(path, "ab") as f:
+        f.write(b"\x10\x00\x00\x00\x00\x00\x00\x00partial")
+    assert len(read_records(path)["seed"]) == 250
+    sink = StatsSink(2, path)
+    sink.add(record_chunk((250, 10, True, False, "standard")))
+    sink.close()
+    assert list(read_records(path)["seed"]) == list(range(260))
+
+def test_jobs(tmp_path):
+    settings = {"games": 230, "seed": 5, "jokers": True, "shard_size": 50}
+    # A job killed after two shards only plays the missing ones when resumed
+    job = Job(str(tmp_path / "job"), settings)
+    assert [shard[1:] for shard in job.shards()] == [(5, 50), (55, 50), (105, 50), (155, 50), (205, 30)]
+    job.run(workers=1, limit=2)
+    assert len(job.missing()) == 3
+    try:
+        job.merge()
+        assert False
+    except ValueError:
+        pass
+    played = []
+    resumed = Job(str(tmp_path / "job"))
+    resumed.run(workers=1, progress=played.append)
+    assert played == [2, 3, 4]
+    # The merged report is exactly that of an uninterrupted run
+    uninterrupted = Job(str(tmp_path / "uninterrupted"), settings)
+    uninterrupted.run(workers=2)
+    assert str(resumed.merge()) == str(uninterrupted.merge())
+    whole = StatsSink(2)
+    whole.add(record_chunk((5, 230, True, False, "standard")))
+    assert str(resumed.merge()) == str(whole)
+    # Saved shards load back as they were
+    first = StatsSink(2)
+    first.add(record_chunk((5, 50, True, False, "standard")))
+    assert str(StatsSink.load(shard_path(str(tmp_path / "job"), 0))) == str(first)
+    # A job can't be reopened with other settings
+    try:
+        Job(str(tmp_path / "job"), {"games": 1000})
+        assert False
+    except ValueError:
+        pass
+
+def test_vectorized():
+    # Games played in lockstep give exactly the same outcomes as the built in computer from the same deal
+    decks = []
+    for seed in range(100):
+        random.seed(seed)
+        deck = Deck.full_deck(True)
+        deck.shuffle()
+        decks.append([card.code for card in deck.cards])
+    games = VectorGames(np.array(decks)).run()
+    winners = games.winners()
+    for seed in range(100):
+        winner, turns, recycles = play_game(seed, True)
+        assert winners[seed] == (-1 if winner is None else winner)
+        assert games.turns[seed] == turns
+        assert games.recycles[seed] == recycles
+    # Hands can be viewed as boolean matrices
+    assert games.hand_matrix().shape == (100, 2, 54)
+    # The simulator can hand chunks to the vectorised engine
+    results = simulate(500, jokers=True, workers=1, chunk=250, vectorized=True)
+    assert sum(results.wins) + results.draws == 500
+
+def test_image_cache():
+    # Use the decoded images directly, so no display is needed
+    cache = ImageCache(capacity=2, wrap=lambda image: image)
+    ace = cache.get(Card(Suit.DIAMONDS, Rank.ACE).stem)
+    assert ace.size == (120, 168)
+    # Images are only decoded once and are shared
+    assert cache.get("AD") is ace
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    # Different sizes are cached separately
+    assert cache.get("AD", (30, 42)).size == (30, 42)
+    # The least recently used image is evicted once full
+    cache.get("back")
+    assert cache.evictions == 1
+    assert cache.get("AD", (30, 42)) is not None and cache.misses == 3
+    assert cache.bytes == sum(nbytes for _, nbytes in cache.entries.values())
+    # Images can be decoded on a background thread ahead of being shown
+    cache = ImageCache(wrap=lambda image: image)
+    cache.preload([("KS", (120, 168)), ("back", (120, 168))])
+    cache.preloader.join()
+    assert cache.preload_seconds is not None and len(cache.decoded) == 2
+    assert cache.get("KS").size == (120, 168)
+    assert cache.stats()["preloaded"] == 1 and not cache.entries.get(("back", (120, 168)))
+    # An image shown while the preloader is still decoding it isn't stored twice, and clearing forgets everything
+    decode = cache.decode
+    shown = threading.Event()
+
+    def slow_decode(stem, size):
+        if threading.current_thread() is cache.preloader:
+            shown.wait(5)
+        return decode(stem, size)
+
+    cache.decode = slow_decode
+    cache.preload([("QS", (120, 168)), ("JS", (120, 168))])
+    cache.get("QS")
+    shown.set()
+    cache.preloader.join()
+    assert set(cache.decoded) == {("back", (120, 168)), ("JS", (120, 168))}
+    cache.clear()
+    assert not cache.entries and not cache.decoded and cache.bytes == 0
+    cache.decode = decode
+    # Cards that can't be played are shown dimmed
+    dimmed = cache.get("KS" + DIM)
+    assert dimmed.size == (120, 168) and dimmed.getpixel((60, 84))[0] <= cache.get("KS").getpixel((60, 84))[0] // 2 + 1
+    # Both jokers have joker images rather than the blank card
+    blank = cache.get("1B").tobytes()
+    jokers = [card.stem for card in Deck.full_deck(True).cards if card.rank is Rank.JOKER]
+    assert jokers == ["1J", "2J"] and all(cache.get(stem).tobytes() != blank for stem in jokers)
+
+def test_renderer_diff():
+    king, six, ten = Card(Suit.HEARTS, Rank.KING), Card(Suit.CLUBS, Rank.SIX), Card(Suit.SPADES, Rank.TEN)
+    old = {card: (x, card.stem) for card, x in zip([king, six], spread(2))}
+    # Nothing to do when nothing changed
+    assert diff_rows(old, dict(old)) == ([], [], [])
+    # Playing a card removes it and moves the rest
+    new = {king: (spread(1)[0], king.stem)}
+    assert diff_rows(old, new) == ([six], [], [])
+    # Picking up a card adds it and squeezes the rest up
+    new = {card: (x, card.stem) for card, x in zip([king, six, ten], spread(3))}
+    assert diff_rows(old, new) == ([], [ten], [six])
+    # A changed image (an eight changing suit) is an update
+    assert diff_rows({"top": (0.3, "8C")}, {"top": (0.3, "8H")}) == ([], [], ["top"])
+
+def test_mcts():
+    # The computer (player 1) can win for certain by playing the ace (skipping the human) then the three
+    game = Game(False)
+    game.current_player = 1
+    game.decks[1] = Deck([Card(Suit.HEARTS, Rank.THREE), Card(Suit.HEARTS, Rank.ACE)])
+    game.discard = Pile([Card(Suit.HEARTS, Rank.FIVE)])
+    rest = [card for card in game.stock.cards if card not in game.decks[1].cards + list(game.discard.cards)]
+    game.decks[0] = Deck(rest[:1])
+    game.stock = Pile(rest[1:])
+    player = MCTSPlayer(budget=5, seed=1, iterations=2000)
+    assert player.choose_card(game) == 1
+    # Searches stop by their deadline however late they start
+    assert search(InfoSet(game), 5, 1, stop_by=time.time() - 1) == {}
+    # Workers that run out of time leave the computer to play the first valid card, and don't hold up later moves
+    player = MCTSPlayer(budget=0, workers=2, seed=1)
+    for _ in range(3):
+        assert player.choose_card(game) == game.decks[1].card_to_play(game.discard)
+    player.close()
+    # Whole games can be played with it plugged in as the computer
+    random.seed(3)
+    game = Game(True)
+    game.set_up()
+    game.strategies[1] = MCTSPlayer(budget=0.005, seed=3)
+    turns = 0
+    while not game.finished() and turns < 1000:
+        if game.computer_turn():
+            game.handle_special_card_computer(game.discard.peek())
+        game.next_player()
+        turns += 1
+    assert game.finished()
+
+def test_endgame():
+    # The computer (player 1) can win for certain by playing the ace (skipping the human) then the three
+    game = Game(False)
+    game.current_player = 1
+    game.decks[1] = Deck([Card(Suit.HEARTS, Rank.THREE), Card(Suit.HEARTS, Rank.ACE)])
+    top = Card(Suit.HEARTS, Rank.FIVE)
+    rest = [card for card in game.stock.cards if card not in game.decks[1].cards + [top]]
+    game.decks[0] = Deck(rest[:2])
+    game.stock = Pile(rest[2:5])
+    game.discard = Pile(rest[5:] + [top])
+    player = EndgamePlayer()
+    assert player.can_solve(game)
+    assert player.choose_card(game) == 1
+    # Every way the 5 hidden cards could be split is scored, and the win is certain in each
+    found = positions(game)
+    assert len(found) == 10 and abs(sum(weight for weight, _ in found) - 1) < 1e-9
+    solver = Solver()
+    assert abs(solver.solve(found)[(Card(Suit.HEARTS, Rank.ACE).code, 0)] - 1) < 1e-9
+    # Positions are remembered between searches
+    solver.solve(found)
+    stats = solver.stats()
+    assert stats["hits"] > 0 and 0 < stats["hit_rate"] <= 1 and stats["nodes_per_second"] > 0
+    # Running out of budget gives no answer, so the computer falls back on the first valid card
+    assert Solver(max_nodes=1).solve(found) is None
+    player = EndgamePlayer(max_nodes=1)
+    assert player.choose_card(game) == 0
+    # Early in a game there is too much hidden to solve
+    game = Game(False, rng=random.Random(1))
+    game.set_up()
+    assert not player.can_solve(game)
+
+def test_beliefs():
+    # The computer (player 1) can see its own hand and the top of the discard pile
+    game = Game(False)
+    hand = [Card(Suit.CLUBS, Rank.FIVE), Card(Suit.HEARTS, Rank.ACE), Card(Suit.DIAMONDS, Rank.EIGHT)]
+    theirs = [Card(Suit.HEARTS, Rank.THREE), Card(Suit.SPADES, Rank.NINE)]
+    top = Card(Suit.HEARTS, Rank.KING)
+    rest = [card for card in game.stock.cards if card not in hand + theirs + [top]]
+    game.decks = [Deck(list(theirs)), Deck(list(hand))]
+    game.discard = Pile([top])
+    game.stock = Pile(rest)
+    beliefs = Beliefs(game, 1)
+    assert beliefs.unseen == mask_of(theirs + rest) and beliefs.hidden() == 2
+    # Cards played are seen
+    game.play_card(0)
+    assert beliefs.unseen == mask_of(theirs[1:] + rest)
+    # Drawing on their own turn suggests they had nothing they could play, but the card drawn could be anything,
+    # here a heart they can play
+    four = Card(Suit.HEARTS, Rank.FOUR)
+    game.stock.cards.remove(four)
+    game.stock.push(four)
+    assert game.draw(game.decks[0]) is four and beliefs.unseen >> four.code & 1
+    likelihoods = beliefs.suit_likelihoods()
+    assert 0 < likelihoods[Suit.HEARTS] < likelihoods[Suit.SPADES]
+    game.play_card(1)
+    assert not beliefs.excluded >> four.code & 1
+    # Once they have drawn as many cards as they hold, nothing is known about their hand any more
+    game.current_player = 1
+    game.draw(game.decks[0])
+    assert beliefs.excluded == 0 and beliefs.drawn == 0
+    # Cards the computer picks up after a two are seen, theirs aren't
+    picked = [game.draw(game.decks[1]) for _ in range(2)]
+    assert not beliefs.unseen & mask_of(picked)
+    # Changing suit with an eight gives away that they probably hold it
+    game.current_player = 0
+    game.change_suit(Suit.CLUBS)
+    assert beliefs.suit_likelihoods()[Suit.CLUBS] >= 1.0
+    # Recycled cards go back to being unseen
+    game.recycle()
+    assert beliefs.unseen >> top.code & 1
+    beliefs.close()
+    # Cards they can't answer come first and wild cards last
+    game = Game(False)
+    game.current_player = 1
+    game.decks[1] = Deck(hand + [Card(Suit.HEARTS, Rank.SEVEN)])
+    game.discard = Pile([Card(Suit.HEARTS, Rank.NINE)])
+    player = CountingPlayer()
+    assert player.choose_card(game) == 1
+    game.decks[1].remove(1)
+    assert player.choose_card(game) == 2
+    # Suits are changed to one held and probably not held by them
+    assert player.choose_suit(game) in (Suit.CLUBS, Suit.HEARTS)
+    player.close()
+    assert not any(game.listeners.values())
+    # Whole games can be played with it, following each new game
+    for seed in range(3):
+        game = Game(seed == 2, rng=random.Random(seed))
+        game.set_up()
+        game.strategies[1] = player
+        play_out(game)
+        assert game.finished()
+    player.close()
+
+def test_tournament():
+    assert elo_from_score(0.5) == 0 and abs(elo_from_score(expected_score(120)) - 120) < 1e-9
+    # Mirrored deals cancel out luck: a strategy against itself wins each deal once from either seat
+    _, pairs = play_pairs((0, "first", "first", 0, 20, False))
+    assert all(sum(pair) == 1 for pair in pairs)
+    # Strategies are made by name and the random one is repeatable
+    game = Game(False, rng=random.Random(2))
+    game.set_up()
+    choices = [make_strategy("random", 7).choose_card(game) for _ in range(2)]
+    assert choices[0] == choices[1] and game.discard.can_add_to(game.decks[0].cards[choices[0]])
+    # The SPRT stops a one-sided pairing early
+    pairing = Pairing("a", "b")
+    pairing.add([(1.0, 1.0), (1.0, 0.0)] * 20)
+    pairing.test(10, 0.05, 0.05)
+    assert pairing.decision == "a" and pairing.games() == 80 and pairing.wins == 60
+    low, high = pairing.interval()
+    assert low < pairing.elo() < high
+    # A whole tournament in this process, stopping each pairing once it is decided
+    pairings = tournament(["first", "random"], max_games=2000, workers=1, batch=50)
+    assert len(pairings) == 1 and pairings[0].decision == "first" and pairings[0].games() < 2000
+    assert ratings(pairings)["first"] > 0
+
+def test_policy(tmp_path):
+    # An empty table plays exactly like the built in computer
+    game = Game(True, rng=random.Random(5))
+    game.set_up()
+    player = TablePlayer(empty_table())
+    game.strategies = [player, player]
+    assert play_out(game) == play_game(5, True)[1]
+    # Every position maps to a state in the table, and the table chooses the kind of card played
+    game = Game(False, rng=random.Random(6))
+    game.set_up()
+    seen = set()
+    table = empty_table()
+    for state in range(STATES):
+        table[state] = 1 + state % 720
+    player = TablePlayer(table)
+    while not game.finished():
+        seen.add(state_of(game))
+        index = player.choose_card(game)
+        if index is not None:
+            card = game.decks[game.current_player].cards[index]
+            assert game.discard.can_add_to(card)
+        if game.computer_turn():
+            game.handle_special_card_computer(game.discard.peek())
+        game.next_player()
+    assert all(0 <= state < STATES for state in seen)
+    # Tables are written compressed and read back the same, and a trained one is shipped with the game
+    table = train(generations=1, games=100, sample=1.0, min_visits=2, workers=1, chunk=50)
+    save_table(table, tmp_path / "policy.bin")
+    assert load_table(tmp_path / "policy.bin") == table and any(table)
+    assert os.path.getsize(tmp_path / "policy.bin") < 4000
+    assert len(TablePlayer().table) == STATES
+
+def test_gamelog():
+    # Record some games, including ones where the recycled stock is reshuffled
+    log = GameLog()
+    games = []
+    for seed in range(50):
+        game = Game(True, reshuffle=seed % 2 == 1, rng=random.Random(seed), log=log)
+        game.set_up()
+        play_out(game)
+        games.append(game)
+    # Replaying gives exactly the same games
+    replayed = list(replay(bytes(log.data)))
+    assert len(replayed) == len(games)
+    for game, copy in zip(games, replayed):
+        assert game.decks[0] == copy.decks[0] and game.decks[1] == copy.decks[1]
+        assert game.discard == copy.discard and game.discard.suit == copy.discard.suit
+        assert game.winner() == copy.winner()
+    # Seeded games are reproducible
+    first, second = Game(True, rng=random.Random(3)), Game(True, rng=random.Random(3))
+    first.set_up()
+    second.set_up()
+    assert first.stock == second.stock and first.decks[0] == second.decks[0]
+    # Invalid logs are rejected, saying where the problem is: a card that can't be played, a log cut short in the
+    # middle of a deal, one missing the start of its game, and a card dealt once the game has started
+    data = bytes(log.data)
+    first_play = next(i for i, event in enumerate(data) if event < 0x40)
+    for events, offset in [
+        (data[:first_play] + b"\x3f", first_play), (data[:30], 30), (data[1:], 0),
+        (data[:first_play + 1] + b"\x80", first_play + 1),
+    ]:
+        try:
+            list(replay(events))
+            assert False
+        except ReplayError as error:
+            assert f"offset {offset}" in str(error)
+
+def test_benchmark():
+    # Every engine benchmark runs
+    benchmarks = engine_benchmarks()
+    for name in ["Deck.full_deck", "Deck.can_add_to", "Deck.card_to_play", "Game playout"]:
+        summary = summarise(measure(benchmarks[name], samples=5))
+        assert summary["p50"] <= summary["p90"] <= summary["p99"]
+    # Regressions are only reported past the threshold
+    baselines = {"fast": {"relative": 1.0}, "slow": {"relative": 1.0}}
+    results = {"fast": {"relative": 0.9}, "slow": {"relative": 0.7}, "new": {"relative": 0.1}}
+    assert regressions(results, baselines, 0.25) == ["slow"] and untracked(results, baselines) == ["new"]
+    # Speeds are measured against a reference in the same run, so the suite passes against its own fresh baseline
+    chosen = {name: benchmarks[name] for name in ["Deck.can_add_to", "Deck.card_to_play"]}
+    baselines = run(chosen, samples=10, rounds=3)
+    assert set(baselines) == {REFERENCE, *chosen}
+    assert regressions(run(chosen, samples=10, rounds=3), baselines) == []
+    # but doing three times the work is caught
+    slowed = {
+        name: lambda function=function: (function(), function(), function()) for name, function in chosen.items()
+    }
+    assert regressions(run(slowed, samples=10, rounds=3), baselines) == list(chosen)
+
+def test_tracer(tmp_path):
+    tracer = Tracer()
+    game = Game(True, rng=random.Random(1))
+    game.set_up()
+    computer_turn = game.computer_turn
+    attach_game(tracer, game)
+    # Attaching twice doesn't time things twice
+    attach_game(tracer, game)
+    play_out(game)
+    # Only this game is timed, the class is untouched
+    assert Game.computer_turn is not game.computer_turn and computer_turn != game.computer_turn
+    summary = tracer.summary()
+    assert summary["game.computer_turn"]["count"] > 0
+    assert summary["game.computer_turn"]["p50"] <= summary["game.computer_turn"]["max"]
+    with tracer.span("test.block"):
+        pass
+    assert "test.block" in tracer.summary_text()
+    # Spans are exported as Chrome trace events
+    path = tmp_path / "trace.json"
+    tracer.export(str(path))
+    with open(path, "r", encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == sum(stats["count"] for stats in tracer.summary().values())
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+
+def test_server():
+    # Tables enforce turns and the rules
+    table = Table(False, random.Random(2))
+    table.seats[0] = "player"
+    assert table.view(1)["turn"] is False
+    assert table.play(1, table.game.decks[1].cards[0].stem) == "it isn't your turn"
+    assert table.play(0, "ZZ") == "ZZ isn't in your hand"
+    assert table.choose_suit(0, "HEARTS") == "you don't need to choose a suit"
+    # Picking up hands the turn to the computer, which plays straight away
+    cards = len(table.game.decks[0].cards)
+    assert table.draw(0) is None
+    assert table.game.current_player == 0 or table.game.finished()
+    assert len(table.game.decks[0].cards) >= cards + 1
+    # Eights wait for a suit to be chosen
+    table.game.decks[0].push(Card(Suit.CLUBS, Rank.EIGHT))
+    assert table.play(0, "8C") is None
+    assert table.view(0)["choose_suit"] and table.draw(0) == "waiting for a suit to be chosen"
+    assert table.choose_suit(0, "DIAMONDS") is None
+    # Players leaving, while choosing a suit or on their turn, hand their seat to the computer and the game goes on
+    for choosing in (True, False):
+        server = Server(1)
+        sessions = [Session(server, None, None) for _ in range(2)]
+        sent = []
+        table = Table(False, random.Random(4))
+        for player, session in enumerate(sessions):
+            session.send = sent.append
+            server.seat(session, table, player)
+        server.tables.add(table)
+        # Moves that are turned down aren't counted
+        sessions[1].handle({"op": "draw"})
+        assert sent[-1]["op"] == "error" and server.moves == 0
+        if choosing:
+            table.game.decks[0].push(Card(Suit.CLUBS, Rank.EIGHT))
+            assert table.play(0, "8C") is None and table.choosing == 0
+        server.leave(sessions[0])
+        assert table.choosing is None and sent[-1] == table.view(1)
+        assert table.game.current_player == 1 or table.game.finished()
+        while not table.game.finished():
+            assert table.view(1)["turn"] or table.view(1)["choose_suit"]
+            if table.choosing == 1:
+                assert table.choose_suit(1, "HEARTS") is None
+                continue
+            hand = table.game.decks[1]
+            index = hand.card_to_play(table.game.discard)
+            if index is None:
+                assert table.draw(1) is None
+            else:
+                assert table.play(1, hand.cards[index].stem) is None
+        assert table.seats == [None, sessions[1]]
+    # Moves that are made are
+    sessions[1].table = table = Table(False, random.Random(4))
+    table.seats[1] = sessions[1]
+    table.game.current_player = 1
+    sessions[1].handle({"op": "draw"})
+    assert server.moves == 1
+    # A swarm of bots can play whole games over localhost
+    results = asyncio.run(swarm(5, 2))
+    assert results["games"] == 10 and results["moves"] > 10
+
+def test_bundle(tmp_path):
+    path = str(tmp_path / "cards.bundle")
+    assets = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+    assert build(assets, path) == len([name for name in os.listdir(assets) if name.endswith((".png", ".svg"))])
+    bundle = Bundle(path)
+    # Files come out exactly as they went in, as views straight onto the mapped file
+    with open(os.path.join(assets, "1J.svg"), "rb") as f:
+        assert bytes(bundle.get("1J.svg")) == f.read()
+    with open(os.path.join(assets, "AH.png"), "rb") as f:
+        assert bytes(bundle.face(Card(Suit.HEARTS, Rank.ACE).code)) == f.read()
+    assert bundle.get("back.png").readonly
+    # Images can be decoded from the bundle
+    cache = ImageCache(wrap=lambda image: image, bundle=bundle)
+    assert cache.get("heart", (30, 30)).size == (30, 30)
+    assert "missing.png" not in bundle
@@ -0,0 +1,233 @@
+"""
+Round-robin tournaments between computer strategies, run across a pool of worker processes
+
+Every deal is played twice with the strategies swapping seats, so neither gains from a lucky deal or from
+going first. Each pairing stops as soon as a sequential probability ratio test (SPRT) decides which strategy
+is stronger, so games are only played until the result is significant.
+
+Run with `python -m tournament --help` from the src folder
+"""
+
+import argparse
+import math
+import queue
+import random
+import time
+from itertools import combinations
+from multiprocessing import Pool, cpu_count
+from game import Game
+from simulate import play_out
+from strategies import NAMES, make_strategy
+
+# Normal quantile for 95% confidence intervals
+Z95 = 1.959964
+
+# Expected score of a player rated some Elo above their opponent
+def expected_score(elo: float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+# Elo difference that gives an expected score (scores of 0 or 1 are clamped, as they have no finite Elo)
+def elo_from_score(score: float) -> float:
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+# The games played between two strategies, scored for the first
+class Pairing:
+    def __init__(self, first: str, second: str):
+        self.first = first
+        self.second = second
+        # Average score of the first strategy over each mirrored pair of games
+        self.samples = []
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        # Name of the stronger strategy once decided (by the SPRT, or the confidence interval after max_games)
+        self.decision = None
+
+    # Record the results of mirrored pairs of games, given as (score as player 0, score as player 1)
+    def add(self, pairs: list):
+        for pair in pairs:
+            for score in pair:
+                if score == 1:
+                    self.wins += 1
+                elif score == 0:
+                    self.losses += 1
+                else:
+                    self.draws += 1
+            self.samples.append(sum(pair) / 2)
+
+    # Number of games played
+    def games(self) -> int:
+        return 2 * len(self.samples)
+
+    # Average score of the first strategy
+    def score(self) -> float:
+        return sum(self.samples) / len(self.samples) if self.samples else 0.5
+
+    # Variance of the score of one mirrored pair
+    def variance(self) -> float:
+        count = len(self.samples)
+        if count < 2:
+            return 0.0
+        mean = self.score()
+        return sum((sample - mean) ** 2 for sample in self.samples) / (count - 1)
+
+    # Elo of the first strategy over the second
+    def elo(self) -> float:
+        return elo_from_score(self.score())
+
+    # Confidence interval of the Elo (95% by default)
+    def interval(self, z: float = Z95) -> tuple:
+        error = z * math.sqrt(self.variance() / max(len(self.samples), 1))
+        score = self.score()
+        return elo_from_score(score - error), elo_from_score(score + error)
+
+    # Log likelihood ratio of the first strategy being elo1 stronger rather than elo0 (normal approximation)
+    def llr(self, elo0: float, elo1: float) -> float:
+        variance = self.variance()
+        if variance <= 0:
+            return 0.0
+        score0, score1 = expected_score(elo0), expected_score(elo1)
+        return (score1 - score0) * (2 * sum(self.samples) - len(self.samples) * (score0 + score1)) / (2 * variance)
+
+    # Run the SPRT, deciding which strategy is stronger by at least margin Elo once it is significant
+    def test(self, margin: float, alpha: float, beta: float):
+        llr = self.llr(-margin, margin)
+        if llr >= math.log((1 - beta) / alpha):
+            self.decision = self.first
+        elif llr <= math.log(beta / (1 - alpha)):
+            self.decision = self.second
+
+    # Nice printing of a pairing
+    def __str__(self):
+        low, high = self.interval()
+        return (
+            f"{self.first + ' vs ' + self.second:32} {self.games():7} {self.wins:6}-{self.draws}-{self.losses:<6} "
+            f"{self.score():6.1%} {self.elo():+7.1f} [{low:+.1f}, {high:+.1f}]  {self.decision or 'undecided'}"
+        )
+
+# Play mirrored pairs of games between two strategies on a range of deals (run inside a worker process)
+# Returns (index of the pairing, [(score of the first as player 0, score of the first as player 1)])
+def play_pairs(args) -> tuple:
+    index, first, second, start, count, jokers = args
+    strategies = [make_strategy(first, start), make_strategy(second, start + 1)]
+    pairs = []
+    for seed in range(start, start + count):
+        pair = []
+        for seat in [0, 1]:
+            game = Game(jokers, rng=random.Random(seed))
+            game.set_up()
+            game.strategies[seat] = strategies[0]
+            game.strategies[seat ^ 1] = strategies[1]
+            play_out(game)
+            winner = game.winner()
+            pair.append(0.5 if winner is None else float(winner == seat))
+        pairs.append(tuple(pair))
+    for strategy in strategies:
+        strategy.close()
+    return index, pairs
+
+# Rate each strategy by its average Elo against every other
+def ratings(pairings: list) -> dict:
+    elos = {}
+    for pairing in pairings:
+        elo = pairing.elo()
+        elos.setdefault(pairing.first, []).append(elo)
+        elos.setdefault(pairing.second, []).append(-elo)
+    return {name: sum(found) / len(found) for name, found in elos.items()}
+
+# Play a round-robin tournament, each pairing playing up to max_games until the SPRT decides it
+# (without the SPRT every pairing plays max_games, and is decided by the confidence interval of its Elo)
+def tournament(
+    names: list, max_games: int = 20000, jokers: bool = False, workers: int = None, batch: int = 100,
+    seed: int = 0, margin: float = 10, alpha: float = 0.05, beta: float = 0.05, sprt: bool = True
+) -> list:
+    workers = workers or cpu_count()
+    pairings = [Pairing(first, second) for first, second in combinations(names, 2)]
+    # The next deal of each pairing (every pairing plays the same deals)
+    next_seed = [seed] * len(pairings)
+
+    # Get the next batch of deals to play (for the pairing with the fewest so far), or None once none need more
+    def next_job():
+        waiting = [
+            index for index, pairing in enumerate(pairings)
+            if pairing.decision is None and next_seed[index] - seed < max_games // 2
+        ]
+        if not waiting:
+            return None
+        index = min(waiting, key=lambda waiting_index: next_seed[waiting_index])
+        start = next_seed[index]
+        count = min(batch, seed + max_games // 2 - start)
+        next_seed[index] += count
+        return (index, pairings[index].first, pairings[index].second, start, count, jokers)
+
+    # Take in the results of a batch and test the pairing again (results after a decision are ignored)
+    def finish(result):
+        index, pairs = result
+        pairing = pairings[index]
+        if pairing.decision is None:
+            pairing.add(pairs)
+            if sprt:
+                pairing.test(margin, alpha, beta)
+
+    if workers == 1:
+        job = next_job()
+        while job is not None:
+            finish(play_pairs(job))
+            job = next_job()
+    else:
+        finished = queue.Queue()
+        with Pool(workers) as pool:
+            running = 0
+            while True:
+                # Keep every worker busy, with one batch queued behind each
+                while running < 2 * workers:
+                    job = next_job()
+                    if job is None:
+                        break
+                    pool.apply_async(play_pairs, (job,), callback=finished.put, error_callback=finished.put)
+                    running += 1
+                if running == 0:
+                    break
+                result = finished.get()
+                running -= 1
+                if isinstance(result, BaseException):
+                    raise result
+                finish(result)
+    for pairing in pairings:
+        if pairing.decision is None:
+            low, high = pairing.interval()
+            pairing.decision = pairing.first if low > 0 else pairing.second if high < 0 else "neither"
+    return pairings
+
+# Command line entry point
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tournament", description="Play computer strategies off")
+    parser.add_argument("strategies", nargs="+", choices=NAMES, help="strategies to play against each other")
+    parser.add_argument("-n", "--games", type=int, default=20000, help="most games played by each pairing")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the first deal")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("-b", "--batch", type=int, default=100, help="mirrored deals handed to a worker at a time")
+    parser.add_argument("-j", "--jokers", action="store_true", help="add jokers to the pack")
+    parser.add_argument("-m", "--margin", type=float, default=10, help="Elo difference the SPRT looks for")
+    parser.add_argument("--alpha", type=float, default=0.05, help="chance of deciding for the weaker strategy")
+    args = parser.parse_args(argv)
+    if len(set(args.strategies)) < 2:
+        parser.error("give at least two different strategies")
+
+    started = time.perf_counter()
+    pairings = tournament(
+        list(dict.fromkeys(args.strategies)), args.games, args.jokers, args.workers, args.batch, args.seed,
+        args.margin, args.alpha, args.alpha
+    )
+    print(f"{'Pairing':32} {'games':>7} {'W-D-L':^15} {'score':>6} {'Elo':>7} {'95% interval':^16}  stronger")
+    for pairing in pairings:
+        print(pairing)
+    print()
+    print("Ratings (average Elo against the others):")
+    for name, elo in sorted(ratings(pairings).items(), key=lambda item: -item[1]):
+        print(f"  {name:16} {elo:+7.1f}")
+    print(f"Played {sum(pairing.games() for pairing in pairings)} games in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
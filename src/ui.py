@@ -2,30 +2,56 @@
 For handling the UI of the game
 """
 
-import random
-import os
 from tkinter import Tk, Label, Button, mainloop
-from PIL import Image, ImageTk
-from cards import Card, Suit, Rank
+from cards import Card, Suit
 from game import Game
+from events import EventKind, Pace, Scheduler
+from images import ImageCache, DIM
+from renderer import Renderer, spread
+from instrument import Tracer, attach_game
+from endgame import EndgamePlayer
+from strategies import Strategy
 
 # UI class
 class UI:
     # UI will contain the game
-    def __init__(self, jokers: bool):
+    # A tracer can be given to time the game and rendering (press F3 to see the timings)
+    # The first game and the image cache can be made ahead of time (see main.py)
+    # The computer plays with the given strategy (by default solving the end of each game exactly)
+    # and takes its turns at the given pace, in a demo it plays both sides
+    def __init__(self, jokers: bool, tracer: Tracer = None, images: ImageCache = None, game: Game = None,
+                 computer: Strategy = None, pace: Pace = Pace.ANIMATED, demo: bool = False):
         self.jokers = jokers
-        self.game = Game(self.jokers)
-        self.game.set_up()
+        self.tracer = tracer
+        self.game = game
+        if self.game is None:
+            self.game = Game(self.jokers, bitset=True)
+            self.game.set_up()
+        self.computer = computer or EndgamePlayer()
+        self.pace = pace
+        self.demo = demo
+        self.scheduler = None
         self.root = Tk()
         self.root.geometry("900x700")
         self.root.title("Crazy Eights!")
         self.root.config(bg="#033500")
 
-        # Storage to prevent PhotoImages from being garbage collected
-        self.storage = []
+        # Decoded images, shared between everything that shows them
+        self.images = images or ImageCache()
+        # Cards are drawn onto a canvas underneath every other widget
+        self.renderer = Renderer(self.root, self.images, "#033500")
+        self.overlay = None
+        if self.tracer is not None:
+            self.instrument()
+            self.root.bind("<F3>", self.toggle_overlay)
+            # Closing the window should also write out the trace
+            self.root.protocol("WM_DELETE_WINDOW", self.quit)
 
-        self.just_restarted = False
-        self.paused = False
+        # Whether the player is choosing a suit after playing an eight
+        self.choosing = False
+        # Cards the player can play this turn (looked up from the legal move index of their hand)
+        self.legal = set()
+        self.victory_message = None
 
         # Show exit and new game buttons
         self.exit_button = Button(
@@ -48,7 +74,7 @@ class UI:
         # Show game state
         self.state = Label(
             self.root,
-            text="Your Turn!",
+            text="Computer's Turn" if self.demo else "Your Turn!",
             fg="white",
             bg="#033500",
             font=("Verdana", 20),
@@ -58,27 +84,33 @@ class UI:
 
         # Render discard and stock piles
         self.render_discard()
-        self.stock_pile = self.show_card_back(0.6666, 0.4)
-
         # Provide pick-up behaviour
-        self.stock_pile.bind("<Button-1>", self.pick_up)
+        self.renderer.render_row(
+            "stock", 0.4, {"stock": (0.6666, "back")}, lambda event, _: self.pick_up(event)
+        )
 
         # Render the decks of all the players
-        self.opponent = []
-        self.players = []
         self.render_opponent()
         self.render_player()
 
         # Load in images of suits (for suit picker)
         self.suits = {}
         for suit in ["heart", "diamond", "spade", "club"]:
-            if "src" in os.getcwd():
-                path = f"../assets/{suit}.png"
-            else: path = f"assets/{suit}.png"
-            image = Image.open(path)
-            image = image.resize((30, 30))
-            photo = ImageTk.PhotoImage(image)
-            self.suits[suit] = photo
+            self.suits[suit] = self.images.get(suit, (30, 30))
+
+        self.start_game()
+
+    # Follow the game (redrawing whenever something happens) and start taking the computer's turns
+    def start_game(self):
+        for player in range(0 if self.demo else 1, 2):
+            self.game.strategies[player] = self.computer
+        self.game.subscribe(self.handle_event)
+        self.scheduler = Scheduler(
+            self.game, lambda player: self.demo or player != 0, self.pace, self.root.after
+        )
+        if self.tracer is not None:
+            self.tracer.attach(self.scheduler, {"take_turn": "ui.computer_turn"})
+        self.scheduler.resume()
 
     # Run the game and show the UI
     def run(self):
@@ -89,186 +121,149 @@ class UI:
 
     # Exit the game
     def quit(self):
+        if self.tracer is not None and self.tracer.path:
+            self.tracer.export()
         self.root.destroy()
 
-    # Render a card at a certain location
-    def show_card(self, card: Card, x: float, y: float) -> Label:
-        image = Image.open(card.get_image_path() + ".png")
-        image = image.resize((120, 168))
-        photo = ImageTk.PhotoImage(image)
-        label = Label(self.root, image=photo)
-        self.storage.append(photo)
-        label.place(relx=x, rely=y, anchor="center")
-        return label
-
-    # Render the back of a card at a certain location
-    def show_card_back(self, x: float, y: float) -> Label:
-        if "src" in os.getcwd():
-            path = "../assets/back.png"
-        else:
-            path = "assets/back.png"
-        image = Image.open(path)
-        image = image.resize((120, 168))
-        photo = ImageTk.PhotoImage(image)
-        label = Label(self.root, image=photo)
-        self.storage.append(photo)
-        label.place(relx=x, rely=y, anchor="center")
-        return label
+    # Time the parts of the game and UI that can cause hitches
+    def instrument(self):
+        self.tracer.attach(self, {
+            "render_player": "ui.render_player",
+            "render_opponent": "ui.render_opponent",
+            "render_discard": "ui.render_discard",
+        })
+        self.tracer.attach(self.images, {"decode": "images.decode"})
+        attach_game(self.tracer, self.game)
+
+    # Show or hide the timings of the tracer
+    def toggle_overlay(self, _=None):
+        if self.overlay is not None:
+            self.overlay.destroy()
+            self.overlay = None
+            return
+        self.overlay = Label(
+            self.root,
+            font=("Courier", 9),
+            justify="left",
+            bg="black",
+            fg="white"
+        )
+        self.overlay.place(relx=0.99, rely=0.01, anchor="ne")
+        self.refresh_overlay()
+
+    # Keep the timings up to date while they are shown
+    def refresh_overlay(self):
+        if self.overlay is None:
+            return
+        self.overlay.config(text=self.tracer.summary_text())
+        self.root.after(500, self.refresh_overlay)
 
     # Render the discard pile
     def render_discard(self):
-        # Destroy the discard pile if possible
-        try:
-            self.discard_pile.destroy()
-        except:
-            pass
-        # Show the discard pile
-        self.discard_pile = self.show_card(self.game.discard.peek(), 0.3333, 0.4)
+        top = self.game.discard.top()
+        self.renderer.render_row("discard", 0.4, {"top": (0.3333, top.stem)})
 
     # Render the hand of the opponent
     def render_opponent(self):
-        # Destroy all of the opponents cards
-        for image in self.opponent:
-            image.destroy()
-        # Render the updated deck
-        card_number = len(self.game.decks[1].cards)
-        if card_number == 0:
-            # Prevent 0 division
-            return
-        increment = 0.7 / card_number
-        self.opponent = []
-        for i in range(card_number):
-            self.opponent.append(self.show_card_back(0.2 + increment * i, 0.04))
+        positions = spread(len(self.game.decks[1].cards))
+        self.renderer.render_row("opponent", 0.04, {i: (x, "back") for i, x in enumerate(positions)})
 
     # Render the player's hand
+    # On the player's turn, cards that can't be played are dimmed
     def render_player(self):
-        # Destroy all of the opponents cards
-        for image in self.players:
-            image.destroy()
-        # Render the updated deck
-        card_number = len(self.game.decks[0].cards)
-        if card_number == 0:
-            # Prevent 0 division
-            return
-        increment = 0.7 / card_number
-        self.players = []
-        for i, card in enumerate(self.game.decks[0].cards):
-            card = self.show_card(card, 0.2 + increment * i, 0.74)
-            card.bind("<Button-1>", lambda event, choice=i: self.play_card(event, choice))
-            self.players.append(card)
+        hand = self.game.decks[0]
+        self.legal = set(hand.legal_moves(self.game.discard)) if self.players_turn() else set()
+        dim = DIM if self.players_turn() else ""
+        # Cards are unique, so they are used to track which item shows which card
+        row = {
+            card: (x, card.stem if card in self.legal else card.stem + dim)
+            for card, x in zip(hand.cards, spread(len(hand.cards)))
+        }
+        self.renderer.render_row(
+            "player", 0.74, row,
+            lambda event, card: self.play_card(event, self.game.decks[0].cards.index(card))
+        )
+
+    # Check if the player can take their turn
+    def players_turn(self) -> bool:
+        return not self.demo and not self.choosing and self.game.current_player == 0 and not self.game.finished()
 
     # Handle the player wanting to pick up a card
     def pick_up(self, _):
-        if self.game.current_player == 0:
-            self.just_restarted = False
-            player_deck = self.game.decks[self.game.current_player]
-            new_card = self.game.stock.pop()
-            player_deck.push(new_card)
-            self.render_player()
-            self.next_player()
+        if self.players_turn():
+            self.game.draw(self.game.decks[0])
+            self.scheduler.end_turn()
 
     # Handle the player playing a card
     def play_card(self, _, choice):
-        if self.game.current_player == 0:
-            self.just_restarted = False
+        if self.players_turn():
             player_deck = self.game.decks[0]
             valid_range = choice >= 0 and choice < len(player_deck.cards)
-            valid = valid_range and self.game.discard.can_add_to(player_deck.cards[choice])
+            valid = valid_range and player_deck.cards[choice] in self.legal
             if valid:
-                choice = self.game.decks[0].remove(choice)
-                self.game.discard.push(choice)
+                self.game.play_card(choice)
                 self.handle_special_card(self.game.discard.peek())
-                self.render_discard()
-                self.render_player()
-                self.render_opponent()
-                if self.game.finished():
-                    # Game over, player won!
-                    self.victory_message = Label(
-                        self.root,
-                        text="You Won!",
-                        font=("Verdana", 60),
-                        bg="#033500",
-                        fg="white",
-                        padx=1000,
-                        pady=1000
-                    )
-                    self.victory_message.place(relx=0.5, rely=0.5, anchor="center")
-                    self.exit_button.lift()
-                    self.new_game_button.lift()
-                else:
-                    self.next_player()
+                # Wait for a suit to be chosen before moving on
+                if not self.choosing:
+                    self.scheduler.end_turn()
             else:
                 self.state.config(text="Card doesn't match, please choose another or pick up")
 
-    # Move to the next player
-    def next_player(self):
-        self.game.next_player()
-        if self.game.current_player == 0:
-            self.state.config(text="Your Turn")
+    # Redraw whatever an event changed
+    def handle_event(self, event):
+        match event.kind:
+            # The player's cards are redrawn whenever what they can play might have changed
+            case EventKind.PLAYED:
+                self.render_discard()
+                self.render_opponent()
+                self.render_player()
+            case EventKind.DREW:
+                self.render_hand(event.player)
+            case EventKind.SUIT_CHANGED:
+                self.render_discard()
+                self.render_player()
+            case EventKind.NEXT_PLAYER:
+                your_turn = event.player == 0 and not self.demo
+                self.state.config(text="Your Turn" if your_turn else "Computer's Turn")
+                self.render_player()
+            case EventKind.GAME_OVER:
+                self.show_winner(event.player)
+
+    # Render the hand of a player
+    def render_hand(self, player: int):
+        if player == 0:
+            self.render_player()
         else:
-            # Update turn display (if not paused)
-            if not self.paused:
-                self.state.config(text="Computer's Turn")
-            # Handle computer's go (simulate thinking time)
-            self.root.after(random.randint(2000, 3000), self.handle_computer)
-        # Refill the stock pile (to prevent running out)
-        top = self.game.discard.pop()
-        for card in self.game.discard.cards:
-            self.game.stock.cards.insert(0, card)
-        self.game.discard.cards = [top]
-
-    # Handle the computer's turn
-    def handle_computer(self):
-        # Non-blocking way to wait until the game unpauses
-        if self.just_restarted:
-            self.just_restarted = False
-            self.paused = False
-            return
-        if self.paused:
-            self.root.after(random.randint(2000, 3000), self.handle_computer)
-            return
-        # Handle the computer's go
-        if self.game.computer_turn():
-            self.game.handle_special_card_computer(self.game.discard.peek())
-        self.render_opponent()
-        self.render_player()
-        self.render_discard()
-        self.next_player()
-        if self.game.finished():
-            # Game over, computer won!
-            self.victory_message = Label(
-                self.root,
-                text="You Lost!",
-                font=("Verdana", 60),
-                bg="#033500",
-                fg="white",
-                padx=1000,
-                pady=1000
-            )
-            self.victory_message.place(relx=0.5, rely=0.5, anchor="center")
-            self.exit_button.lift()
-            self.new_game_button.lift()
-
-    # Handle special cards (player facing)
+            self.render_opponent()
+
+    # Show who won the game
+    def show_winner(self, player: int):
+        if self.demo:
+            text = "Bottom Player Won!" if player == 0 else "Top Player Won!"
+        else:
+            text = "You Won!" if player == 0 else "You Lost!"
+        self.victory_message = Label(
+            self.root,
+            text=text,
+            font=("Verdana", 60),
+            bg="#033500",
+            fg="white",
+            padx=1000,
+            pady=1000
+        )
+        self.victory_message.place(relx=0.5, rely=0.5, anchor="center")
+        self.exit_button.lift()
+        self.new_game_button.lift()
+
+    # Handle special cards (player facing, the effects are shared with the computer but the suit is picked here)
     def handle_special_card(self, card: Card):
-        match card.rank:
-            case Rank.EIGHT:
-                # Handle 8 card
-                self.pick_suit()
-            case Rank.TWO:
-                # Handle 2 card
-                self.game.pickup_2()
-            case Rank.ACE:
-                # Handle ace card
-                self.game.skip_go()
-            case Rank.JOKER:
-                # Handle joker card
-                self.game.skip_go()
+        if not self.game.finished():
+            self.game.handle_special_card(card, self.pick_suit)
 
     # Show the suit picker and return the selection
     def pick_suit(self):
-        # Pause the gameplay for now
-        self.paused = True
+        # Hold the game until a suit is chosen
+        self.choosing = True
         # Show the new suit picker
         self.heart_button = Label(self.root, image=self.suits["heart"])
         self.club_button = Label(self.root, image=self.suits["club"])
@@ -299,10 +294,8 @@ class UI:
 
     # Make a suit selection
     def do_suit_selection(self, _, suit: Suit):
-        self.state.config(text="Computer's Turn")
         # Set the suit
-        self.game.discard.cards[len(self.game.discard.cards) - 1].suit = suit
-        self.render_discard()
+        self.game.change_suit(suit)
         # Destroy any old suit picker
         try:
             self.heart_button.destroy()
@@ -311,20 +304,27 @@ class UI:
             self.spade_button.destroy()
         except:
             pass
-        # Unpause and continue the game
-        self.paused = False
+        # Continue the game
+        self.choosing = False
+        self.scheduler.end_turn()
 
     # Replay the game
     def new_game(self):
-        self.victory_message.destroy()
-        self.just_restarted = True
-        self.paused = False
-        self.game = Game(self.jokers)
+        if self.victory_message is not None:
+            self.victory_message.destroy()
+            self.victory_message = None
+        # Turns of the old game that are still scheduled are dropped
+        self.scheduler.stop()
+        self.choosing = False
+        self.game = Game(self.jokers, bitset=True)
         self.game.set_up()
-        self.state.config(text="Your Turn")
+        if self.tracer is not None:
+            attach_game(self.tracer, self.game)
+        self.state.config(text="Computer's Turn" if self.demo else "Your Turn")
         self.render_opponent()
         self.render_player()
         self.render_discard()
+        self.start_game()
         try:
             self.heart_button.destroy()
             self.club_button.destroy()
@@ -334,7 +334,8 @@ class UI:
             pass
 
 # Function to run code depending on whether or not the user wishes to use jokers
-def ask_user_if_jokers(yes_jokers, no_jokers):
+# shown is called once the question is on screen
+def ask_user_if_jokers(yes_jokers, no_jokers, shown=None):
     root = Tk()
     root.title("Crazy Eights: Jokers or no Jokers")
     root.config(bg="#033500")
@@ -372,4 +373,6 @@ def ask_user_if_jokers(yes_jokers, no_jokers):
     )
     negative.pack()
 
+    if shown is not None:
+        root.after_idle(shown)
     root.mainloop()
@@ -0,0 +1,163 @@
+"""
+Lockstep simulation of thousands of computer-vs-computer games at once using NumPy
+
+Hands are kept as 64-bit card bitsets (the same layout as deck.BitDeck) and the piles as arrays of card
+codes, so every game advances by one turn per vectorised step. The computer plays like the built in one: the legal
+card that has been in its hand the longest (the first in the hand), otherwise pick up, and change to the suit
+it holds the most of. Hands remember when each card arrived, so the first legal card is found without any
+per-game loop.
+"""
+
+import numpy as np
+from cards import Rank, CARDS
+from deck import FULL_DECK
+from masks import CHOOSABLE_SUITS, SUIT_MASKS, PLAYABLE
+from simulate import MAX_TURNS, Results
+
+# Lookup tables indexed by card code
+SUIT_OF = np.array([card.suit.value for card in CARDS], dtype=np.int64)
+RANK_OF = np.array([card.rank.value for card in CARDS], dtype=np.int64)
+PLAYABLE_TABLE = np.array(PLAYABLE, dtype=np.uint64)
+CHOOSABLE_MASKS = [np.uint64(SUIT_MASKS[suit]) for suit in CHOOSABLE_SUITS]
+CHOOSABLE_VALUES = np.array([suit.value for suit in CHOOSABLE_SUITS], dtype=np.int64)
+ONE = np.uint64(1)
+
+# Card codes in the order they are found in a fresh deck
+def deck_codes(jokers: bool) -> np.ndarray:
+    cards = FULL_DECK if jokers else FULL_DECK[2:]
+    return np.array([card.code for card in cards], dtype=np.int64)
+
+# Shuffle a fresh deck for each of a number of games
+def shuffled_decks(games: int, jokers: bool, rng: np.random.Generator) -> np.ndarray:
+    return rng.permuted(np.tile(deck_codes(jokers), (games, 1)), axis=1)
+
+# A batch of games played in lockstep
+class VectorGames:
+    # Deal out games from shuffled decks, one row of card codes per game (stock order, top last)
+    def __init__(self, decks: np.ndarray):
+        games, size = decks.shape
+        self.games = games
+        self.index = np.arange(games)
+        self.hands = np.zeros((games, 2), dtype=np.uint64)
+        # When each card (by code) last went into a hand, counted per game, so hands keep the order of a Deck
+        self.arrival = np.zeros((games, len(CARDS)), dtype=np.int64)
+        self.clock = np.full(games, 10, dtype=np.int64)
+        # Deal each player 5 cards from the top of the stock, like Game.set_up
+        for player in range(2):
+            for i in range(5):
+                card = decks[:, size - 1 - player * 5 - i]
+                self.hands[:, player] |= ONE << card.astype(np.uint64)
+                self.arrival[self.index, card] = player * 5 + i
+        # Piles are stacks of card codes with the top at the given length - 1
+        self.stock = np.zeros((games, size), dtype=np.int64)
+        self.stock_len = np.full(games, size - 11, dtype=np.int64)
+        self.stock[:, :size - 11] = decks[:, :size - 11]
+        self.discard = np.zeros((games, size), dtype=np.int64)
+        self.discard[:, 0] = decks[:, size - 11]
+        self.discard_len = np.ones(games, dtype=np.int64)
+        # Suit chosen by an eight on top of the discard pile (0 when there isn't one)
+        self.suit = np.zeros(games, dtype=np.int64)
+        self.player = np.zeros(games, dtype=np.int64)
+        self.turns = np.zeros(games, dtype=np.int64)
+        self.recycles = np.zeros(games, dtype=np.int64)
+        self.active = np.ones(games, dtype=bool)
+
+    # Get the hands as a boolean matrix of (game, player, card code)
+    def hand_matrix(self) -> np.ndarray:
+        bits = self.hands[:, :, None] >> np.arange(len(CARDS), dtype=np.uint64)
+        return (bits & ONE).astype(bool)
+
+    # Move the discard pile (apart from the top card) underneath the stock pile of one game
+    def recycle(self, game: int):
+        top = self.discard_len[game] - 1
+        rest = self.discard[game, :top][::-1]
+        stock = np.concatenate([rest, self.stock[game, :self.stock_len[game]]])
+        self.stock[game, :len(stock)] = stock
+        self.stock_len[game] = len(stock)
+        self.discard[game, 0] = self.discard[game, top]
+        self.discard_len[game] = 1
+        self.recycles[game] += 1
+
+    # Make some players pick up the top card of their stock pile
+    def draw(self, games: np.ndarray, players: np.ndarray):
+        # Lazily recycle the discard pile once the stock runs out (this is rare, so not vectorised)
+        empty = self.stock_len[games] == 0
+        if empty.any():
+            for game in games[empty]:
+                if self.discard_len[game] > 1:
+                    self.recycle(game)
+            # Every card may be in a player's hand, in which case there is nothing to pick up
+            can_draw = self.stock_len[games] > 0
+            games, players = games[can_draw], players[can_draw]
+        self.stock_len[games] -= 1
+        card = self.stock[games, self.stock_len[games]]
+        self.hands[games, players] |= ONE << card.astype(np.uint64)
+        self.arrival[games, card] = self.clock[games]
+        self.clock[games] += 1
+
+    # Advance every unfinished game by one turn
+    def step(self):
+        games = self.index[self.active]
+        players = self.player[games]
+        # Find every legal play at once
+        top = self.discard[games, self.discard_len[games] - 1]
+        suit = np.where(self.suit[games] > 0, self.suit[games], SUIT_OF[top])
+        playable = self.hands[games, players] & PLAYABLE_TABLE[top, suit]
+        can_play = playable != 0
+        # Play the legal card that arrived in the hand first
+        played, by = games[can_play], players[can_play]
+        legal = (playable[can_play, None] >> np.arange(len(CARDS), dtype=np.uint64)) & ONE
+        card = np.argmin(np.where(legal != 0, self.arrival[played], np.iinfo(np.int64).max), axis=1)
+        self.hands[played, by] &= ~(ONE << card.astype(np.uint64))
+        self.discard[played, self.discard_len[played]] = card
+        self.discard_len[played] += 1
+        self.suit[played] = 0
+        rank = RANK_OF[card]
+        # Eights change the suit to the one the player has the most of
+        eights = rank == Rank.EIGHT.value
+        hands = self.hands[played[eights], by[eights]]
+        counts = np.stack([np.bitwise_count(hands & mask) for mask in CHOOSABLE_MASKS], axis=1)
+        self.suit[played[eights]] = CHOOSABLE_VALUES[np.argmax(counts, axis=1)]
+        # Twos make the next player pick up two cards
+        twos = rank == Rank.TWO.value
+        for _ in range(2):
+            self.draw(played[twos], 1 - by[twos])
+        # Aces and jokers skip the next player's go
+        skips = (rank == Rank.ACE.value) | (rank == Rank.JOKER.value)
+        self.player[played[skips]] ^= 1
+        # Everyone else picks up
+        self.draw(games[~can_play], players[~can_play])
+        self.player[games] ^= 1
+        self.turns[games] += 1
+        # Retire finished games
+        hands = self.hands[games]
+        done = (hands[:, 0] == 0) | (hands[:, 1] == 0) | (self.turns[games] >= MAX_TURNS)
+        self.active[games[done]] = False
+
+    # Play every game to completion
+    def run(self):
+        while self.active.any():
+            self.step()
+        return self
+
+    # Winner of each game (-1 for a draw)
+    def winners(self) -> np.ndarray:
+        return np.where(self.hands[:, 0] == 0, 0, np.where(self.hands[:, 1] == 0, 1, -1))
+
+    # Summarise the batch in the same form as the object based simulator
+    def results(self) -> Results:
+        results = Results()
+        winners = self.winners()
+        results.games = self.games
+        results.wins = [int((winners == 0).sum()), int((winners == 1).sum())]
+        results.draws = int((winners == -1).sum())
+        results.turns = int(self.turns.sum())
+        results.recycles = int(self.recycles.sum())
+        return results
+
+# Play a contiguous range of games in lockstep (run inside a worker process)
+# The whole chunk is shuffled from one generator seeded with its first seed
+def run_chunk(args) -> Results:
+    start, count, jokers = args[:3]
+    rng = np.random.default_rng(start)
+    return VectorGames(shuffled_decks(count, jokers, rng)).run().results()
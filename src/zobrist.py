@@ -0,0 +1,34 @@
+"""
+Random keys for Zobrist hashing of game positions (see Game.hash)
+
+The hash of a position is the XOR of the key of every card in the place it is (a player's hand, the stock or
+the discard pile), the card on top of the discard pile, the suit chosen by an eight, whose turn it is and the
+direction of play. So a move only XORs in the keys of what it changed. The order of the cards within the stock
+and discard pile isn't hashed (Game.to_bytes is an exact key).
+"""
+
+import random
+from cards import Suit, CARDS
+
+# Most players a game can have (one card each, with a card left for the discard pile and one to draw)
+MAX_PLAYERS = 50
+
+# Keys are the same every run, so hashes can be stored
+generator = random.Random(0xC8C8C8C8)
+
+# Make some random 64 bit keys
+def random_keys(count: int) -> list:
+    return [generator.getrandbits(64) for _ in range(count)]
+
+# Keys of each card in each player's hand, the stock, the discard pile and on top of the discard pile (by code)
+HAND_KEYS = [random_keys(len(CARDS)) for _ in range(MAX_PLAYERS)]
+STOCK_KEYS = random_keys(len(CARDS))
+DISCARD_KEYS = random_keys(len(CARDS))
+TOP_KEYS = random_keys(len(CARDS))
+
+# Keys of the suit chosen by an eight (nothing when no suit has been chosen)
+SUIT_KEYS = {None: 0} | {suit: key for suit, key in zip(Suit, random_keys(len(Suit)))}
+
+# Keys of whose turn it is, and of play going backwards
+PLAYER_KEYS = random_keys(MAX_PLAYERS)
+REVERSED_KEY = generator.getrandbits(64)